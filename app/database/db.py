@@ -1,17 +1,132 @@
-from sqlalchemy import create_engine
+import threading
+import time
+from typing import Optional
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker
-from contextlib import contextmanager  
+from sqlalchemy.pool import QueuePool
+from contextlib import contextmanager
+
+from loguru import logger
+
+from app.database.config import (
+    DATABASE_URL,
+    EMBEDDED_MODE,
+    SQLITE_POOL_SIZE,
+    REPLICA_DATABASE_URL,
+    REPLICA_MAX_LAG_SECONDS,
+    REPLICA_LAG_CHECK_INTERVAL_SECONDS,
+)
+
+# The engine is created on first use, so importing the app never touches the database driver
+_engine: Optional[Engine] = None
+_engine_lock = threading.Lock()
+
+_replica_engine: Optional[Engine] = None
+_replica_healthy = False
+_replica_checked_at = float("-inf")
+_replica_lock = threading.Lock()
+
+# Zero while the replica has replayed everything it received, so an idle primary does not look like lag.
+# NULL on a server that is not in recovery (e.g. a second primary standing in for a replica).
+REPLICA_LAG_QUERY = text("""
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+""")
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+
+
+def get_engine() -> Engine:
+    """
+    Returns the process-wide engine, creating it on first use.
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = _create_primary_engine()
+    return _engine
+
+
+def _create_primary_engine() -> Engine:
+    if not EMBEDDED_MODE:
+        return create_engine(DATABASE_URL, pool_pre_ping=True)
+
+    from app.database.embedded import configure_sqlite
+
+    # A small persistent pool keeps each connection's page cache warm; ingest and API share it across threads
+    engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False},
+                           poolclass=QueuePool, pool_size=SQLITE_POOL_SIZE, max_overflow=SQLITE_POOL_SIZE)
+    configure_sqlite(engine)
+    return engine
+
+
+def _check_replica(engine: Engine) -> bool:
+    try:
+        with engine.connect() as conn:
+            lag = conn.execute(REPLICA_LAG_QUERY).scalar()
+    except Exception as e:
+        logger.warning(f"Read replica unavailable, reading from the primary: {e}")
+        return False
 
-from app.database.config import DATABASE_URL
+    lag = float(lag or 0)
+    if lag > REPLICA_MAX_LAG_SECONDS:
+        logger.warning(f"Read replica is {lag:.1f}s behind, reading from the primary")
+        return False
+    return True
+
+
+def get_read_engine() -> Engine:
+    """
+    Returns the engine for history and aggregate reads.
+
+    This is the replica engine when `REPLICA_DATABASE_URL` is set and the replica's replay lag
+    was within `REPLICA_MAX_LAG_SECONDS` at the last check. Otherwise, including while the
+    replica is unreachable, it is the primary engine. The lag is checked at most once every
+    `REPLICA_LAG_CHECK_INTERVAL_SECONDS`.
+    """
+    global _replica_engine, _replica_healthy, _replica_checked_at
+    if not REPLICA_DATABASE_URL:
+        return get_engine()
+
+    if time.monotonic() - _replica_checked_at >= REPLICA_LAG_CHECK_INTERVAL_SECONDS and _replica_lock.acquire(blocking=False):
+        # One request re-checks while the others keep using the last result
+        try:
+            if _replica_engine is None:
+                _replica_engine = create_engine(REPLICA_DATABASE_URL, pool_pre_ping=True, connect_args={"connect_timeout": 2})
+            _replica_healthy = _check_replica(_replica_engine)
+            _replica_checked_at = time.monotonic()
+        finally:
+            _replica_lock.release()
+
+    return _replica_engine if _replica_healthy else get_engine()
+
+
+def dispose_engine() -> None:
+    """
+    Closes every pooled connection; the next `get_engine` call creates a fresh engine.
+    """
+    global _engine, _replica_engine, _replica_healthy, _replica_checked_at
+    with _engine_lock:
+        if _engine is not None:
+            _engine.dispose()
+            _engine = None
+    with _replica_lock:
+        if _replica_engine is not None:
+            _replica_engine.dispose()
+            _replica_engine = None
+        _replica_healthy = False
+        _replica_checked_at = float("-inf")
 
-# Create engine and session factory
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 # Use the contextmanager decorator to make get_db_session a valid context manager
 @contextmanager
 def get_db_session():
-    session = SessionLocal()
+    session = SessionLocal(bind=get_engine())
     try:
         yield session
         session.commit()
@@ -20,3 +135,21 @@ def get_db_session():
         raise
     finally:
         session.close()
+
+
+# FastAPI dependency yielding a request-scoped session
+def get_db():
+    db = SessionLocal(bind=get_engine())
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+# FastAPI dependency yielding a request-scoped session for history and aggregate reads (replica when healthy)
+def get_read_db():
+    db = SessionLocal(bind=get_read_engine())
+    try:
+        yield db
+    finally:
+        db.close()
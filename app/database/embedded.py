@@ -0,0 +1,61 @@
+from datetime import datetime
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+
+from app.database.config import SQLITE_CACHE_SIZE_KB, SQLITE_MMAP_SIZE_BYTES, SQLITE_BUSY_TIMEOUT_MS
+
+
+def configure_sqlite(engine: Engine) -> None:
+    """
+    Tunes every connection of an embedded SQLite engine.
+
+    WAL lets API reads run while the ingest writer appends. With `synchronous=NORMAL` a
+    commit is a WAL append without an fsync; a power loss can only drop the last commits,
+    never corrupt the file.
+    """
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE_BYTES}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+
+
+def compact_expired_samples(conn, cutoff: datetime) -> int:
+    """
+    Rolls raw samples older than `cutoff` up into `sensor_data_hourly` and deletes them.
+
+    This is the embedded counterpart of compacting and dropping daily partitions. `cutoff`
+    is day aligned, so no hourly bucket is split between two runs.
+
+    Args:
+        conn: An open SQLAlchemy connection inside a transaction.
+        cutoff (datetime): Samples strictly before this instant are compacted.
+
+    Returns:
+        int: Number of raw samples removed.
+    """
+    params = {"cutoff": cutoff.strftime("%Y-%m-%d %H:%M:%S")}
+    # The WHERE clause on the outer SELECT is required by SQLite's upsert grammar
+    conn.execute(text("""
+        INSERT INTO sensor_data_hourly (sensor_id, bucket, samples, min_data, max_data, avg_data, last_data, skipped_data)
+        SELECT sensor_id, bucket, count(*), min(value), max(value), avg(value), max(CASE WHEN latest = 1 THEN value END), sum(skipped_data)
+        FROM (
+            SELECT sensor_id,
+                   strftime('%Y-%m-%d %H:00:00', timestamp) AS bucket,
+                   CAST(data AS REAL) AS value,
+                   skipped_data,
+                   row_number() OVER (PARTITION BY sensor_id, strftime('%Y-%m-%d %H', timestamp) ORDER BY timestamp DESC) AS latest
+            FROM sensor_data_1
+            WHERE timestamp < :cutoff AND sensor_id IS NOT NULL
+        )
+        WHERE true
+        GROUP BY sensor_id, bucket
+        ON CONFLICT (sensor_id, bucket) DO NOTHING
+    """), params)
+    return conn.execute(text("DELETE FROM sensor_data_1 WHERE timestamp < :cutoff"), params).rowcount
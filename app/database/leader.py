@@ -0,0 +1,119 @@
+import threading
+from typing import Callable, Optional
+
+from loguru import logger
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from app.database.db import get_engine
+from app.database.config import LEADER_LOCK_KEY, LEADER_CHECK_INTERVAL_SECONDS
+
+
+class LeaderElector(threading.Thread):
+    """
+    Elects one leader among all processes sharing the database with a Postgres advisory lock.
+
+    Every process runs an elector. Each one tries `pg_try_advisory_lock` on a dedicated
+    connection until it wins, then calls `on_elected`. The lock belongs to the database
+    session, so it is released as soon as the leader's process dies or its connection
+    drops, and a follower takes over within `interval` seconds. The leader pings its
+    connection every `interval` seconds.
+
+    A failed ping only means the lock state is unknown, e.g. while Postgres is down. The
+    leader then keeps its jobs running, so ingest goes on through the spill buffer, and
+    reconnects to take the lock again. It calls `on_demoted` only once a peer is found holding
+    the lock. If only the leader lost the database while its peers did not, both ingest until
+    it reconnects; the `sensor_data_dedup` ledger drops the readings written twice.
+    """
+
+    def __init__(self, on_elected: Callable[[], None], on_demoted: Callable[[], None],
+                 lock_key: int = LEADER_LOCK_KEY, interval: float = LEADER_CHECK_INTERVAL_SECONDS):
+        super().__init__(name="leader-elector", daemon=True)
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.lock_key = lock_key
+        self.interval = interval
+        self.is_leader = False
+        # True while the leader lost its connection and has not taken the lock again yet
+        self.lock_unknown = False
+        self._conn: Optional[Connection] = None
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                self._check()
+            except Exception as e:
+                logger.warning(f"Leader election connection failed: {e}")
+                self._discard_connection()
+                if self.is_leader and not self.lock_unknown:
+                    self.lock_unknown = True
+                    logger.warning("Leader lock state unknown, keeping ingest and scheduled jobs running until reconnected")
+            self._stop_event.wait(self.interval)
+
+        if self.is_leader:
+            self._demote()
+        self._release()
+
+    def _check(self) -> None:
+        if self._conn is None:
+            # Autocommit, so the session never sits idle in a transaction while holding the lock
+            self._conn = get_engine().connect().execution_options(isolation_level="AUTOCOMMIT")
+
+        if self.is_leader and not self.lock_unknown:
+            self._conn.execute(text("SELECT 1"))
+            return
+
+        acquired = self._conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": self.lock_key}).scalar()
+        if self.lock_unknown:
+            self.lock_unknown = False
+            if acquired:
+                logger.success("Reconnected and took the leader lock again, keeping ingest and scheduled jobs")
+            else:
+                # A peer took over while this process was disconnected
+                self._demote()
+            return
+
+        if acquired:
+            self.is_leader = True
+            logger.success("Elected leader, starting ingest and scheduled jobs")
+            try:
+                self.on_elected()
+            except Exception as e:
+                logger.exception(f"Starting leader jobs failed: {e}")
+
+    def _demote(self) -> None:
+        self.is_leader = False
+        self.lock_unknown = False
+        logger.warning("No longer the leader, stopping ingest and scheduled jobs")
+        try:
+            self.on_demoted()
+        except Exception as e:
+            logger.exception(f"Stopping leader jobs failed: {e}")
+
+    def _discard_connection(self) -> None:
+        if self._conn is not None:
+            try:
+                # Closes the underlying session instead of pooling it, which drops any lock it held
+                self._conn.invalidate()
+            except Exception:
+                pass
+            self._conn = None
+
+    def _release(self) -> None:
+        if self._conn is None:
+            return
+        try:
+            self._conn.execute(text("SELECT pg_advisory_unlock_all()"))
+            self._conn.close()
+        except Exception:
+            self._discard_connection()
+        self._conn = None
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """
+        Stops the leader jobs if this process runs them, releases the lock and returns once done.
+        """
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
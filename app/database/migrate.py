@@ -0,0 +1,161 @@
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
+
+from loguru import logger
+from sqlalchemy import Column, inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateIndex, Table
+
+from app.database.config import EMBEDDED_MODE
+from app.database.db import get_engine
+from app.database.models import Base
+from app.database.notify import USERS_NOTIFY_TRIGGER_SQL
+from app.database.retention import ensure_partitions, migrate_to_partitioned
+from app.database.sharding import SHARDED_TABLES, get_shard_engine, shard_names, sharding_enabled
+
+
+def missing_schema(conn, tables: Optional[Iterable[Table]] = None) -> Tuple[List[str], List[Column]]:
+    """
+    Compares the database against the models.
+
+    Args:
+        conn: An open SQLAlchemy connection.
+        tables (Optional[Iterable[Table]]): Tables to compare, every model table by default.
+
+    Returns:
+        Tuple[List[str], List[Column]]: Names of missing tables, and model columns missing from
+        existing tables.
+    """
+    inspector = inspect(conn)
+    existing = set(inspector.get_table_names())
+
+    missing, columns = [], []
+    for table in Base.metadata.sorted_tables if tables is None else tables:
+        if table.name not in existing:
+            missing.append(table.name)
+            continue
+        present = {column["name"] for column in inspector.get_columns(table.name)}
+        columns.extend(column for column in table.columns if column.name not in present)
+    return missing, columns
+
+
+def check_schema() -> bool:
+    """
+    Logs any difference between the database and the models without changing anything.
+
+    Returns:
+        bool: True if the schema is up to date.
+    """
+    databases = [("the primary", get_engine(), None)]
+    databases.extend((f"shard `{name}`", engine, SHARDED_TABLES) for name, engine in _shard_engines())
+
+    up_to_date = True
+    for database, engine, checked in databases:
+        with engine.connect() as conn:
+            tables, columns = missing_schema(conn, checked)
+        for name in tables:
+            logger.warning(f"Table `{name}` is missing on {database}, run `python -m app.database.migrate`")
+        for column in columns:
+            logger.warning(f"Column `{column.table.name}.{column.name}` is missing on {database}, run `python -m app.database.migrate`")
+        up_to_date = up_to_date and not tables and not columns
+    return up_to_date
+
+
+def create_missing_indexes(conn, tables: Optional[Iterable[Table]] = None) -> None:
+    """
+    Creates model indexes that do not exist yet, e.g. `uq_users_sensor_id` on older databases.
+
+    Args:
+        conn: An open SQLAlchemy connection.
+        tables (Optional[Iterable[Table]]): Tables to index, every model table by default.
+
+    Raises:
+        sqlalchemy.exc.IntegrityError: If a unique index cannot be built because of duplicate values.
+    """
+    for table in Base.metadata.sorted_tables if tables is None else tables:
+        for index in table.indexes:
+            ddl = str(CreateIndex(index).compile(dialect=conn.dialect))
+            conn.exec_driver_sql(ddl.replace("INDEX ", "INDEX IF NOT EXISTS ", 1))
+
+
+def add_column(conn, column: Column) -> None:
+    """
+    Adds a model column to its existing table.
+
+    Raises:
+        ValueError: If the column is NOT NULL; existing rows would need a backfill first.
+    """
+    if not column.nullable:
+        raise ValueError(f"Cannot add NOT NULL column `{column.table.name}.{column.name}` automatically")
+
+    column_type = column.type.compile(dialect=conn.dialect)
+    conn.execute(text(f"ALTER TABLE {column.table.name} ADD COLUMN {column.name} {column_type}"))
+    logger.success(f"Added column `{column.table.name}.{column.name}` ({column_type})")
+
+
+def migrate() -> None:
+    """
+    Brings the database up to date with the models.
+
+    Creates missing tables, converts a legacy unpartitioned `sensor_data_1`, adds columns
+    and indexes introduced since the tables were created, pre-creates today's partitions and (re)installs
+    the `users_changed` notification trigger. With sharding on, the sensor tables are brought
+    up to date on every shard as well (existing readings are moved by `app.database.rebalance`).
+    Every step is idempotent, so the command can run on each deploy. The partitioning and trigger
+    steps are skipped in embedded mode.
+    """
+    engine = get_engine()
+    with engine.begin() as conn:
+        Base.metadata.create_all(bind=conn)
+
+    if not EMBEDDED_MODE:
+        migrate_to_partitioned()
+
+    with engine.begin() as conn:
+        _, columns = missing_schema(conn)
+        for column in columns:
+            add_column(conn, column)
+        create_missing_indexes(conn)
+        if not EMBEDDED_MODE:
+            ensure_partitions(conn, datetime.utcnow().date())
+            for statement in USERS_NOTIFY_TRIGGER_SQL:
+                conn.execute(text(statement))
+
+    for name, shard_engine in _shard_engines():
+        migrate_shard(shard_engine)
+        logger.success(f"Sensor tables on shard `{name}` are up to date")
+
+    logger.success("Database schema is up to date")
+
+
+def migrate_shard(engine: Engine) -> None:
+    """
+    Creates and updates the sensor tables (`SHARDED_TABLES`) on a shard; users and metadata stay on the primary.
+    """
+    with engine.begin() as conn:
+        Base.metadata.create_all(bind=conn, tables=SHARDED_TABLES)
+
+    migrate_to_partitioned(engine)
+
+    with engine.begin() as conn:
+        _, columns = missing_schema(conn, SHARDED_TABLES)
+        for column in columns:
+            add_column(conn, column)
+        create_missing_indexes(conn, SHARDED_TABLES)
+        ensure_partitions(conn, datetime.utcnow().date())
+
+
+def _shard_engines() -> List[Tuple[str, Engine]]:
+    # Shards other than the primary itself, which `migrate` handles in full
+    if not sharding_enabled():
+        return []
+    primary = get_engine()
+    return [(name, engine) for name, engine in ((name, get_shard_engine(name)) for name in shard_names()) if engine is not primary]
+
+
+if __name__ == "__main__":
+    import sys
+
+    if "--check" in sys.argv:
+        sys.exit(0 if check_schema() else 1)
+    migrate()
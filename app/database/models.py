@@ -1,21 +1,71 @@
-from sqlalchemy import Boolean, Column, Integer, String, DateTime, Time, Float
+from sqlalchemy import Boolean, Column, Date, Integer, String, DateTime, Time, Float, Index
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
 
-from app.database.db import engine
+from app.database.config import EMBEDDED_MODE
 
 Base = declarative_base()
 
 class SensorData(Base):
     __tablename__ = 'sensor_data_1'
+    # Range-partitioned by day on `timestamp`; partitions are managed by app.database.retention
+    __table_args__ = (
+        Index('ix_sensor_data_1_sensor_id_timestamp', 'sensor_id', 'timestamp'),
+        {'postgresql_partition_by': 'RANGE (timestamp)'},
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
-    timestamp = Column(DateTime, default=datetime.utcnow)  
+    # Postgres requires the partition key to be part of the primary key. SQLite is not
+    # partitioned and only auto-increments a single INTEGER PRIMARY KEY, which also makes the
+    # table an append-ordered rowid table.
+    timestamp = Column(DateTime, primary_key=not EMBEDDED_MODE, default=datetime.utcnow)  
     sensor_id = Column(String(50), nullable=True)
     data = Column(String(255), nullable=True)
+    # Per-device message sequence number, used to drop QoS 1 redeliveries
+    seq = Column(String(64), nullable=True)
+    # Sum of the readings the ingest dead-band skipped since the device's previous stored row;
+    # totals add it to `data`, so they do not depend on which readings were stored
+    skipped_data = Column(Float, nullable=True)
+
+class SensorDataDedup(Base):
+    __tablename__ = 'sensor_data_dedup'
+
+    # Ledger of accepted (sensor_id, seq) pairs; the primary key lets bulk inserts use
+    # ON CONFLICT DO NOTHING. `sensor_data_1` itself cannot carry this constraint because
+    # unique constraints on a partitioned table must include the partition key.
+    sensor_id = Column(String(50), primary_key=True)
+    seq = Column(String(64), primary_key=True)
+    received_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+class SensorDataHourly(Base):
+    __tablename__ = 'sensor_data_hourly'
+
+    # Hourly rollup of raw samples compacted out of expired `sensor_data_1` partitions
+    sensor_id = Column(String(50), primary_key=True)
+    bucket = Column(DateTime, primary_key=True)
+    samples = Column(Integer, nullable=False)
+    min_data = Column(Float, nullable=True)
+    max_data = Column(Float, nullable=True)
+    avg_data = Column(Float, nullable=True)
+    last_data = Column(Float, nullable=True)
+    skipped_data = Column(Float, nullable=True)      # Sum of the compacted rows' `skipped_data`
+
+class DeviceCalibration(Base):
+    __tablename__ = 'device_calibration'
+
+    # Tare learned at ingest (app.paho_mqtt.calibration), persisted periodically so restarts keep it
+    sensor_id = Column(String(50), primary_key=True)
+    bottle_weight = Column(Integer, nullable=True)    # `users.bottle_weight` the learned values started from
+    zero_offset = Column(Float, nullable=False)       # Load-cell reading with nothing on the dock
+    empty_weight = Column(Float, nullable=True)       # Empty bottle, net of the zero offset
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
 
 class Users(Base):
     __tablename__ = 'users'
+    # One user per dock; bulk provisioning upserts on it
+    __table_args__ = (
+        Index('uq_users_sensor_id', 'sensor_id', unique=True),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     name = Column(String(50), nullable=False)
@@ -34,5 +84,32 @@ class Users(Base):
     currect_water_level_in_bottle = Column(Integer, nullable=True)
     is_bottle_on_dock = Column(Boolean, nullable=True)
 
-# Create the tables if it does not exists
-Base.metadata.create_all(bind=engine)
+    timezone = Column(String(64), nullable=True)   # IANA name, e.g. 'Asia/Kolkata'; UTC if not set
+
+class UserAnalytics(Base):
+    __tablename__ = 'user_analytics'
+
+    # One row per user, rebuilt by the nightly analytics job (app.server.Analytics) from completed local days
+    user_id = Column(Integer, primary_key=True)
+    computed_at = Column(DateTime, nullable=False)
+    last_day = Column(Date, nullable=False)                # Last completed local day included
+    days_tracked = Column(Integer, nullable=False)         # Days with any intake in the lookback window
+    current_streak = Column(Integer, nullable=False)       # Consecutive days up to `last_day` with the goal met
+    longest_streak = Column(Integer, nullable=False)       # Longest such run in the lookback window
+    goal_met_days_7d = Column(Integer, nullable=False)
+    goal_met_days_30d = Column(Integer, nullable=False)
+    attainment_7d = Column(Float, nullable=True)           # Mean share of the daily goal reached, capped at 1 per day
+    attainment_30d = Column(Float, nullable=True)
+    avg_intake_7d = Column(Float, nullable=False)
+    avg_intake_prev_7d = Column(Float, nullable=False)     # The 7 days before those, for week-over-week change
+    trend_30d = Column(Float, nullable=False)              # Least-squares slope of the daily total, per day
+
+class UserWeeklyIntake(Base):
+    __tablename__ = 'user_weekly_intake'
+
+    # Weekly report rows (local weeks starting Monday), rebuilt by the nightly analytics job
+    user_id = Column(Integer, primary_key=True)
+    week_start = Column(Date, primary_key=True)
+    total_intake = Column(Float, nullable=False)
+    days_tracked = Column(Integer, nullable=False)
+    goal_met_days = Column(Integer, nullable=False)
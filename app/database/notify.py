@@ -0,0 +1,124 @@
+import json
+import select
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from loguru import logger
+
+from app.database.db import get_engine
+from app.database.config import USERS_CHANNEL, LISTEN_POLL_SECONDS, LISTEN_RECONNECT_SECONDS
+
+# Sent by the trigger installed by `app.database.migrate` whenever a user is created, deleted, or changes
+# a column that in-process caches depend on. Notifications are delivered on commit. The payload is the
+# new row (the deleted one for DELETE), so a column set to NULL arrives as null.
+USERS_NOTIFY_TRIGGER_SQL = [
+    f"""
+    CREATE OR REPLACE FUNCTION notify_users_changed() RETURNS trigger AS $$
+    DECLARE
+        changed users%ROWTYPE;
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            changed := OLD;
+        ELSE
+            changed := NEW;
+        END IF;
+        PERFORM pg_notify('{USERS_CHANNEL}', json_build_object(
+            'op', TG_OP,
+            'id', changed.id,
+            'sensor_id', changed.sensor_id,
+            'old_sensor_id', CASE WHEN TG_OP = 'INSERT' THEN NULL ELSE OLD.sensor_id END,
+            'timezone', changed.timezone,
+            'bottle_weight', changed.bottle_weight,
+            'age', changed.age,
+            'weight', changed.weight,
+            'height', changed.height,
+            'gender', changed.gender,
+            'wakeup_time', changed.wakeup_time,
+            'sleep_time', changed.sleep_time
+        )::text);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS users_changed ON users",
+    """
+    CREATE TRIGGER users_changed
+    AFTER INSERT OR DELETE OR UPDATE OF sensor_id, bottle_weight, daily_goal, wakeup_time, sleep_time, timezone,
+        age, weight, height, gender ON users
+    FOR EACH ROW EXECUTE FUNCTION notify_users_changed()
+    """,
+]
+
+
+class NotificationListener(threading.Thread):
+    """
+    Delivers Postgres notifications to in-process subscribers.
+
+    One dedicated connection LISTENs on every subscribed channel; each notification's JSON
+    payload is passed to the channel's callbacks. Notifications sent while the connection
+    was down are lost, so after a reconnect every callback is called with None, meaning
+    "anything may have changed".
+    """
+
+    def __init__(self, poll_seconds: float = LISTEN_POLL_SECONDS, reconnect_seconds: float = LISTEN_RECONNECT_SECONDS):
+        super().__init__(name="notification-listener", daemon=True)
+        self.poll_seconds = poll_seconds
+        self.reconnect_seconds = reconnect_seconds
+        self.received = 0
+        self._subscribers: Dict[str, List[Callable[[Optional[Dict[str, Any]]], None]]] = {}
+        self._stop_event = threading.Event()
+
+    def subscribe(self, channel: str, callback: Callable[[Optional[Dict[str, Any]]], None]) -> None:
+        """
+        Registers a callback for a channel; must be called before the listener is started.
+        """
+        self._subscribers.setdefault(channel, []).append(callback)
+
+    def run(self):
+        connected_before = False
+        while not self._stop_event.is_set():
+            connection = None
+            try:
+                connection = get_engine().raw_connection()
+                dbapi_connection = connection.connection
+                dbapi_connection.autocommit = True
+                with dbapi_connection.cursor() as cursor:
+                    for channel in self._subscribers:
+                        cursor.execute(f"LISTEN {channel}")
+
+                if connected_before:
+                    logger.info("Notification listener reconnected, resetting caches")
+                    for channel in self._subscribers:
+                        self._dispatch(channel, None)
+                connected_before = True
+
+                while not self._stop_event.is_set():
+                    if select.select([dbapi_connection], [], [], self.poll_seconds) == ([], [], []):
+                        continue
+                    dbapi_connection.poll()
+                    while dbapi_connection.notifies:
+                        notification = dbapi_connection.notifies.pop(0)
+                        self.received += 1
+                        self._dispatch(notification.channel, json.loads(notification.payload))
+            except Exception as e:
+                logger.warning(f"Notification listener connection failed: {e}")
+                self._stop_event.wait(self.reconnect_seconds)
+            finally:
+                if connection is not None:
+                    # Never hand a LISTENing autocommit connection back to the pool
+                    try:
+                        connection.invalidate()
+                    except Exception:
+                        pass
+
+    def _dispatch(self, channel: str, payload: Optional[Dict[str, Any]]) -> None:
+        for callback in self._subscribers.get(channel, []):
+            try:
+                callback(payload)
+            except Exception as e:
+                logger.exception(f"Notification handler for `{channel}` failed: {e}")
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
@@ -0,0 +1,291 @@
+"""
+Query-count and latency budgets for the API routes and ingest handlers.
+
+Run against a scratch database (it is migrated and seeded with `budget-*` devices):
+
+    DATABASE_URL=sqlite:///budget.db python -m app.database.query_budget
+
+Every route in `ROUTE_BUDGETS` is called once with cold caches and every ingest handler in
+`INGEST_BUDGETS` is fed a burst of messages, while `QueryRecorder` counts and times the
+statements sent to the database. Every SELECT seen is then EXPLAINed, and a sequential scan of
+a table in `SCAN_CHECKED_TABLES` is reported. The command exits with status 1 if any budget or
+scan check fails, so it can gate CI. Run it with sharding off: only the primary's statements
+are recorded.
+"""
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple, Tuple
+
+from loguru import logger
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+
+# Route -> (max statements, max milliseconds) for one request with cold caches.
+# Paths are formatted with `user_id`; a "PUT " prefix selects the method.
+ROUTE_BUDGETS: Dict[str, Tuple[int, float]] = {
+    "/api/v1/user/{user_id}": (1, 50),
+    "/api/v1/user/{user_id}/daily-goal": (1, 50),
+    "/api/v1/user/{user_id}/wakeup-time": (1, 50),
+    "/api/v1/user/{user_id}/sleep-time": (1, 50),
+    "/api/v1/user/{user_id}/timezone": (1, 50),
+    "/api/v1/user/{user_id}/bottle-weight": (1, 50),
+    "/api/v1/user/{user_id}/is-bottle-on-dock": (1, 50),
+    "/api/v1/user/{user_id}/recommended-goal": (1, 100),
+    "/api/v1/user/{user_id}/intake-forecast": (2, 100),
+    "/api/v1/user/{user_id}/current-water-level": (2, 50),
+    "/api/v1/user/{user_id}/today-water-intake": (2, 250),
+    "/api/v1/user/{user_id}/today-water-intake?points=200": (2, 250),
+    "/api/v1/user/{user_id}/week-water-intake": (2, 500),
+    "/api/v1/user/{user_id}/total-water-intake": (2, 250),
+    "PUT /api/v1/user/{user_id}/set-daily-goal?new_daily_goal=2500": (2, 100),
+}
+
+# Ingest message type -> (max statements per message, max milliseconds per message), averaged over a burst
+INGEST_BUDGETS: Dict[str, Tuple[float, float]] = {
+    "weight": (0.05, 1),
+    "is_picked_up": (2, 50),
+}
+
+# Tables that must only be read through an index
+SCAN_CHECKED_TABLES = ("sensor_data_1", "sensor_data_dedup", "sensor_data_hourly")
+
+SEED_DEVICES = 20
+SEED_READINGS_PER_DEVICE = 2000
+INGEST_BURST = 500
+WEIGHT_RAMP_GM = 6                  # Step between burst samples, above the dead-band and well inside the spike threshold
+
+
+class RecordedStatement(NamedTuple):
+    statement: str
+    parameters: Any
+    seconds: float
+
+
+class QueryRecorder:
+    """
+    Records every statement an engine sends, with its parameters and duration.
+
+    Use as a context manager around the code being measured. Statements from every thread
+    using the engine are recorded, so measure one request or burst at a time.
+    """
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self.statements: List[RecordedStatement] = []
+        self._started = threading.local()
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "QueryRecorder":
+        event.listen(self.engine, "before_cursor_execute", self._before)
+        event.listen(self.engine, "after_cursor_execute", self._after)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        event.remove(self.engine, "before_cursor_execute", self._before)
+        event.remove(self.engine, "after_cursor_execute", self._after)
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    @property
+    def seconds(self) -> float:
+        return sum(recorded.seconds for recorded in self.statements)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        self._started.value = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        recorded = RecordedStatement(statement, parameters, time.perf_counter() - self._started.value)
+        with self._lock:
+            self.statements.append(recorded)
+
+
+def sequential_scans(conn, statement: str, parameters: Any) -> List[str]:
+    """
+    EXPLAINs a recorded SELECT and returns the checked tables it reads with a sequential scan.
+    """
+    if conn.dialect.name == "postgresql":
+        plan = conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters).scalar()
+        nodes, scanned = [plan[0]["Plan"]], []
+        while nodes:
+            node = nodes.pop()
+            nodes.extend(node.get("Plans", []))
+            if node["Node Type"] == "Seq Scan" and node["Relation Name"].startswith(SCAN_CHECKED_TABLES):
+                scanned.append(node["Relation Name"])
+        return scanned
+
+    # SQLite: "SCAN <table>" without "USING ... INDEX" reads the whole table
+    rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+    scanned = []
+    for row in rows:
+        detail = row[-1].split()
+        if len(detail) >= 2 and detail[0] == "SCAN" and detail[1] in SCAN_CHECKED_TABLES and "USING" not in detail:
+            scanned.append(detail[1])
+    return scanned
+
+
+def seed(now: datetime) -> int:
+    """
+    Provisions `SEED_DEVICES` users and replaces their readings with a fresh set spread over
+    today (UTC), so history routes have realistic work to do. Returns the first seeded user's ID.
+    """
+    from app.database.db import get_db_session
+    from app.database.models import SensorData, Users
+    from app.paho_mqtt.repositories.water_level_repository import WaterLevelRepository
+    from app.server.User.repositories.provisioning_repository import PROVISIONED_COLUMNS, ProvisioningRepository
+
+    sensor_ids = [f"budget-{index}" for index in range(SEED_DEVICES)]
+    day_start = datetime.combine(now.date(), datetime.min.time())
+    step = (now - day_start) / SEED_READINGS_PER_DEVICE
+
+    with get_db_session() as session:
+        users = [
+            dict({column: None for column in PROVISIONED_COLUMNS},
+                 sensor_id=sensor_id, name=sensor_id, daily_goal=2000, bottle_weight=300, timezone="UTC")
+            for sensor_id in sensor_ids
+        ]
+        ProvisioningRepository(session).upsert_users(users)
+        session.query(SensorData).filter(SensorData.sensor_id.in_(sensor_ids)).delete(synchronize_session=False)
+        WaterLevelRepository(session).add_sensor_data_bulk([
+            {"sensor_id": sensor_id, "data": float(index % 700), "timestamp": day_start + step * index}
+            for sensor_id in sensor_ids
+            for index in range(SEED_READINGS_PER_DEVICE)
+        ])
+        if session.get_bind().dialect.name == "postgresql":
+            session.execute(text("ANALYZE users"))
+            session.execute(text("ANALYZE sensor_data_1"))
+        return session.query(Users.id).filter_by(sensor_id=sensor_ids[0]).scalar()
+
+
+def reset_caches() -> None:
+    """
+    Empties the in-process caches, so every measurement is the cold-cache worst case.
+    """
+    from app.paho_mqtt.mqtt import anomaly_detector
+    from app.paho_mqtt.calibration import calibrator
+    from app.server.Recommendation.service.goal_recommender import goal_recommender
+    from app.server.User.service.day_window import day_windows
+
+    day_windows.clear()
+    calibrator.reset()
+    anomaly_detector.reset()
+    goal_recommender.clear()
+
+
+def check_routes(engine: Engine, user_id: int) -> Tuple[List[str], List[RecordedStatement]]:
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from app.routes.routes import router
+
+    # The router alone, so no background workers are started
+    app = FastAPI()
+    app.include_router(router)
+    client = TestClient(app)
+
+    failures, statements = [], []
+    for route, (max_queries, max_ms) in ROUTE_BUDGETS.items():
+        method, _, path = route.rpartition(" ")
+        reset_caches()
+        started = time.perf_counter()
+        with QueryRecorder(engine) as recorder:
+            response = client.request(method or "GET", path.format(user_id=user_id))
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        statements.extend(recorder.statements)
+
+        logger.info(f"{route}: {response.status_code}, {recorder.count} statements, {elapsed_ms:.1f} ms")
+        if response.status_code >= 500:
+            failures.append(f"{route} failed with status {response.status_code}")
+        if recorder.count > max_queries:
+            failures.append(f"{route} ran {recorder.count} statements, budget {max_queries}")
+        if elapsed_ms > max_ms:
+            failures.append(f"{route} took {elapsed_ms:.1f} ms, budget {max_ms} ms")
+    return failures, statements
+
+
+def check_ingest(engine: Engine) -> Tuple[List[str], List[RecordedStatement]]:
+    from app.database.db import get_db_session
+    from app.database.models import SensorData
+    from app.paho_mqtt.mqtt import deadband_filter, handle_is_picked_up, handle_weight, sensor_data_writer
+
+    def stored_readings() -> int:
+        with get_db_session() as session:
+            return session.query(SensorData).filter(SensorData.sensor_id == "budget-1").count()
+
+    reset_caches()
+    deadband_filter.forget("budget-1")
+    bursts = {
+        # A bottle filling steadily: every sample clears the dead-band and none looks like a spike
+        "weight": lambda index: handle_weight("budget-1", str(300 + WEIGHT_RAMP_GM * index), None, datetime.utcnow()),
+        "is_picked_up": lambda index: handle_is_picked_up("budget-1", str(index % 2)),
+    }
+
+    failures, statements = [], []
+    for kind, (max_queries, max_ms) in INGEST_BUDGETS.items():
+        count = INGEST_BURST if kind == "weight" else INGEST_BURST // 10
+        stored_before = stored_readings() if kind == "weight" else 0
+        started = time.perf_counter()
+        with QueryRecorder(engine) as recorder:
+            for index in range(count):
+                bursts[kind](index)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if kind == "weight":
+                # The batched writes are part of the cost; stop() flushes everything queued
+                sensor_data_writer.start()
+                sensor_data_writer.stop()
+        statements.extend(recorder.statements)
+
+        if kind == "weight":
+            written = stored_readings() - stored_before
+            if written != count:
+                failures.append(f"weight wrote {written} of {count} readings, the burst did not measure the write path")
+
+        per_message = recorder.count / count
+        logger.info(f"{kind}: {count} messages, {per_message:.3f} statements and {elapsed_ms / count:.3f} ms per message")
+        if per_message > max_queries:
+            failures.append(f"{kind} ran {per_message:.3f} statements per message, budget {max_queries}")
+        if elapsed_ms / count > max_ms:
+            failures.append(f"{kind} took {elapsed_ms / count:.3f} ms per message, budget {max_ms} ms")
+    return failures, statements
+
+
+def check_plans(engine: Engine, statements: List[RecordedStatement]) -> List[str]:
+    failures = []
+    explained = set()
+    with engine.connect() as conn:
+        for recorded in statements:
+            if not recorded.statement.lstrip().upper().startswith("SELECT") or recorded.statement in explained:
+                continue
+            explained.add(recorded.statement)
+            for table in sequential_scans(conn, recorded.statement, recorded.parameters):
+                failures.append(f"Sequential scan of `{table}` in: {' '.join(recorded.statement.split())}")
+    logger.info(f"Explained {len(explained)} distinct queries")
+    return failures
+
+
+def main() -> int:
+    from app.database.db import get_engine
+    from app.database.migrate import migrate
+
+    migrate()
+    engine = get_engine()
+    user_id = seed(datetime.utcnow())
+
+    route_failures, route_statements = check_routes(engine, user_id)
+    ingest_failures, ingest_statements = check_ingest(engine)
+    failures = route_failures + ingest_failures + check_plans(engine, route_statements + ingest_statements)
+
+    for failure in failures:
+        logger.error(failure)
+    if failures:
+        logger.error(f"{len(failures)} budget checks failed")
+        return 1
+    logger.success("All query budgets met")
+    return 0
+
+
+if __name__ == "__main__":
+    import sys
+
+    sys.exit(main())
@@ -0,0 +1,209 @@
+"""
+Moves sensor readings to the shard that owns them under the current `SHARD_DATABASE_URLS`.
+
+Adding a shard (or sharding a database for the first time) goes:
+
+1. Add the new shard to `SHARD_DATABASE_URLS`.
+2. Run `python -m app.database.migrate` to create the sensor tables on it.
+3. Restart every process, so readings are written to and read from the new owners.
+4. Run `python -m app.database.rebalance` (add `--dry-run` to only list what would move).
+
+Only about 1/N of the devices change owner when a shard is added, and only those are copied.
+Until step 4 finishes, the history of a moved device is incomplete on the API. Each device is
+copied to its new shard in one transaction, readings already there are skipped, and the copy
+is checked before it is deleted from the old shard, so the command can be stopped and run
+again. Removing a shard is not supported.
+"""
+from collections import Counter
+from typing import Dict, Iterator, List, Tuple
+
+from loguru import logger
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.engine import Connection, Engine, Row
+
+from app.database.config import REBALANCE_COPY_BATCH_SIZE
+from app.database.db import get_engine
+from app.database.models import SensorData, SensorDataDedup, SensorDataHourly
+from app.database.retention import ensure_partitions
+from app.database.sharding import PRIMARY_SHARD, get_shard_engine, shard_for, shard_names, sharding_enabled
+
+SENSOR_DATA = SensorData.__table__
+# Keyed tables copied as is (with the column bounding a move's snapshot); the raw readings get new IDs on their new shard
+KEYED_TABLES = (
+    (SensorDataHourly.__table__, SensorDataHourly.bucket),
+    (SensorDataDedup.__table__, SensorDataDedup.received_at),
+)
+
+
+def source_engines() -> Dict[str, Engine]:
+    """
+    Returns every database that may hold misplaced readings: the shards, and the primary
+    unless it is one of them (it holds every reading from before sharding was turned on).
+    """
+    engines = {name: get_shard_engine(name) for name in shard_names()}
+    primary = get_engine()
+    if all(engine is not primary for engine in engines.values()):
+        engines[PRIMARY_SHARD] = primary
+    return engines
+
+
+def misplaced_sensors(engine: Engine, name: str) -> List[Tuple[str, str]]:
+    """
+    Lists the devices with readings on the `name` database that belong to another shard.
+
+    Returns:
+        List[Tuple[str, str]]: (sensor ID, owning shard) pairs.
+    """
+    with engine.connect() as conn:
+        sensor_ids = set(conn.execute(select(SENSOR_DATA.c.sensor_id).distinct()).scalars())
+        sensor_ids.update(conn.execute(select(SensorDataHourly.sensor_id).distinct()).scalars())
+    sensor_ids.discard(None)
+    return sorted((sensor_id, shard_for(sensor_id)) for sensor_id in sensor_ids if shard_for(sensor_id) != name)
+
+
+def _snapshot_batches(reader: Connection, snapshot, batch_size: int) -> Iterator[List[Row]]:
+    """
+    Streams a device's snapshot in timestamp order, in batches of about `batch_size` that never
+    split the readings of one timestamp, so each batch can be compared with the target on its own.
+    """
+    columns = [SENSOR_DATA.c.timestamp, SENSOR_DATA.c.sensor_id, SENSOR_DATA.c.data, SENSOR_DATA.c.seq, SENSOR_DATA.c.skipped_data]
+    result = reader.execution_options(stream_results=True)\
+        .execute(select(*columns).where(snapshot).order_by(SENSOR_DATA.c.timestamp))
+    pending: List[Row] = []
+    for rows in result.partitions(batch_size):
+        pending.extend(rows)
+        last = pending[-1].timestamp
+        cut = len(pending)
+        while cut and pending[cut - 1].timestamp == last:
+            cut -= 1
+        if cut:
+            yield pending[:cut]
+            pending = pending[cut:]
+    if pending:
+        yield pending
+
+
+def _keys_on(conn: Connection, sensor_id: str, rows: List[Row]) -> Counter:
+    """
+    Counts the readings of a device per (timestamp, seq) over the time span of `rows`.
+    """
+    return Counter(dict(
+        ((timestamp, seq), count) for timestamp, seq, count in conn.execute(
+            select(SENSOR_DATA.c.timestamp, SENSOR_DATA.c.seq, func.count())
+            .where(SENSOR_DATA.c.sensor_id == sensor_id)
+            .where(SENSOR_DATA.c.timestamp.between(rows[0].timestamp, rows[-1].timestamp))
+            .group_by(SENSOR_DATA.c.timestamp, SENSOR_DATA.c.seq)
+        )
+    ))
+
+
+def move_sensor(sensor_id: str, source: Engine, target: Engine, batch_size: int = REBALANCE_COPY_BATCH_SIZE) -> int:
+    """
+    Copies a device's readings, hourly rollups and dedup ledger from `source` to `target`, then
+    deletes them from `source`.
+
+    The readings copied are the ones on `source` when the move starts (up to its highest ID), so
+    readings written to `source` meanwhile are left for the next run. A reading already on
+    `target` with the same (sensor_id, timestamp, seq) is skipped rather than copied twice, and
+    nothing on `target` is deleted, so live readings the new owner received are kept and an
+    interrupted move can be run again. Readings are matched per (timestamp, seq) key and counted,
+    since older readings have no seq and several may share a timestamp: only as many copies of a
+    key as `target` is short of are inserted. The copy is committed, and every key of the snapshot
+    must then be on `target` at least as many times as on `source` before `source` is touched.
+
+    Returns:
+        int: The number of raw readings copied.
+
+    Raises:
+        RuntimeError: If `target` is short of a key of the snapshot after the commit; `source` is left as is.
+    """
+    with source.connect() as conn:
+        last_id, oldest = conn.execute(
+            select(func.max(SENSOR_DATA.c.id), func.min(SENSOR_DATA.c.timestamp))
+            .where(SENSOR_DATA.c.sensor_id == sensor_id)
+        ).one()
+        keyed_bounds = {
+            table.name: conn.execute(select(func.max(column)).where(table.c.sensor_id == sensor_id)).scalar()
+            for table, column in KEYED_TABLES
+        }
+
+    snapshot = (SENSOR_DATA.c.sensor_id == sensor_id) & (SENSOR_DATA.c.id <= last_id)
+
+    copied = 0
+    with target.begin() as conn, source.connect() as reader:
+        if last_id is not None:
+            ensure_partitions(conn, oldest.date())
+            for rows in _snapshot_batches(reader, snapshot, batch_size):
+                present = _keys_on(conn, sensor_id, rows)
+                missing = []
+                for row in rows:
+                    key = (row.timestamp, row.seq)
+                    if present[key] > 0:
+                        present[key] -= 1
+                    else:
+                        missing.append(dict(row._mapping))
+                if missing:
+                    conn.execute(SENSOR_DATA.insert(), missing)
+                    copied += len(missing)
+
+        for table, column in KEYED_TABLES:
+            bound = keyed_bounds[table.name]
+            if bound is None:
+                continue
+            rows = [dict(row._mapping) for row in reader.execute(
+                select(table).where(table.c.sensor_id == sensor_id).where(column <= bound)
+            )]
+            conn.execute(pg_insert(table).on_conflict_do_nothing(), rows)
+
+    if last_id is not None:
+        with target.connect() as conn, source.connect() as reader:
+            for rows in _snapshot_batches(reader, snapshot, batch_size):
+                on_target = _keys_on(conn, sensor_id, rows)
+                for key, count in Counter((row.timestamp, row.seq) for row in rows).items():
+                    if on_target[key] < count:
+                        raise RuntimeError(
+                            f"Only {on_target[key]} of {count} readings of `{sensor_id}` at {key[0]} (seq {key[1]}) "
+                            f"are on the target, keeping them on the source"
+                        )
+
+    with source.begin() as conn:
+        conn.execute(SENSOR_DATA.delete().where(snapshot))
+        for table, column in KEYED_TABLES:
+            if keyed_bounds[table.name] is not None:
+                conn.execute(table.delete().where(table.c.sensor_id == sensor_id).where(column <= keyed_bounds[table.name]))
+    return copied
+
+
+def rebalance(dry_run: bool = False) -> int:
+    """
+    Moves every misplaced device to its owning shard.
+
+    Args:
+        dry_run (bool): Only log which devices would move.
+
+    Returns:
+        int: The number of devices moved (or that would move).
+    """
+    if not sharding_enabled():
+        logger.warning("Sharding is off, nothing to rebalance")
+        return 0
+
+    devices = 0
+    for name, source in source_engines().items():
+        for sensor_id, owner in misplaced_sensors(source, name):
+            devices += 1
+            if dry_run:
+                logger.info(f"Would move `{sensor_id}` from `{name}` to `{owner}`")
+                continue
+            moved = move_sensor(sensor_id, source, get_shard_engine(owner))
+            logger.success(f"Copied {moved} readings of `{sensor_id}` from `{name}` to `{owner}`")
+
+    logger.success(f"{devices} devices {'to move' if dry_run else 'moved'}")
+    return devices
+
+
+if __name__ == "__main__":
+    import sys
+
+    rebalance(dry_run="--dry-run" in sys.argv)
@@ -0,0 +1,241 @@
+import threading
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy.engine import Engine
+
+from loguru import logger
+from sqlalchemy import text
+
+from app.database.db import get_engine
+from app.database.config import EMBEDDED_MODE, RETENTION_RAW_DAYS, PARTITION_PRECREATE_DAYS, RETENTION_INTERVAL_SECONDS, DEDUP_LEDGER_RETENTION_HOURS
+from app.database.models import SensorData, SensorDataDedup, SensorDataHourly
+from app.database.sharding import get_shard_engine, shard_names, sharding_enabled
+
+PARENT_TABLE = SensorData.__tablename__
+ROLLUP_TABLE = SensorDataHourly.__tablename__
+PARTITION_PREFIX = f"{PARENT_TABLE}_p"
+
+
+def partition_name(day: date) -> str:
+    """
+    Returns the name of the daily partition holding samples for `day`, e.g. `sensor_data_1_p20241004`.
+    """
+    return f"{PARTITION_PREFIX}{day:%Y%m%d}"
+
+
+def list_partitions(conn) -> List[Tuple[str, date]]:
+    """
+    Lists the daily partitions currently attached to `sensor_data_1`.
+
+    Args:
+        conn: An open SQLAlchemy connection.
+
+    Returns:
+        List[Tuple[str, date]]: (partition name, day) pairs ordered by day.
+    """
+    rows = conn.execute(text("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class parent ON pg_inherits.inhparent = parent.oid
+        JOIN pg_class child ON pg_inherits.inhrelid = child.oid
+        WHERE parent.relname = :parent
+    """), {"parent": PARENT_TABLE}).scalars().all()
+
+    partitions = []
+    for name in rows:
+        if not name.startswith(PARTITION_PREFIX):
+            continue
+        try:
+            partitions.append((name, datetime.strptime(name[len(PARTITION_PREFIX):], "%Y%m%d").date()))
+        except ValueError:
+            logger.warning(f"Ignoring partition with unexpected name `{name}`")
+    return sorted(partitions, key=lambda item: item[1])
+
+
+def ensure_partitions(conn, start: date, days_ahead: int = PARTITION_PRECREATE_DAYS) -> None:
+    """
+    Creates the daily partitions from `start` up to `days_ahead` days in the future.
+
+    Args:
+        conn: An open SQLAlchemy connection.
+        start (date): First day that must have a partition.
+        days_ahead (int): Number of days after today to create partitions for.
+    """
+    last = datetime.utcnow().date() + timedelta(days=days_ahead)
+    day = start
+    while day <= last:
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {partition_name(day)} PARTITION OF {PARENT_TABLE} "
+            f"FOR VALUES FROM ('{day.isoformat()}') TO ('{(day + timedelta(days=1)).isoformat()}')"
+        ))
+        day += timedelta(days=1)
+
+
+def compact_partition(conn, name: str) -> int:
+    """
+    Rolls the raw samples of a partition up into `sensor_data_hourly`.
+
+    Partitions are day aligned, so hourly buckets never span two partitions and re-running
+    the compaction of a partition (e.g. after a crash before the drop) is a no-op.
+
+    Args:
+        conn: An open SQLAlchemy connection.
+        name (str): Name of the partition to compact.
+
+    Returns:
+        int: Number of hourly buckets written.
+    """
+    result = conn.execute(text(f"""
+        INSERT INTO {ROLLUP_TABLE} (sensor_id, bucket, samples, min_data, max_data, avg_data, last_data, skipped_data)
+        SELECT sensor_id,
+               date_trunc('hour', timestamp) AS bucket,
+               count(*),
+               min(data::float),
+               max(data::float),
+               avg(data::float),
+               (array_agg(data::float ORDER BY timestamp DESC))[1],
+               sum(skipped_data)
+        FROM {name}
+        WHERE sensor_id IS NOT NULL
+        GROUP BY sensor_id, date_trunc('hour', timestamp)
+        ON CONFLICT (sensor_id, bucket) DO NOTHING
+    """))
+    return result.rowcount
+
+
+def drop_partition(conn, name: str) -> None:
+    """
+    Detaches and drops a partition. This is a metadata operation, unlike a bulk DELETE.
+    """
+    conn.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+    conn.execute(text(f"DROP TABLE {name}"))
+
+
+def run_retention_cycle(raw_days: int = RETENTION_RAW_DAYS, days_ahead: int = PARTITION_PRECREATE_DAYS) -> None:
+    """
+    Runs one retention pass: pre-creates upcoming partitions, then compacts and drops every
+    partition that is entirely older than `raw_days` days.
+
+    Each expired partition is handled in its own transaction, so a failure leaves the
+    remaining partitions untouched for the next pass. With sharding on, every shard is passed
+    over in turn and a failing shard does not hold up the others. In embedded mode there are no
+    partitions; expired samples are compacted and deleted in one transaction instead.
+    """
+    today = datetime.utcnow().date()
+    cutoff = today - timedelta(days=raw_days)
+
+    if EMBEDDED_MODE:
+        from app.database.embedded import compact_expired_samples
+
+        with get_engine().begin() as conn:
+            removed = compact_expired_samples(conn, datetime.combine(cutoff, datetime.min.time()))
+            prune_dedup_ledger(conn)
+        if removed:
+            logger.success(f"Compacted {removed} raw samples older than {cutoff} into hourly buckets")
+        return
+
+    if not sharding_enabled():
+        _run_partition_cycle(get_engine(), today, cutoff, days_ahead)
+        return
+
+    for shard in shard_names():
+        try:
+            _run_partition_cycle(get_shard_engine(shard), today, cutoff, days_ahead)
+        except Exception as e:
+            logger.exception(f"Retention cycle failed on shard `{shard}`: {e}")
+
+
+def _run_partition_cycle(engine: Engine, today: date, cutoff: date, days_ahead: int) -> None:
+    with engine.begin() as conn:
+        ensure_partitions(conn, today, days_ahead)
+        expired = [name for name, day in list_partitions(conn) if day < cutoff]
+
+    for name in expired:
+        with engine.begin() as conn:
+            buckets = compact_partition(conn, name)
+            drop_partition(conn, name)
+        logger.success(f"Compacted partition `{name}` into {buckets} hourly buckets and dropped it")
+
+    with engine.begin() as conn:
+        prune_dedup_ledger(conn)
+
+
+def prune_dedup_ledger(conn, hours: int = DEDUP_LEDGER_RETENTION_HOURS) -> int:
+    """
+    Forgets accepted message sequence numbers older than `hours`; redeliveries never arrive that late.
+
+    Returns:
+        int: Number of ledger rows removed.
+    """
+    cutoff = datetime.utcnow() - timedelta(hours=hours)
+    result = conn.execute(SensorDataDedup.__table__.delete().where(SensorDataDedup.received_at < cutoff))
+    return result.rowcount
+
+
+def migrate_to_partitioned(engine: Optional[Engine] = None) -> None:
+    """
+    One-off migration of a pre-existing, unpartitioned `sensor_data_1` table.
+
+    The old table is renamed, the partitioned table is created with partitions covering the
+    existing data, rows are copied over and the old table is dropped, all in one transaction.
+
+    Args:
+        engine (Optional[Engine]): The database to migrate, the primary by default.
+    """
+    with (engine or get_engine()).begin() as conn:
+        is_partitioned = conn.execute(text(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON pt.partrelid = c.oid "
+            "WHERE c.relname = :parent)"
+        ), {"parent": PARENT_TABLE}).scalar()
+        if is_partitioned:
+            logger.info(f"`{PARENT_TABLE}` is already partitioned")
+            return
+
+        legacy = f"{PARENT_TABLE}_legacy"
+        conn.execute(text(f"ALTER TABLE {PARENT_TABLE} RENAME TO {legacy}"))
+        conn.execute(text(f"ALTER INDEX IF EXISTS {PARENT_TABLE}_pkey RENAME TO {legacy}_pkey"))
+        conn.execute(text(f"ALTER SEQUENCE IF EXISTS {PARENT_TABLE}_id_seq RENAME TO {legacy}_id_seq"))
+        SensorData.__table__.create(bind=conn)
+
+        oldest: Optional[datetime] = conn.execute(text(f"SELECT min(timestamp) FROM {legacy}")).scalar()
+        ensure_partitions(conn, (oldest or datetime.utcnow()).date())
+
+        conn.execute(text(
+            f"INSERT INTO {PARENT_TABLE} (id, timestamp, sensor_id, data) "
+            f"SELECT id, COALESCE(timestamp, now() AT TIME ZONE 'utc'), sensor_id, data FROM {legacy}"
+        ))
+        conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{PARENT_TABLE}', 'id'), COALESCE((SELECT max(id) FROM {PARENT_TABLE}), 1))"
+        ))
+        conn.execute(text(f"DROP TABLE {legacy}"))
+
+    logger.success(f"Migrated `{PARENT_TABLE}` to a range-partitioned table")
+
+
+class RetentionWorker(threading.Thread):
+    """
+    Background thread that runs `run_retention_cycle` immediately and then every
+    `RETENTION_INTERVAL_SECONDS`, so partitions always exist before samples arrive.
+    """
+
+    def __init__(self, interval: float = RETENTION_INTERVAL_SECONDS):
+        super().__init__(name="retention", daemon=True)
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                run_retention_cycle()
+            except Exception as e:
+                logger.exception(f"Retention cycle failed: {e}")
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+if __name__ == "__main__":
+    # Schema changes are applied with `python -m app.database.migrate`
+    run_retention_cycle()
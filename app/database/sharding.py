@@ -0,0 +1,266 @@
+import bisect
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, TypeVar
+
+from loguru import logger
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+
+from app.database.config import DATABASE_URL, EMBEDDED_MODE, SHARD_DATABASE_URLS, SHARD_VIRTUAL_NODES, SHARD_SCATTER_WORKERS
+from app.database.db import SessionLocal, get_engine
+from app.database.models import SensorData, SensorDataDedup, SensorDataHourly
+
+# Tables keyed by sensor_id that live on the shards; everything else stays on the primary
+SHARDED_TABLES = (SensorData.__table__, SensorDataDedup.__table__, SensorDataHourly.__table__)
+
+# Name of the single "shard" while sharding is off: the primary itself
+PRIMARY_SHARD = "primary"
+
+T = TypeVar("T")
+
+
+def parse_shard_urls(value: str) -> Dict[str, str]:
+    """
+    Parses `SHARD_DATABASE_URLS` ("name=url,name=url") into an ordered name -> URL mapping.
+
+    Raises:
+        ValueError: If an entry has no name or a name is repeated.
+    """
+    shards: Dict[str, str] = {}
+    for entry in filter(None, (part.strip() for part in value.split(","))):
+        name, separator, url = entry.partition("=")
+        name = name.strip()
+        if not separator or not name or not url.strip():
+            raise ValueError(f"Shard entries must look like name=url, got `{entry}`")
+        if name in shards:
+            raise ValueError(f"Shard `{name}` is configured twice")
+        shards[name] = url.strip()
+    return shards
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Consistent-hash ring mapping sensor IDs to shard names.
+
+    Each shard is placed at `vnodes` pseudo-random points; a key belongs to the first point at
+    or after its own hash. Adding a shard therefore only moves the keys that land on the new
+    shard's points (about 1/N of them), and never moves keys between the existing shards.
+    """
+
+    def __init__(self, names: Iterable[str], vnodes: int = SHARD_VIRTUAL_NODES):
+        self.names = list(names)
+        if not self.names:
+            raise ValueError("A hash ring needs at least one shard")
+        points = sorted((_hash(f"{name}#{index}"), name) for name in self.names for index in range(vnodes))
+        self._hashes = [point for point, _ in points]
+        self._owners = [name for _, name in points]
+
+    def shard_for(self, key: str) -> str:
+        index = bisect.bisect_left(self._hashes, _hash(key))
+        return self._owners[index % len(self._owners)]
+
+
+_shard_urls: Dict[str, str] = {}
+_ring: Optional[HashRing] = None
+_engines: Dict[str, Engine] = {}
+_executor: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+
+
+def _configure() -> None:
+    global _shard_urls, _ring
+    urls = parse_shard_urls(SHARD_DATABASE_URLS)
+    if urls and EMBEDDED_MODE:
+        logger.warning("SHARD_DATABASE_URLS is ignored in embedded mode")
+        urls = {}
+    _shard_urls = urls
+    _ring = HashRing(urls or [PRIMARY_SHARD])
+
+
+def get_ring() -> HashRing:
+    """
+    Returns the process-wide hash ring, built from `SHARD_DATABASE_URLS` on first use.
+    """
+    if _ring is None:
+        with _lock:
+            if _ring is None:
+                _configure()
+    return _ring
+
+
+def sharding_enabled() -> bool:
+    """
+    True if the sensor tables are spread over `SHARD_DATABASE_URLS` rather than kept on the primary.
+    """
+    get_ring()
+    return bool(_shard_urls)
+
+
+def shard_names() -> List[str]:
+    return list(get_ring().names)
+
+
+def shard_for(sensor_id: str) -> str:
+    """
+    Returns the name of the shard holding a device's readings.
+    """
+    return get_ring().shard_for(sensor_id)
+
+
+def get_shard_engine(name: str) -> Engine:
+    """
+    Returns a shard's engine, creating it on first use. A shard configured with the primary's
+    URL (and the primary itself while sharding is off) shares the primary engine.
+    """
+    get_ring()
+    url = _shard_urls.get(name)
+    if url is None:
+        if name != PRIMARY_SHARD:
+            raise ValueError(f"Unknown shard `{name}`")
+        return get_engine()
+    if url == DATABASE_URL:
+        return get_engine()
+
+    engine = _engines.get(name)
+    if engine is None:
+        with _lock:
+            engine = _engines.get(name)
+            if engine is None:
+                engine = _engines[name] = create_engine(url, pool_pre_ping=True, connect_args={"connect_timeout": 5})
+    return engine
+
+
+@contextmanager
+def shard_session(name: str):
+    """
+    Session on one shard for writes; commits on success and rolls back on error, like `get_db_session`.
+    """
+    session = SessionLocal(bind=get_shard_engine(name))
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+@contextmanager
+def sensor_session(sensor_id: Optional[str], session):
+    """
+    Session for reading one device's readings: `session` itself while sharding is off (so replica
+    routing keeps working), otherwise a short-lived session on the device's shard.
+    """
+    if not sharding_enabled() or sensor_id is None:
+        yield session
+        return
+    shard = SessionLocal(bind=get_shard_engine(shard_for(sensor_id)))
+    try:
+        yield shard
+    finally:
+        shard.close()
+
+
+def group_by_shard(rows: Iterable[T], sensor_id: Callable[[T], str]) -> Dict[str, List[T]]:
+    """
+    Splits rows by the shard owning each row's sensor ID.
+    """
+    groups: Dict[str, List[T]] = {}
+    for row in rows:
+        groups.setdefault(shard_for(sensor_id(row)), []).append(row)
+    return groups
+
+
+def run_on_shards(work: Dict[str, Callable[[], T]]) -> Dict[str, Any]:
+    """
+    Runs one callable per shard in parallel and returns each shard's result, or the exception it raised.
+    """
+    global _executor
+    if len(work) == 1:
+        (name, call), = work.items()
+        try:
+            return {name: call()}
+        except Exception as e:
+            return {name: e}
+
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=SHARD_SCATTER_WORKERS, thread_name_prefix="shard-scatter")
+    futures = {name: _executor.submit(call) for name, call in work.items()}
+    results = {}
+    for name, future in futures.items():
+        try:
+            results[name] = future.result()
+        except Exception as e:
+            results[name] = e
+    return results
+
+
+def scatter(query: Callable[[Any, str], T], session, shards: Optional[Iterable[str]] = None) -> Dict[str, T]:
+    """
+    Runs a fleet-wide read on every shard (or the given ones) in parallel and gathers the results.
+
+    Args:
+        query (Callable[[Session, str], T]): Runs the read on one shard's session; gets the shard's name too.
+        session: Used as the only shard while sharding is off (it may be bound to a read replica).
+        shards (Optional[Iterable[str]]): Shards to query, every shard by default.
+
+    Returns:
+        Dict[str, T]: Each shard's result.
+
+    Raises:
+        Exception: The first error raised by a shard; a partial fleet-wide answer is never returned.
+    """
+    if not sharding_enabled():
+        return {PRIMARY_SHARD: query(session, PRIMARY_SHARD)}
+
+    def read(name: str) -> Callable[[], T]:
+        def call() -> T:
+            shard = SessionLocal(bind=get_shard_engine(name))
+            try:
+                return query(shard, name)
+            finally:
+                shard.close()
+        return call
+
+    results = run_on_shards({name: read(name) for name in (shard_names() if shards is None else shards)})
+    for name, result in results.items():
+        if isinstance(result, Exception):
+            raise result
+    return results
+
+
+class ShardWriteError(Exception):
+    """
+    Raised when a batch routed over several shards was only partly written.
+
+    Attributes:
+        rows: The rows of the shards that failed; every other row was committed.
+        written: The number of rows committed.
+    """
+
+    def __init__(self, rows: List[Dict[str, Any]], written: int, errors: Dict[str, Exception]):
+        super().__init__(f"{len(rows)} readings could not be written to shard(s) "
+                         + ", ".join(f"{name} ({error})" for name, error in errors.items()))
+        self.rows = rows
+        self.written = written
+        self.errors = errors
+
+
+def dispose_shards() -> None:
+    """
+    Closes every shard's pooled connections; engines are created again on next use.
+    """
+    with _lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
@@ -1,10 +1,102 @@
+import time
 
+_IMPORT_STARTED = time.perf_counter()
+
+from contextlib import asynccontextmanager
+from typing import Optional
 from fastapi import FastAPI
+from loguru import logger
 from app.routes.routes import router
-from app.paho_mqtt.mqtt import run_subscriber
-import threading
+from app.database.config import EMBEDDED_MODE, USERS_CHANNEL
+from app.database.db import dispose_engine
+from app.database.sharding import dispose_shards
+from app.database.leader import LeaderElector
+from app.database.migrate import check_schema
+from app.database.notify import NotificationListener
+from app.database.retention import RetentionWorker
+from app.paho_mqtt.mqtt import start_subscriber, stop_subscriber
+from app.paho_mqtt.publisher import stop_command_publisher
+from app.profiling import PROFILING_TOKEN, profile_requests
+from app.server.Analytics.service.analytics_job import AnalyticsWorker
+from app.server.Reminder.service.reminder_scheduler import start_reminder_scheduler, stop_reminder_scheduler
+from app.server.User.service.cache_invalidation import on_users_changed
 from utils import setup_loguru_for_fastapi  # Import logger setup
 
+# Seconds each background worker gets to drain on shutdown
+SHUTDOWN_TIMEOUT_SECONDS = 10
+
+# API worker processes started by `python -m app.main`; ingest and scheduled jobs only run in the elected leader.
+# Embedded mode always runs one process.
+API_WORKERS = 1
+
+_IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
+
+
+_retention_worker: Optional[RetentionWorker] = None
+_analytics_worker: Optional[AnalyticsWorker] = None
+
+
+# Runs in the elected leader only, so N API workers never ingest or schedule twice
+def start_background_workers():
+    global _retention_worker, _analytics_worker
+    _retention_worker = start_retention()
+    start_mqtt()
+    start_reminder_scheduler()
+    _analytics_worker = AnalyticsWorker()
+    _analytics_worker.start()
+
+
+def stop_background_workers():
+    global _retention_worker, _analytics_worker
+    # Stop producers before the things they write to
+    stop_subscriber(SHUTDOWN_TIMEOUT_SECONDS)
+    stop_reminder_scheduler(SHUTDOWN_TIMEOUT_SECONDS)
+    if _retention_worker is not None:
+        _retention_worker.stop()
+        _retention_worker = None
+    if _analytics_worker is not None:
+        _analytics_worker.stop()
+        _analytics_worker = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Runs whether the server is started via `python -m` or `uvicorn app.main:app`, once per worker process
+    started = time.perf_counter()
+    try:
+        check_schema()
+    except Exception as e:
+        # Ingest spills to disk while the database is unreachable, so this is not fatal
+        logger.error(f"Could not check the database schema: {e}")
+
+    if EMBEDDED_MODE:
+        # A single process owns the SQLite file, so there is nobody to elect or notify
+        elector = listener = None
+        start_background_workers()
+    else:
+        # Every process keeps its caches coherent with profile changes made by the others
+        listener = NotificationListener()
+        listener.subscribe(USERS_CHANNEL, on_users_changed)
+        listener.start()
+        elector = LeaderElector(on_elected=start_background_workers, on_demoted=stop_background_workers)
+        elector.start()
+    logger.info(f"Cold start: imports {_IMPORT_SECONDS * 1000:.0f} ms, startup {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    yield
+
+    if elector is None:
+        stop_background_workers()
+    else:
+        # Demotes this process if it leads, which stops the background workers, then frees the lock for a follower
+        elector.stop(SHUTDOWN_TIMEOUT_SECONDS * 3)
+    if listener is not None:
+        listener.stop(SHUTDOWN_TIMEOUT_SECONDS)
+    stop_command_publisher()
+    dispose_engine()
+    dispose_shards()
+    logger.info("Background workers stopped")
+
+
 # Initialize FastAPI app
 setup_loguru_for_fastapi()  # Apply logging configuration
 app = FastAPI(
@@ -12,23 +104,32 @@ app = FastAPI(
     description="API for managing water intake for users with IoT devices",
     version="1.0.0",
     docs_url="/docs",  # Swagger UI URL
-    redoc_url="/redoc"  # ReDoc URL
+    redoc_url="/redoc",  # ReDoc URL
+    lifespan=lifespan
 )
 
 # Include routes from routes.py
 app.include_router(router, prefix="")
 
+# On-demand request profiling; without a token no middleware runs at all
+if PROFILING_TOKEN:
+    app.middleware("http")(profile_requests)
+
 @app.get("/")
 def home():
     return {"message": "Hello, HTTP and MQTT!"}
 
 # Start the MQTT subscriber in a separate thread
 def start_mqtt():
-    mqtt_thread = threading.Thread(target=run_subscriber)
-    mqtt_thread.daemon = True  # Ensures the thread will exit when the main process ends
-    mqtt_thread.start()
+    return start_subscriber()
+
+# Start the retention task (partition pre-creation, compaction, partition drops) in a separate thread
+def start_retention():
+    retention_worker = RetentionWorker()
+    retention_worker.start()
+    return retention_worker
 
 if __name__ == "__main__":
-    start_mqtt()  
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000, log_config=None)  # Disable Uvicorn's default log config
+    # An import string lets uvicorn spawn API_WORKERS processes
+    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, workers=1 if EMBEDDED_MODE else API_WORKERS, log_config=None)  # Disable Uvicorn's default log config
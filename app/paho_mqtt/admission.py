@@ -0,0 +1,198 @@
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from app.paho_mqtt.config import (
+    ADMISSION_RATE_PER_SECOND,
+    ADMISSION_BURST,
+    ADMISSION_OVERFLOW_POLICY,
+    ADMISSION_RELEASE_INTERVAL_SECONDS,
+    ADMISSION_QUARANTINE_REJECTIONS,
+    ADMISSION_QUARANTINE_WINDOW_SECONDS,
+    ADMISSION_QUARANTINE_SECONDS,
+)
+
+ADMISSION_POLICIES = ("drop", "latest")
+
+
+class DeviceBudget:
+    """
+    Token bucket and offence counters of one device.
+    """
+    __slots__ = ("tokens", "refilled_at", "admitted", "rejected", "window_start", "window_rejected", "quarantined_until")
+
+    def __init__(self, burst: float, now: float):
+        self.tokens = burst
+        self.refilled_at = now
+        self.admitted = 0
+        self.rejected = 0
+        self.window_start = now
+        self.window_rejected = 0
+        self.quarantined_until = 0.0
+
+
+class AdmissionController:
+    """
+    Per-device token-bucket admission in front of the ingest lanes.
+
+    Each device earns `rate` tokens per second up to `burst`, and every message costs one.
+    Over-budget messages are dropped, or with the "latest" policy the newest one per device
+    and message type is held and released once the device has a token again. Weight
+    samples are absolute readings, so the latest one carries everything the dropped ones
+    did. A device with `quarantine_rejections` over-budget messages within
+    `quarantine_window` seconds is quarantined for `quarantine_seconds`. While quarantined,
+    every message from it is dropped before it reaches a lane, so one bad bottle cannot slow
+    the fleet down.
+    """
+
+    def __init__(self, rate: float = ADMISSION_RATE_PER_SECOND, burst: float = ADMISSION_BURST,
+                 policy: str = ADMISSION_OVERFLOW_POLICY, release_interval: float = ADMISSION_RELEASE_INTERVAL_SECONDS,
+                 quarantine_rejections: int = ADMISSION_QUARANTINE_REJECTIONS,
+                 quarantine_window: float = ADMISSION_QUARANTINE_WINDOW_SECONDS,
+                 quarantine_seconds: float = ADMISSION_QUARANTINE_SECONDS):
+        if policy not in ADMISSION_POLICIES:
+            raise ValueError(f"Unknown admission policy: {policy}")
+
+        self.rate = rate
+        self.burst = burst
+        self.policy = policy
+        self.release_interval = release_interval
+        self.quarantine_rejections = quarantine_rejections
+        self.quarantine_window = quarantine_window
+        self.quarantine_seconds = quarantine_seconds
+        self.held = 0
+        self.released = 0
+        self.quarantine_drops = 0
+
+        self._budgets: Dict[str, DeviceBudget] = {}
+        # (device_ID, kind) -> newest over-budget message, for the "latest" policy
+        self._pending: Dict[Tuple[str, str], Any] = {}
+        self._next_release = 0.0
+        self._lock = threading.Lock()
+
+    def admit(self, device_ID: str, kind: str, message: Any, now: Optional[float] = None) -> bool:
+        """
+        Charges one token to the device.
+
+        Args:
+            device_ID (str): The sending device.
+            kind (str): Message type, e.g. the lane it is routed to.
+            message (Any): The message, held for later release if over budget with the "latest" policy.
+            now (Optional[float]): Monotonic time, defaults to `time.monotonic()`.
+
+        Returns:
+            bool: True if the message may be processed now.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            budget = self._budgets.get(device_ID)
+            if budget is None:
+                budget = self._budgets[device_ID] = DeviceBudget(self.burst, now)
+
+            if budget.quarantined_until:
+                if now < budget.quarantined_until:
+                    self.quarantine_drops += 1
+                    return False
+                budget.quarantined_until = 0.0
+                budget.tokens = self.burst
+                budget.refilled_at = now
+                logger.info(f"Device `{device_ID}` released from quarantine")
+
+            budget.tokens = min(self.burst, budget.tokens + (now - budget.refilled_at) * self.rate)
+            budget.refilled_at = now
+            if budget.tokens >= 1:
+                budget.tokens -= 1
+                budget.admitted += 1
+                # Anything held for this device and type is older than the admitted message
+                self._pending.pop((device_ID, kind), None)
+                return True
+
+            budget.rejected += 1
+            if now - budget.window_start > self.quarantine_window:
+                budget.window_start = now
+                budget.window_rejected = 0
+            budget.window_rejected += 1
+
+            if budget.window_rejected >= self.quarantine_rejections:
+                budget.quarantined_until = now + self.quarantine_seconds
+                budget.window_rejected = 0
+                for key in [key for key in self._pending if key[0] == device_ID]:
+                    del self._pending[key]
+                logger.warning(f"Quarantined device `{device_ID}` for {self.quarantine_seconds:.0f}s "
+                               f"({budget.rejected} over-budget messages in total)")
+            elif self.policy == "latest":
+                self._pending[(device_ID, kind)] = message
+                self.held += 1
+            return False
+
+    def release_due(self, now: Optional[float] = None) -> List[Tuple[str, Any]]:
+        """
+        Returns the held messages whose device has earned a token again, charging that token.
+
+        Cheap to call on every message: the held messages are only scanned once every
+        `release_interval` seconds.
+
+        Returns:
+            List[Tuple[str, Any]]: (kind, message) pairs to process now.
+        """
+        now = time.monotonic() if now is None else now
+        if now < self._next_release or not self._pending:
+            return []
+
+        released = []
+        with self._lock:
+            self._next_release = now + self.release_interval
+            for (device_ID, kind), message in list(self._pending.items()):
+                budget = self._budgets[device_ID]
+                budget.tokens = min(self.burst, budget.tokens + (now - budget.refilled_at) * self.rate)
+                budget.refilled_at = now
+                if budget.tokens >= 1:
+                    budget.tokens -= 1
+                    del self._pending[(device_ID, kind)]
+                    released.append((kind, message))
+            self.released += len(released)
+        return released
+
+    def lift_quarantine(self, device_ID: str) -> bool:
+        """
+        Ends a device's quarantine early.
+
+        Returns:
+            bool: False if the device was not quarantined.
+        """
+        with self._lock:
+            budget = self._budgets.get(device_ID)
+            if budget is None or not budget.quarantined_until:
+                return False
+            budget.quarantined_until = time.monotonic()
+            return True
+
+    def metrics(self, top: int = 10) -> Dict[str, Any]:
+        """
+        Returns fleet-wide counters, the quarantined devices and the `top` devices by over-budget messages.
+        """
+        now = time.monotonic()
+        with self._lock:
+            offenders = sorted(
+                (item for item in self._budgets.items() if item[1].rejected),
+                key=lambda item: item[1].rejected, reverse=True,
+            )[:top]
+            return {
+                "policy": self.policy,
+                "rate_per_second": self.rate,
+                "burst": self.burst,
+                "devices": len(self._budgets),
+                "admitted": sum(budget.admitted for budget in self._budgets.values()),
+                "rejected": sum(budget.rejected for budget in self._budgets.values()),
+                "held": self.held,
+                "held_pending": len(self._pending),
+                "released": self.released,
+                "quarantine_drops": self.quarantine_drops,
+                "quarantined": {
+                    device_ID: round(budget.quarantined_until - now, 1)
+                    for device_ID, budget in self._budgets.items() if budget.quarantined_until > now
+                },
+                "top_offenders": {device_ID: budget.rejected for device_ID, budget in offenders},
+            }
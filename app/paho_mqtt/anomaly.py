@@ -0,0 +1,246 @@
+import bisect
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from app.paho_mqtt.config import (
+    ANOMALY_MIN_RAW_GM,
+    ANOMALY_MAX_RAW_GM,
+    ANOMALY_WINDOW,
+    ANOMALY_MAX_WINDOW,
+    ANOMALY_SPIKE_MADS,
+    ANOMALY_MIN_SCALE_GM,
+    ANOMALY_SPIKE_RUN,
+    ANOMALY_NOISE_GM,
+    ANOMALY_STUCK_SAMPLES,
+    ANOMALY_PICKED_UP_MAX_SECONDS,
+)
+
+# Scales a MAD to the standard deviation of normally distributed noise
+MAD_SCALE = 1.4826
+
+
+class DeviceHealth:
+    """
+    Rolling window and fault counters of one device.
+    """
+    __slots__ = ("window", "ordered", "spike_run", "last_value", "repeats", "picked_up_since", "noise",
+                 "samples", "out_of_range", "spikes", "last_seen")
+
+    def __init__(self, size: int):
+        self.window: deque = deque(maxlen=size)
+        self.ordered: List[float] = []
+        self.spike_run: List[float] = []
+        self.last_value: Optional[float] = None
+        self.repeats = 0
+        self.picked_up_since: Optional[float] = None
+        self.noise = 0.0
+        self.samples = 0
+        self.out_of_range = 0
+        self.spikes = 0
+        self.last_seen = 0.0
+
+
+class AnomalyDetector:
+    """
+    Online sensor-fault detection for raw weight samples, in front of tare and storage.
+
+    Per device it keeps the last `window` accepted samples (kept sorted as well) and checks
+    every new sample against them. The median and the MAD are selected from the sorted window in
+    O(log window); keeping it sorted is one bisect and one list shift, O(window) but only a
+    memmove of at most `ANOMALY_MAX_WINDOW` floats, so the cost per sample is bounded:
+
+    - out of range: outside [`min_raw`, `max_raw`]; dropped.
+    - spike: further than `spike_mads` scaled MADs from the rolling median; dropped, unless
+      `spike_run` consecutive spikes agree with each other, which is a real level change (e.g.
+      a refill the dock did not report) and restarts the window.
+    - noisy: the scaled MAD of the window exceeds `noise_gm`; flagged only.
+    - stuck weight: `stuck_samples` bit-identical readings in a row (an HX711 always jitters); flagged only.
+    - stuck pickup: `is_picked_up` reported for longer than `picked_up_max` seconds; flagged only.
+
+    A pickup or putdown restarts the window, as the level is expected to jump.
+    """
+
+    def __init__(self, min_raw: float = ANOMALY_MIN_RAW_GM, max_raw: float = ANOMALY_MAX_RAW_GM,
+                 window: int = ANOMALY_WINDOW, spike_mads: float = ANOMALY_SPIKE_MADS,
+                 min_scale: float = ANOMALY_MIN_SCALE_GM, spike_run: int = ANOMALY_SPIKE_RUN,
+                 noise_gm: float = ANOMALY_NOISE_GM, stuck_samples: int = ANOMALY_STUCK_SAMPLES,
+                 picked_up_max: float = ANOMALY_PICKED_UP_MAX_SECONDS):
+        if not spike_run <= window <= ANOMALY_MAX_WINDOW:
+            raise ValueError(f"The anomaly window must hold between {spike_run} and {ANOMALY_MAX_WINDOW} samples, got {window}")
+        self.min_raw = min_raw
+        self.max_raw = max_raw
+        self.window = window
+        self.spike_mads = spike_mads
+        self.min_scale = min_scale
+        self.spike_run = spike_run
+        self.noise_gm = noise_gm
+        self.stuck_samples = stuck_samples
+        self.picked_up_max = picked_up_max
+        self._devices: Dict[str, DeviceHealth] = {}
+        self._lock = threading.Lock()
+
+    def accept(self, device_ID: str, value: float, now: Optional[float] = None) -> bool:
+        """
+        Checks a raw weight sample and records it.
+
+        Returns:
+            bool: False if the sample is out of range or an isolated spike and must be dropped.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            device = self.__device(device_ID)
+            device.samples += 1
+            device.last_seen = now
+
+            device.repeats = device.repeats + 1 if value == device.last_value else 0
+            device.last_value = value
+
+            if not self.min_raw <= value <= self.max_raw:
+                device.out_of_range += 1
+                return False
+
+            if len(device.window) >= self.spike_run:
+                median = _median(device.ordered)
+                scale = max(device.noise, self.min_scale)
+                if abs(value - median) > self.spike_mads * scale:
+                    device.spike_run.append(value)
+                    if len(device.spike_run) < self.spike_run or not self.__consistent(device.spike_run, scale):
+                        device.spikes += 1
+                        if len(device.spike_run) >= self.spike_run:
+                            device.spike_run.pop(0)
+                        return False
+                    # The level really moved: restart from the agreeing samples
+                    run = device.spike_run
+                    self.__restart(device)
+                    for sample in run[:-1]:
+                        self.__push(device, sample)
+                else:
+                    device.spike_run.clear()
+
+            self.__push(device, value)
+            return True
+
+    def __consistent(self, run: List[float], scale: float) -> bool:
+        return max(run) - min(run) <= self.spike_mads * scale
+
+    def __push(self, device: DeviceHealth, value: float) -> None:
+        if len(device.window) == device.window.maxlen:
+            evicted = device.window[0]
+            del device.ordered[bisect.bisect_left(device.ordered, evicted)]
+        device.window.append(value)
+        bisect.insort(device.ordered, value)
+
+        if len(device.window) >= self.spike_run:
+            median = _median(device.ordered)
+            device.noise = MAD_SCALE * _median_deviation(device.ordered, median)
+
+    def __restart(self, device: DeviceHealth) -> None:
+        device.window.clear()
+        device.ordered = []
+        device.spike_run = []
+        device.noise = 0.0
+
+    def __device(self, device_ID: str) -> DeviceHealth:
+        device = self._devices.get(device_ID)
+        if device is None:
+            device = self._devices[device_ID] = DeviceHealth(self.window)
+        return device
+
+    def set_picked_up(self, device_ID: str, picked_up: bool, now: Optional[float] = None) -> None:
+        """
+        Records a pickup/putdown event; the weight is expected to jump, so the window restarts.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            device = self.__device(device_ID)
+            device.last_seen = now
+            if picked_up:
+                if device.picked_up_since is None:
+                    device.picked_up_since = now
+            else:
+                device.picked_up_since = None
+            self.__restart(device)
+
+    def reset(self) -> None:
+        """
+        Forgets every device; called when this process stops ingesting.
+        """
+        with self._lock:
+            self._devices.clear()
+
+    def health(self, device_ID: Optional[str] = None, unhealthy_only: bool = False) -> List[Dict[str, Any]]:
+        """
+        Returns the health of one device or of every device seen since ingest started.
+        """
+        now = time.monotonic()
+        with self._lock:
+            devices = self._devices.items() if device_ID is None else \
+                [(device_ID, self._devices[device_ID])] if device_ID in self._devices else []
+            report = [self.__report(name, device, now) for name, device in devices]
+        if unhealthy_only:
+            report = [entry for entry in report if entry["issues"]]
+        return sorted(report, key=lambda entry: entry["device_id"])
+
+    def __report(self, device_ID: str, device: DeviceHealth, now: float) -> Dict[str, Any]:
+        issues = []
+        if device.repeats + 1 >= self.stuck_samples:
+            issues.append("stuck_weight")
+        if device.picked_up_since is not None and now - device.picked_up_since > self.picked_up_max:
+            issues.append("stuck_picked_up")
+        if device.noise > self.noise_gm:
+            issues.append("noisy")
+        if device.spike_run:
+            issues.append("spiking")
+        return {
+            "device_id": device_ID,
+            "status": "faulty" if issues else "ok",
+            "issues": issues,
+            "samples": device.samples,
+            "out_of_range": device.out_of_range,
+            "spikes": device.spikes,
+            "noise_gm": round(device.noise, 2),
+            "median_gm": round(_median(device.ordered), 1) if device.ordered else None,
+            "seconds_since_seen": round(now - device.last_seen, 1),
+        }
+
+
+def _median(ordered: List[float]) -> float:
+    middle = len(ordered) // 2
+    if len(ordered) % 2:
+        return ordered[middle]
+    return (ordered[middle - 1] + ordered[middle]) / 2
+
+
+def _median_deviation(ordered: List[float], median: float) -> float:
+    """
+    Median of |sample - median| over a sorted window, without sorting the deviations.
+    """
+    count = len(ordered)
+    middle = count // 2
+    if count % 2:
+        return _kth_deviation(ordered, median, middle)
+    return (_kth_deviation(ordered, median, middle - 1) + _kth_deviation(ordered, median, middle)) / 2
+
+
+def _kth_deviation(ordered: List[float], median: float, k: int) -> float:
+    # The deviations below the median, read outwards, and those above it are two sorted runs;
+    # the k-th smallest of both is found by bisecting how many come from the lower run
+    split = bisect.bisect_left(ordered, median)
+    below = lambda i: median - ordered[split - 1 - i]
+    above = lambda i: ordered[split + i] - median
+
+    low, high = max(0, k + 1 - (len(ordered) - split)), min(k + 1, split)
+    while low < high:
+        taken = (low + high) // 2
+        if below(taken) < above(k - taken):
+            low = taken + 1
+        else:
+            high = taken
+    candidates = []
+    if low > 0:
+        candidates.append(below(low - 1))
+    if k + 1 - low > 0:
+        candidates.append(above(k - low))
+    return max(candidates)
@@ -0,0 +1,289 @@
+import threading
+import time
+from typing import Dict, Optional
+
+from loguru import logger
+
+from app.database.db import get_db_session
+from app.paho_mqtt.config import (
+    CALIBRATION_STABLE_TOLERANCE_GM,
+    CALIBRATION_STABLE_SECONDS,
+    CALIBRATION_DRIFT_ALPHA,
+    CALIBRATION_MAX_DRIFT_GM,
+    CALIBRATION_PERSIST_INTERVAL_SECONDS,
+    CALIBRATION_UNKNOWN_RETRY_SECONDS,
+)
+from app.paho_mqtt.repositories.water_level_repository import WaterLevelRepository
+
+
+class DeviceTare:
+    """
+    What the calibrator knows about one dock.
+    """
+    __slots__ = ("bottle_weight", "zero_offset", "empty_weight", "on_dock", "settle_value", "settle_since", "dirty")
+
+    def __init__(self, bottle_weight: Optional[int], zero_offset: float = 0.0, empty_weight: Optional[float] = None,
+                 on_dock: Optional[bool] = None):
+        self.bottle_weight = bottle_weight
+        self.zero_offset = zero_offset
+        self.empty_weight = empty_weight if empty_weight is not None else bottle_weight
+        # Seeded from `users.is_bottle_on_dock`, then kept by pickup/putdown events; None while unknown
+        self.on_dock = on_dock
+        self.settle_value: Optional[float] = None
+        self.settle_since = 0.0
+        self.dirty = False
+
+
+class Calibrator:
+    """
+    Per-device automatic tare applied to raw dock readings at ingest.
+
+    A raw reading is load-cell zero offset + empty bottle + water. Both unknowns start from the
+    owner's `Users.bottle_weight` (zero offset 0) and are refined from the readings themselves:
+
+    - While the bottle is picked up, a stable reading is the dock's zero offset; it is averaged
+      in to follow load-cell drift.
+    - While the bottle is known to be on the dock, a stable reading below the empty-bottle weight
+      proves the bottle is lighter than assumed (water cannot be negative), so the baseline moves
+      down to it. A reading near zero is an empty dock rather than a bottle and is never learned.
+
+    A reading is stable once it stayed within `CALIBRATION_STABLE_TOLERANCE_GM` for
+    `CALIBRATION_STABLE_SECONDS`. Every step is O(1) and in memory. Profiles are loaded in
+    one query by `load`, owner changes arrive through `set_bottle_weight` (and `users_changed`
+    notifications), and learned values are saved by `CalibrationPersister`. Setting a bottle
+    weight by hand resets the learned baseline to it.
+    """
+
+    def __init__(self, stable_tolerance: float = CALIBRATION_STABLE_TOLERANCE_GM,
+                 stable_seconds: float = CALIBRATION_STABLE_SECONDS, drift_alpha: float = CALIBRATION_DRIFT_ALPHA,
+                 max_drift: float = CALIBRATION_MAX_DRIFT_GM, unknown_retry: float = CALIBRATION_UNKNOWN_RETRY_SECONDS):
+        self.stable_tolerance = stable_tolerance
+        self.stable_seconds = stable_seconds
+        self.drift_alpha = drift_alpha
+        self.max_drift = max_drift
+        self.unknown_retry = unknown_retry
+        self.lookups = 0
+        self._devices: Dict[str, DeviceTare] = {}
+        # Devices without an owner -> when to look them up again
+        self._unknown: Dict[str, float] = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def load(self) -> None:
+        """
+        Loads every device's bottle weight and saved calibration in one query, keeping what was
+        learned in memory for devices whose bottle weight did not change.
+        """
+        with get_db_session() as session:
+            rows = WaterLevelRepository(session).get_calibration_profiles()
+
+        with self._lock:
+            devices = {}
+            for row in rows:
+                current = self._devices.get(row[0])
+                if current is not None and current.bottle_weight == row[1]:
+                    if current.on_dock is None:
+                        current.on_dock = row[5]
+                    devices[row[0]] = current
+                else:
+                    devices[row[0]] = _from_row(row)
+            self._devices = devices
+            self._unknown.clear()
+            self._loaded = True
+        logger.info(f"Loaded calibration of {len(rows)} devices")
+
+    @property
+    def loaded(self) -> bool:
+        """
+        True while this process ingests and holds every device's calibration.
+        """
+        return self._loaded
+
+    def reset(self) -> None:
+        """
+        Forgets every device; called when this process stops ingesting.
+        """
+        with self._lock:
+            self._devices.clear()
+            self._unknown.clear()
+            self._loaded = False
+
+    def correct(self, sensor_id: str, raw: float, now: Optional[float] = None) -> Optional[float]:
+        """
+        Learns from a raw reading and returns the water weight it corresponds to.
+
+        Returns:
+            Optional[float]: The water weight, or None if the device's bottle weight is unknown.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            device = self._devices.get(sensor_id)
+        if device is None:
+            device = self.__lookup(sensor_id, now)
+            if device is None:
+                return None
+
+        with self._lock:
+            if device.settle_value is None or abs(raw - device.settle_value) > self.stable_tolerance:
+                device.settle_value, device.settle_since = raw, now
+            elif now - device.settle_since >= self.stable_seconds:
+                self.__learn(device, raw)
+
+            if device.empty_weight is None:
+                return None
+            return raw - device.zero_offset - device.empty_weight
+
+    def __learn(self, device: DeviceTare, raw: float) -> None:
+        if device.on_dock is False:
+            if abs(raw) <= self.max_drift:
+                offset = device.zero_offset + self.drift_alpha * (raw - device.zero_offset)
+                if abs(offset - device.zero_offset) >= 0.05:
+                    device.zero_offset, device.dirty = offset, True
+            return
+
+        if device.on_dock is not True:
+            # Without a known dock state, a stable reading may just as well be the empty dock
+            return
+
+        net = raw - device.zero_offset
+        if device.empty_weight is not None and self.max_drift < net < device.empty_weight - self.stable_tolerance:
+            logger.info(f"Empty bottle is lighter than assumed, baseline {device.empty_weight:.1f} -> {net:.1f} gm")
+            device.empty_weight, device.dirty = net, True
+
+    def __lookup(self, sensor_id: str, now: float) -> Optional[DeviceTare]:
+        # A device that appeared without a notification (e.g. a user inserted by hand); bounded to one query per retry interval
+        with self._lock:
+            if self._unknown.get(sensor_id, 0.0) > now:
+                return None
+            self._unknown[sensor_id] = now + self.unknown_retry
+
+        self.lookups += 1
+        with get_db_session() as session:
+            rows = WaterLevelRepository(session).get_calibration_profiles(sensor_id)
+        if not rows:
+            return None
+
+        with self._lock:
+            self._unknown.pop(sensor_id, None)
+            return self._devices.setdefault(sensor_id, _from_row(rows[0]))
+
+    def set_on_dock(self, sensor_id: str, on_dock: bool) -> None:
+        """
+        Records a pickup (False) or putdown (True); readings settle anew afterwards.
+        """
+        with self._lock:
+            device = self._devices.get(sensor_id)
+            if device is not None:
+                device.on_dock = on_dock
+                device.settle_value = None
+
+    def set_bottle_weight(self, sensor_id: Optional[str], bottle_weight: Optional[int]) -> None:
+        """
+        Applies an owner's bottle weight. A changed value resets the learned empty-bottle baseline;
+        the dock's zero offset is kept. Ignored while this process is not ingesting.
+        """
+        if sensor_id is None:
+            return
+        with self._lock:
+            if not self._loaded:
+                return
+            self._unknown.pop(sensor_id, None)
+            device = self._devices.get(sensor_id)
+            if device is None:
+                self._devices[sensor_id] = device = DeviceTare(bottle_weight)
+            elif device.bottle_weight != bottle_weight:
+                device.bottle_weight, device.empty_weight = bottle_weight, bottle_weight
+            else:
+                return
+            device.dirty = True
+
+    def forget(self, sensor_id: Optional[str]) -> None:
+        """
+        Drops what is known about a device whose owner changed; it is looked up again on its next reading.
+        """
+        with self._lock:
+            self._devices.pop(sensor_id, None)
+            self._unknown.pop(sensor_id, None)
+
+    def persist(self) -> int:
+        """
+        Saves the devices whose calibration changed since the last save.
+
+        Returns:
+            int: The number of devices saved.
+        """
+        with self._lock:
+            dirty = [(sensor_id, device) for sensor_id, device in self._devices.items() if device.dirty]
+            rows = [
+                {"sensor_id": sensor_id, "bottle_weight": device.bottle_weight,
+                 "zero_offset": device.zero_offset, "empty_weight": device.empty_weight}
+                for sensor_id, device in dirty
+            ]
+            for _, device in dirty:
+                device.dirty = False
+        if not rows:
+            return 0
+
+        try:
+            with get_db_session() as session:
+                WaterLevelRepository(session).save_calibrations(rows)
+        except Exception:
+            with self._lock:
+                for _, device in dirty:
+                    device.dirty = True
+            raise
+        return len(rows)
+
+    def get(self, sensor_id: str) -> Optional[Dict[str, Optional[float]]]:
+        """
+        Returns a device's current calibration, or None if it is not known to this process.
+        """
+        with self._lock:
+            device = self._devices.get(sensor_id)
+            if device is None:
+                return None
+            return {"bottle_weight": device.bottle_weight, "zero_offset": device.zero_offset, "empty_weight": device.empty_weight}
+
+
+def _from_row(row) -> DeviceTare:
+    sensor_id, bottle_weight, calibrated_bottle_weight, zero_offset, empty_weight, on_dock = row
+    if zero_offset is None:
+        return DeviceTare(bottle_weight, on_dock=on_dock)
+    # A bottle weight set by hand while this process was down overrides the learned baseline
+    if calibrated_bottle_weight != bottle_weight:
+        empty_weight = None
+    return DeviceTare(bottle_weight, zero_offset, empty_weight, on_dock)
+
+
+class CalibrationPersister(threading.Thread):
+    """
+    Saves learned calibrations every `CALIBRATION_PERSIST_INTERVAL_SECONDS`, and once more when stopped.
+    """
+
+    def __init__(self, calibrator: Calibrator, interval: float = CALIBRATION_PERSIST_INTERVAL_SECONDS):
+        super().__init__(name="calibration-persister", daemon=True)
+        self.calibrator = calibrator
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.__persist()
+        self.__persist()
+
+    def __persist(self) -> None:
+        try:
+            saved = self.calibrator.persist()
+            if saved:
+                logger.info(f"Saved calibration of {saved} devices")
+        except Exception as e:
+            logger.error(f"Could not save device calibration: {e}")
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+
+
+# Used by the ingest's weight-sample and state lanes
+calibrator = Calibrator()
@@ -1,3 +1,74 @@
 MQTT_BROKER = 'localhost'
 MQTT_PORT = 1883
 MQTT_TOPIC = '/weight_change'
+
+# Dead-band / heartbeat filter applied to weight samples at ingest
+DEADBAND_THRESHOLD_GM = 5.0          # Store a reading only if it moved more than this from the last stored one
+HEARTBEAT_INTERVAL_SECONDS = 300     # ...or if this long has passed since the last stored reading
+
+# Batched, deduplicated ingest of weight samples
+INGEST_BATCH_SIZE = 500              # Flush once this many samples are buffered
+INGEST_FLUSH_INTERVAL_SECONDS = 0.5  # ...or once the oldest buffered sample is this old
+INGEST_QUEUE_SIZE = 100_000          # Upper bound on samples waiting to be written
+DEDUP_WINDOW_SIZE = 1024             # Recent message keys remembered in memory per device
+
+# Connection management (persistent session, reconnect backoff)
+MQTT_CLIENT_ID = 'hydrate-me-ingest'  # Must be stable for the broker to keep the session across reconnects
+MQTT_KEEPALIVE_SECONDS = 60
+MQTT_RECONNECT_MIN_DELAY_SECONDS = 1
+MQTT_RECONNECT_MAX_DELAY_SECONDS = 120
+
+# On-disk spill buffer used while the database is unavailable
+SPILL_PATH = 'spill/sensor_data.ndjson'
+SPILL_MAX_BYTES = 256 * 1024 * 1024   # Readings beyond this are dropped (and counted)
+SPILL_REPLAY_BATCH_SIZE = 5000        # Rows per insert when replaying after recovery
+SPILL_RETRY_INTERVAL_SECONDS = 5      # How often to retry the database while spilling
+
+# Downlink commands (LED modes) published to devices
+MQTT_LED_MODE_TOPIC = '/led_mode'            # Devices subscribe to "/<device_ID>/led_mode"
+MQTT_PUBLISHER_CLIENT_ID = 'hydrate-me-api'  # Suffixed with the process ID, one publisher per process
+MQTT_PUBLISHER_MAX_INFLIGHT = 1000           # Unacknowledged QoS 1 publishes allowed on the wire
+COMMAND_COALESCE_SECONDS = 5                 # Identical commands to a device within this window are sent once
+
+# In-memory ring buffer of recently stored readings, serving "today" and "latest" queries.
+# Each device uses RECENT_BUFFER_CAPACITY * 16 bytes (float64 timestamp + value) plus ~200 bytes
+# of bookkeeping: about 16 KiB per device at 1024, i.e. ~16 MiB per 1,000 devices.
+RECENT_BUFFER_CAPACITY = 1024        # Readings kept per device; older ones are served from the database
+RECENT_SEED_HOURS = 26               # Loaded from the database on start, enough to cover any local day
+
+# Priority lanes between the MQTT network thread and message processing
+STATE_LANE_QUEUE_SIZE = 10_000       # Pick-up/put-down events waiting to be applied
+SAMPLE_LANE_QUEUE_SIZE = 50_000      # Weight samples waiting for the dead-band filter and the writer
+LANE_LATENCY_WINDOW = 2048           # Recent receive-to-applied latencies kept per lane for percentiles
+
+# Per-device admission control (token bucket) in front of the ingest lanes
+ADMISSION_RATE_PER_SECOND = 50.0            # Sustained messages per device; firmware samples every 30 ms (~33/s)
+ADMISSION_BURST = 200                       # Messages a device may send at once after being quiet
+ADMISSION_OVERFLOW_POLICY = "latest"        # "drop" over-budget messages, or keep the "latest" per device and type until a token frees up
+ADMISSION_RELEASE_INTERVAL_SECONDS = 1.0    # How often held messages are checked for release
+ADMISSION_QUARANTINE_REJECTIONS = 5000      # Over-budget messages within the window that quarantine a device...
+ADMISSION_QUARANTINE_WINDOW_SECONDS = 60
+ADMISSION_QUARANTINE_SECONDS = 600          # ...for this long; every message from it is dropped meanwhile
+
+# Automatic tare: per-device zero offset and empty-bottle weight learned at ingest
+CALIBRATION_STABLE_TOLERANCE_GM = 3.0         # Readings within this of each other are one settled value
+CALIBRATION_STABLE_SECONDS = 10               # A settled value is stable once it has held this long
+CALIBRATION_DRIFT_ALPHA = 0.2                 # Weight of a stable off-dock reading in the zero offset average
+CALIBRATION_MAX_DRIFT_GM = 50.0               # Off-dock readings further than this from zero are not drift
+CALIBRATION_PERSIST_INTERVAL_SECONDS = 60     # How often learned values are saved to `device_calibration`
+CALIBRATION_UNKNOWN_RETRY_SECONDS = 60        # How often an unknown device's owner is looked up again
+
+# Streaming sensor-fault detection on raw weight samples
+ANOMALY_MIN_RAW_GM = -100.0           # Raw readings outside [min, max] are dropped as out of range
+ANOMALY_MAX_RAW_GM = 5000.0
+ANOMALY_WINDOW = 15                   # Recent samples per device the rolling median and MAD are computed over
+ANOMALY_MAX_WINDOW = 64               # Upper bound on ANOMALY_WINDOW; keeping the window sorted costs O(window) per sample
+ANOMALY_SPIKE_MADS = 6.0              # A sample further than this many (scaled) MADs from the median is a spike
+ANOMALY_MIN_SCALE_GM = 10.0           # Floor on the MAD scale, so a perfectly quiet bottle does not flag small moves
+ANOMALY_SPIKE_RUN = 3                 # This many consecutive "spikes" agreeing with each other are a real level change
+ANOMALY_NOISE_GM = 25.0               # Scaled MAD above this marks the device noisy
+ANOMALY_STUCK_SAMPLES = 50            # Bit-identical consecutive readings marking the load cell stuck
+ANOMALY_PICKED_UP_MAX_SECONDS = 6 * 3600  # Bottle picked up longer than this marks the pickup flag stuck
+
+# Intake-rate forecasting: exponentially weighted intake rate per device, updated at ingest
+FORECAST_RATE_TAU_HOURS = 1.5         # Time constant of the rate; intake this long ago weighs 1/e of intake now
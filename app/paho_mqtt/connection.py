@@ -0,0 +1,88 @@
+import random
+import threading
+from typing import Callable, List, Optional, Tuple
+
+from loguru import logger
+import paho.mqtt.client as mqtt
+
+from app.paho_mqtt.config import (
+    MQTT_BROKER,
+    MQTT_PORT,
+    MQTT_CLIENT_ID,
+    MQTT_KEEPALIVE_SECONDS,
+    MQTT_RECONNECT_MIN_DELAY_SECONDS,
+    MQTT_RECONNECT_MAX_DELAY_SECONDS,
+)
+
+
+class MQTTConnectionManager:
+    """
+    Keeps an MQTT subscriber connected for the lifetime of the process.
+
+    The client uses a stable client ID with `clean_session=False`, so the broker keeps the
+    subscription and queues QoS 1 messages while the connection is down. Lost connections are
+    re-established by paho with exponential backoff between `min_delay` and `max_delay`; any
+    error that escapes the network loop is logged and the loop is restarted after a jittered
+    exponential backoff, instead of killing the ingest thread.
+    """
+
+    def __init__(self, topics: List[Tuple[str, int]], on_message: Callable, on_subscribe: Optional[Callable] = None,
+                 client_id: str = MQTT_CLIENT_ID, broker: str = MQTT_BROKER, port: int = MQTT_PORT,
+                 keepalive: int = MQTT_KEEPALIVE_SECONDS, min_delay: float = MQTT_RECONNECT_MIN_DELAY_SECONDS,
+                 max_delay: float = MQTT_RECONNECT_MAX_DELAY_SECONDS):
+        self.topics = topics
+        self.broker = broker
+        self.port = port
+        self.keepalive = keepalive
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self._stop_event = threading.Event()
+        self._attempt = 0
+
+        self.client = mqtt.Client(client_id=client_id, clean_session=False)
+        self.client.reconnect_delay_set(min_delay=int(min_delay), max_delay=int(max_delay))
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_message = on_message
+        if on_subscribe is not None:
+            self.client.on_subscribe = on_subscribe
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc != mqtt.MQTT_ERR_SUCCESS:
+            logger.error(f"MQTT connection refused: {mqtt.connack_string(rc)}")
+            return
+
+        self._attempt = 0
+        logger.success(f"Connected to MQTT broker {self.broker}:{self.port} (session present: {bool(flags.get('session present'))})")
+        # Harmless when the broker kept the session, required when it did not
+        client.subscribe(self.topics)
+
+    def _on_disconnect(self, client, userdata, rc):
+        if rc != mqtt.MQTT_ERR_SUCCESS and not self._stop_event.is_set():
+            logger.warning(f"Lost connection to MQTT broker ({mqtt.error_string(rc)}), reconnecting")
+
+    def run_forever(self) -> None:
+        """
+        Connects and runs the network loop until `stop` is called.
+        """
+        while not self._stop_event.is_set():
+            try:
+                self.client.connect_async(self.broker, self.port, keepalive=self.keepalive)
+                self.client.loop_forever(retry_first_connection=True)
+            except Exception as e:
+                logger.exception(f"MQTT network loop failed: {e}")
+
+            if self._stop_event.is_set():
+                break
+
+            delay = min(self.max_delay, self.min_delay * 2 ** self._attempt) * random.uniform(0.5, 1.0)
+            self._attempt += 1
+            logger.info(f"Restarting MQTT network loop in {delay:.1f}s")
+            self._stop_event.wait(delay)
+
+    def stop(self) -> None:
+        """
+        Disconnects from the broker and makes `run_forever` return.
+        """
+        self._stop_event.set()
+        self.client.disconnect()
@@ -0,0 +1,91 @@
+import threading
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from app.database.db import get_db_session
+from app.paho_mqtt.repositories.water_level_repository import WaterLevelRepository
+from app.server.User.service.day_window import DEFAULT_TIMEZONE, local_day_bounds
+
+
+class DailyTotals:
+    """
+    Per-device running total of the accepted readings of the owner's current local day, whether
+    the dead-band stored them or carried them into the next stored row.
+
+    Matches what `UserService.get_todays_total_water_intake` computes from `sensor_data_1`,
+    without rescanning the day's rows. Totals are seeded with one aggregate query per
+    distinct timezone and then incremented for every reading handed to the writer. Each
+    total remembers the UTC bounds of its local day, so it resets at the owner's midnight.
+    """
+
+    def __init__(self):
+        # sensor_id -> (day start, day end, total), bounds as naive UTC
+        self._totals: Dict[str, Tuple[datetime, datetime, float]] = {}
+        self._timezones: Dict[str, Optional[str]] = {}
+        self._lock = threading.Lock()
+
+    def seed(self) -> None:
+        """
+        Loads device timezones and today's totals from the database.
+        """
+        with get_db_session() as session:
+            repository = WaterLevelRepository(session)
+            timezones = repository.get_sensor_timezones()
+
+            sensors_by_timezone: Dict[str, List[str]] = defaultdict(list)
+            for sensor_id, tz_name in timezones.items():
+                sensors_by_timezone[tz_name or DEFAULT_TIMEZONE].append(sensor_id)
+
+            seeded = {}
+            for tz_name in sensors_by_timezone:
+                start, end = local_day_bounds(tz_name)
+                for sensor_id, total in repository.get_totals_between(start, end, timezone=tz_name).items():
+                    seeded[sensor_id] = (start, end, total)
+
+        with self._lock:
+            self._timezones.update(timezones)
+            self._totals.update(seeded)
+        logger.info(f"Seeded today's running totals for {len(seeded)} devices across {len(sensors_by_timezone)} timezones")
+
+    def set_timezone(self, sensor_id: str, tz_name: Optional[str]) -> None:
+        """
+        Records a device owner's (new) timezone; the running total restarts on the next reading.
+        """
+        with self._lock:
+            if sensor_id in self._timezones and self._timezones[sensor_id] == tz_name:
+                return
+            self._timezones[sensor_id] = tz_name
+            self._totals.pop(sensor_id, None)
+
+    def add(self, sensor_id: str, value: float, timestamp: Optional[datetime] = None) -> float:
+        """
+        Adds an accepted reading to the device's total for the reading's local day.
+
+        Returns:
+            float: The device's new total for that day.
+        """
+        timestamp = timestamp or datetime.utcnow()
+        with self._lock:
+            start, end, total = self._totals.get(sensor_id, (None, None, 0.0))
+            if start is None or not start <= timestamp < end:
+                start, end = local_day_bounds(self._timezones.get(sensor_id), timestamp)
+                total = 0.0
+            total += value
+            self._totals[sensor_id] = (start, end, total)
+            return total
+
+    def get(self, sensor_id: str, now: Optional[datetime] = None) -> float:
+        """
+        Returns the device's total for the local day containing `now` (default: now), or 0.0.
+        """
+        now = now or datetime.utcnow()
+        with self._lock:
+            start, end, total = self._totals.get(sensor_id, (None, None, 0.0))
+        return total if start is not None and start <= now < end else 0.0
+
+
+# Shared by the ingest path (writes) and the reminder scheduler (reads)
+daily_totals = DailyTotals()
@@ -0,0 +1,115 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from app.paho_mqtt.config import DEADBAND_THRESHOLD_GM, HEARTBEAT_INTERVAL_SECONDS, DEDUP_WINDOW_SIZE
+
+
+class DeadbandFilter:
+    """
+    Per-device dead-band and heartbeat filter for weight samples.
+
+    A reading is stored only when it differs from the last *stored* reading of the same device
+    by more than `threshold`, or when `heartbeat` seconds have elapsed since that reading.
+    Because the comparison is against the last stored value, slow drift is still recorded once
+    it accumulates past the threshold. Skipped readings can be reconstructed at query time with
+    last-observation-carried-forward (see `downsampling.resample_locf`), and their values are
+    summed by `skip` and carried into the next stored row (`take_skipped`), so totals still
+    count every reading whatever the threshold and heartbeat.
+    """
+
+    def __init__(self, threshold: float = DEADBAND_THRESHOLD_GM, heartbeat: float = HEARTBEAT_INTERVAL_SECONDS):
+        self.threshold = threshold
+        self.heartbeat = heartbeat
+        self._last_stored: Dict[str, Tuple[float, float]] = {}
+        self._skipped: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def should_store(self, device_ID: str, value: float, now: Optional[float] = None) -> bool:
+        """
+        Checks whether a reading passes the filter.
+
+        Args:
+            device_ID (str): The device that produced the reading.
+            value (float): The reading.
+            now (Optional[float]): Monotonic time of the reading, defaults to `time.monotonic()`.
+
+        Returns:
+            bool: True if the reading should be stored.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            last = self._last_stored.get(device_ID)
+
+        if last is None:
+            return True
+
+        last_value, last_time = last
+        return abs(value - last_value) > self.threshold or now - last_time >= self.heartbeat
+
+    def mark_stored(self, device_ID: str, value: float, now: Optional[float] = None) -> None:
+        """
+        Records that a reading was stored, making it the new reference for the device.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._last_stored[device_ID] = (value, now)
+
+    def skip(self, device_ID: str, value: float) -> None:
+        """
+        Records a reading that was not stored; its value is carried into the device's next stored row.
+        """
+        with self._lock:
+            self._skipped[device_ID] = self._skipped.get(device_ID, 0.0) + value
+
+    def take_skipped(self, device_ID: str) -> Optional[float]:
+        """
+        Returns and clears the sum of the device's readings skipped since its last stored one, or None if there were none.
+        """
+        with self._lock:
+            skipped = self._skipped.pop(device_ID, None)
+        return round(skipped, 2) if skipped is not None else None
+
+    def forget(self, device_ID: str) -> None:
+        """
+        Drops the reference for a device so that its next reading is always stored. Skipped
+        readings are kept and carried into that reading.
+        """
+        with self._lock:
+            self._last_stored.pop(device_ID, None)
+
+
+class DedupWindow:
+    """
+    Remembers the most recent message keys per device to drop QoS 1 redeliveries in memory.
+
+    The key is the message sequence number when the firmware sends one. The window is only a
+    fast path: the `sensor_data_dedup` ledger still rejects duplicates that fall outside it
+    (e.g. after a restart).
+    """
+
+    def __init__(self, size: int = DEDUP_WINDOW_SIZE):
+        self.size = size
+        self._recent: Dict[str, "OrderedDict[str, None]"] = {}
+        self._lock = threading.Lock()
+
+    def seen(self, device_ID: str, key: str) -> bool:
+        """
+        Checks whether a message key was already seen for the device, and records it if not.
+
+        Args:
+            device_ID (str): The device that sent the message.
+            key (str): The message sequence number or content hash.
+
+        Returns:
+            bool: True if the message is a duplicate.
+        """
+        with self._lock:
+            recent = self._recent.setdefault(device_ID, OrderedDict())
+            if key in recent:
+                return True
+            recent[key] = None
+            if len(recent) > self.size:
+                recent.popitem(last=False)
+            return False
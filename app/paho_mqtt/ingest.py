@@ -0,0 +1,149 @@
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+
+from app.database.db import get_db_session
+from app.database.sharding import ShardWriteError
+from app.paho_mqtt.config import INGEST_BATCH_SIZE, INGEST_FLUSH_INTERVAL_SECONDS, INGEST_QUEUE_SIZE, SPILL_RETRY_INTERVAL_SECONDS
+from app.paho_mqtt.repositories.water_level_repository import WaterLevelRepository
+from app.paho_mqtt.spill import SpillBuffer
+
+
+class SensorDataWriter(threading.Thread):
+    """
+    Background writer that batches weight samples into bulk, deduplicated inserts.
+
+    `on_message` only enqueues rows; this thread flushes them through
+    `WaterLevelRepository.add_sensor_data_bulk` once `batch_size` rows are buffered or the
+    oldest buffered row is `flush_interval` seconds old.
+
+    When a flush fails the batch goes to the on-disk `SpillBuffer`, and so does every later
+    batch (to keep rows in order) until a retry every `retry_interval` seconds manages to
+    replay the spill file. With sharded sensor tables a batch can fail on one shard only; just
+    that shard's rows are spilled then, the rest stay committed.
+    """
+
+    def __init__(self, batch_size: int = INGEST_BATCH_SIZE, flush_interval: float = INGEST_FLUSH_INTERVAL_SECONDS,
+                 queue_size: int = INGEST_QUEUE_SIZE, spill: Optional[SpillBuffer] = None,
+                 retry_interval: float = SPILL_RETRY_INTERVAL_SECONDS):
+        super().__init__(name="sensor-data-writer", daemon=True)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_interval = retry_interval
+        self.spill = spill
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=queue_size)
+        self._stop_event = threading.Event()
+        self._next_retry = 0.0
+
+    def submit(self, sensor_id: str, data: float, seq: Optional[str] = None, timestamp: Optional[datetime] = None,
+               skipped: Optional[float] = None) -> None:
+        """
+        Queues a reading for the next batch.
+
+        Args:
+            sensor_id (str): The ID of the sensor providing the data.
+            data (float): The water level or weight data to be recorded.
+            seq (Optional[str]): The message sequence number, if the firmware sent one.
+            timestamp (Optional[datetime]): Time of the reading, defaults to now (UTC).
+            skipped (Optional[float]): Sum of the readings the dead-band skipped since the previous stored one.
+
+        Raises:
+            queue.Full: If the writer is too far behind to accept more rows.
+        """
+        self._queue.put_nowait({
+            "sensor_id": sensor_id,
+            "data": data,
+            "seq": seq,
+            "timestamp": timestamp or datetime.utcnow(),
+            "skipped_data": skipped,
+        })
+
+    def run(self):
+        batch: List[Dict[str, Any]] = []
+        deadline = None
+
+        while not (self._stop_event.is_set() and self._queue.empty()):
+            timeout = self.flush_interval if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+            except queue.Empty:
+                pass
+
+            if self.spill is not None and self.spill.pending() and time.monotonic() >= self._next_retry:
+                self.recover()
+
+            if batch and (len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                self.flush(batch)
+                batch, deadline = [], None
+
+        if batch:
+            self.flush(batch)
+
+    def flush(self, batch: List[Dict[str, Any]]) -> None:
+        """
+        Writes a batch to the database in one transaction, or spills it while the database is down.
+        """
+        if self.spill is not None and self.spill.pending():
+            self.spill.append(batch)
+            return
+
+        try:
+            self.write(batch)
+        except ShardWriteError as e:
+            if self.spill is None:
+                logger.exception(f"Failed to write {len(e.rows)} of {len(batch)} readings: {e}")
+                return
+            logger.error(f"Failed to write {len(e.rows)} of {len(batch)} readings, spilling them to disk: {e}")
+            self.spill.append(e.rows)
+            self._next_retry = time.monotonic() + self.retry_interval
+        except Exception as e:
+            if self.spill is None:
+                logger.exception(f"Failed to write batch of {len(batch)} readings: {e}")
+                return
+            logger.error(f"Failed to write batch of {len(batch)} readings, spilling to disk: {e}")
+            self.spill.append(batch)
+            self._next_retry = time.monotonic() + self.retry_interval
+
+    def write(self, batch: List[Dict[str, Any]]) -> int:
+        """
+        Writes a batch through the repository and returns the number of rows inserted.
+        """
+        with get_db_session() as session:
+            written = WaterLevelRepository(session).add_sensor_data_bulk(batch)
+        logger.success(f"Wrote {written} of {len(batch)} buffered readings to the database")
+        return written
+
+    def recover(self) -> None:
+        """
+        Replays the spill file at full batch speed once the database accepts writes again.
+        """
+        try:
+            replayed = self.spill.replay(self.__replay_batch)
+            logger.success(f"Database recovered, replayed {replayed} spilled readings")
+        except Exception as e:
+            logger.warning(f"Database still unavailable, keeping readings spilled: {e}")
+            self._next_retry = time.monotonic() + self.retry_interval
+
+    def __replay_batch(self, batch: List[Dict[str, Any]]) -> int:
+        try:
+            return self.write(batch)
+        except ShardWriteError as e:
+            # Every shard failed: stop the replay here. Otherwise only the failed shards' rows are spilled again
+            if len(e.rows) == len(batch):
+                raise
+            self.spill.append(e.rows)
+            return e.written
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """
+        Stops the writer after draining the rows already queued.
+        """
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
@@ -0,0 +1,76 @@
+import math
+import threading
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from app.paho_mqtt.config import FORECAST_RATE_TAU_HOURS
+
+
+class IntakeRates:
+    """
+    Per-device exponentially weighted intake rate, fed by the MQTT ingest next to `daily_totals`.
+
+    The rate is an exponential kernel over the accepted readings: each reading adds
+    `value / tau`, and the sum decays by `exp(-dt / tau)` as time passes. Bursty drinking
+    therefore raises the rate at once and it fades during quiet hours, and a constant intake of
+    r ml/h converges to r. Updates and reads are O(1) per device.
+    """
+
+    def __init__(self, tau_hours: float = FORECAST_RATE_TAU_HOURS):
+        self.tau = tau_hours * 3600
+        # sensor_id -> (rate in ml per second, as of this naive UTC instant)
+        self._rates: Dict[str, Tuple[float, datetime]] = {}
+        self._active = False
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """
+        Marks the start of ingest in this process; rates build up from the readings seen from now on.
+        """
+        with self._lock:
+            self._active = True
+
+    def reset(self) -> None:
+        """
+        Forgets every rate; called when this process stops ingesting.
+        """
+        with self._lock:
+            self._rates.clear()
+            self._active = False
+
+    @property
+    def active(self) -> bool:
+        """
+        True while this process ingests, so its rates and `daily_totals` follow live data.
+        """
+        return self._active
+
+    def add(self, sensor_id: str, value: float, timestamp: datetime) -> None:
+        """
+        Records a reading that was handed to the writer; negative values do not count as intake.
+        """
+        with self._lock:
+            if not self._active:
+                return
+            rate, as_of = self._rates.get(sensor_id, (0.0, timestamp))
+            # Readings handled slightly out of order are added undecayed
+            if timestamp > as_of:
+                rate, as_of = _decay(rate, (timestamp - as_of).total_seconds(), self.tau), timestamp
+            self._rates[sensor_id] = (rate + max(value, 0.0) / self.tau, as_of)
+
+    def get(self, sensor_id: str, now: Optional[datetime] = None) -> float:
+        """
+        Returns the device's current intake rate in ml per hour, 0.0 if it has not been seen.
+        """
+        now = now or datetime.utcnow()
+        with self._lock:
+            rate, as_of = self._rates.get(sensor_id, (0.0, now))
+        return _decay(rate, (now - as_of).total_seconds(), self.tau) * 3600
+
+
+def _decay(rate: float, seconds: float, tau: float) -> float:
+    return rate * math.exp(-seconds / tau) if seconds > 0 else rate
+
+
+# Written by the MQTT ingest, read by the forecast endpoint
+intake_rates = IntakeRates()
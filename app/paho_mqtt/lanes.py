@@ -0,0 +1,99 @@
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from app.paho_mqtt.config import LANE_LATENCY_WINDOW
+
+
+class IngestLane(threading.Thread):
+    """
+    A bounded queue of parsed messages drained by its own thread.
+
+    `on_message` only parses, deduplicates and classifies, then hands each message to a lane,
+    so the MQTT network thread never waits on the database. Lanes do not share a queue, so
+    a backlog of weight samples cannot delay state changes queued on another lane.
+
+    Every processed message records its receive-to-applied latency. The most recent
+    `latency_window` values feed the percentiles reported by `metrics`.
+    """
+
+    def __init__(self, name: str, handler: Callable[..., None], queue_size: int, latency_window: int = LANE_LATENCY_WINDOW):
+        super().__init__(name=f"ingest-{name}-lane", daemon=True)
+        self.lane = name
+        self.handler = handler
+        self.processed = 0
+        self.dropped = 0
+        self.failed = 0
+        self._queue: "queue.Queue[Optional[Tuple[float, tuple]]]" = queue.Queue(maxsize=queue_size)
+        self._latencies: Deque[float] = deque(maxlen=latency_window)
+        self._lock = threading.Lock()
+
+    def submit(self, *args: Any) -> bool:
+        """
+        Queues a message for the handler, stamped with the current time.
+
+        Returns:
+            bool: False if the lane is full and the message was dropped.
+        """
+        try:
+            self._queue.put_nowait((time.monotonic(), args))
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+                dropped = self.dropped
+            # Logged sparingly, a full lane means thousands of messages per second
+            if dropped == 1 or dropped % 1000 == 0:
+                logger.warning(f"Ingest {self.lane} lane is full, dropped a message ({dropped} in total)")
+            return False
+
+    def run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+
+            received, args = item
+            try:
+                self.handler(*args)
+            except Exception as e:
+                with self._lock:
+                    self.failed += 1
+                logger.exception(f"Ingest {self.lane} lane failed to process {args}: {e}")
+            with self._lock:
+                self.processed += 1
+                self._latencies.append(time.monotonic() - received)
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """
+        Processes what is already queued, then stops the thread.
+        """
+        if self.is_alive():
+            # Blocks while the lane is full, which only delays shutdown until it drains
+            self._queue.put(None)
+            self.join(timeout)
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        Returns counters, the current queue depth and latency percentiles in milliseconds.
+        """
+        with self._lock:
+            latencies = np.fromiter(self._latencies, dtype=np.float64) * 1000
+            result = {
+                "lane": self.lane,
+                "processed": self.processed,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "queued": self._queue.qsize(),
+            }
+
+        if len(latencies):
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            result.update(latency_ms_p50=round(float(p50), 2), latency_ms_p95=round(float(p95), 2),
+                          latency_ms_p99=round(float(p99), 2), latency_ms_max=round(float(latencies.max()), 2))
+        return result
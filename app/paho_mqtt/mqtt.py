@@ -1,7 +1,43 @@
+import hashlib
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
 from loguru import logger
 import paho.mqtt.client as mqtt
 from app.database.db import get_db_session
 from app.paho_mqtt.repositories.water_level_repository import WaterLevelRepository
+from app.paho_mqtt.filters import DeadbandFilter, DedupWindow
+from app.paho_mqtt.ingest import SensorDataWriter
+from app.paho_mqtt.lanes import IngestLane
+from app.paho_mqtt.admission import AdmissionController
+from app.paho_mqtt.anomaly import AnomalyDetector
+from app.paho_mqtt.daily_totals import daily_totals
+from app.paho_mqtt.intake_rates import intake_rates
+from app.paho_mqtt.recent_readings import recent_readings
+from app.paho_mqtt.calibration import CalibrationPersister, calibrator
+from app.paho_mqtt.spill import SpillBuffer
+from app.paho_mqtt.connection import MQTTConnectionManager
+from app.paho_mqtt.config import MQTT_TOPIC, STATE_LANE_QUEUE_SIZE, SAMPLE_LANE_QUEUE_SIZE
+
+# Skips near-identical weight samples from idle bottles
+deadband_filter = DeadbandFilter()
+
+# Drops QoS 1 redeliveries that were already processed
+dedup_window = DedupWindow()
+
+# Per-device rate limits, so one misbehaving device cannot saturate ingest
+admission = AdmissionController()
+
+# Drops out-of-range readings and isolated spikes, and tracks each load cell's health
+anomaly_detector = AnomalyDetector()
+
+# Batches weight samples into bulk inserts, spilling to disk while the database is down
+sensor_data_writer = SensorDataWriter(spill=SpillBuffer())
+
+# Set while the subscriber is running, so it can be stopped from another thread
+_connection: Optional[MQTTConnectionManager] = None
+_calibration_persister: Optional[CalibrationPersister] = None
 
 # Function to handle the subscription event
 def on_subscribe(client, userdata, mid, granted_qos, properties=None):
@@ -10,105 +46,205 @@ def on_subscribe(client, userdata, mid, granted_qos, properties=None):
     except Exception as e:
         logger.error(f"Failed to log subscription event: {e}")
 
-# Function to handle incoming messages
+# Weight samples: tare, dead-band filter, then the batched writer
+def handle_weight(device_ID: str, value: str, seq: Optional[str], received_at: datetime):
+    current_weight = float(value)
+    logger.info(f"Received raw weight (bottle weight included) `{round(current_weight, 1)} gm` from device `{device_ID}`")
+
+    # Faulty samples never reach the tare, the totals or the database
+    if not anomaly_detector.accept(device_ID, current_weight):
+        logger.debug(f"Dropped anomalous reading `{round(current_weight, 1)} gm` from device `{device_ID}`")
+        return
+
+    # Subtract the learned zero offset and empty-bottle weight; every sample refines them, skipped or not
+    weight_difference = calibrator.correct(device_ID, current_weight)
+    if weight_difference is None:
+        raise ValueError(f"Could not find bottle weight for device ID {device_ID}")
+    water = round(weight_difference, 2)
+
+    # Totals count every accepted reading, whether the dead-band stores it or not
+    daily_totals.add(device_ID, water, received_at)
+    intake_rates.add(device_ID, water, received_at)
+
+    # Skip readings within the dead-band of the last stored one, unless the heartbeat is due;
+    # the water weight is compared, so a tare update alone is not a change
+    if not deadband_filter.should_store(device_ID, water):
+        deadband_filter.skip(device_ID, water)
+        logger.debug(f"Skipped reading `{round(weight_difference, 1)} gm` from device `{device_ID}` (within dead-band)")
+        return
+
+    # Queue the water weight for the next bulk insert, with the skipped readings it carries
+    sensor_data_writer.submit(
+        sensor_id=device_ID,
+        data=water,
+        seq=seq,
+        timestamp=received_at,
+        skipped=deadband_filter.take_skipped(device_ID)
+    )
+    deadband_filter.mark_stored(device_ID, water)
+    recent_readings.add(device_ID, water, received_at)
+
+    logger.info(f"Data `{round(weight_difference, 1)} gm` queued for writing for device {device_ID}")
+
+# Pick-up/put-down events: written straight away, they drive `is_bottle_on_dock` and the UI
+def handle_is_picked_up(device_ID: str, value: str):
+    # Convert the value to a boolean where 1 means the bottle is picked up, and 0 means it's on the dock.
+    is_picked_up = bool(int(value))
+
+    # Log the received status
+    logger.info(f"Received 'is_picked_up' status `{is_picked_up}` from device `{device_ID}`")
+
+    # Update the database to reflect the 'is_picked_up' status
+    with get_db_session() as session:
+        repository = WaterLevelRepository(session)
+
+        # Update the bottle's status in the database
+        repository.update_is_bottle_picked(sensor_id=device_ID, is_picked_up=is_picked_up)
+
+    # Always store the first weight reading after a pickup/putdown
+    deadband_filter.forget(device_ID)
+    calibrator.set_on_dock(device_ID, not is_picked_up)
+    anomaly_detector.set_picked_up(device_ID, is_picked_up)
+
+    # Log success when the status is updated
+    logger.success(f"Updated bottle pickup status to `{is_picked_up}` for device {device_ID}")
+
+# State changes get their own lane, so they never wait behind a backlog of weight samples
+state_lane = IngestLane("state", handle_is_picked_up, STATE_LANE_QUEUE_SIZE)
+sample_lane = IngestLane("sample", handle_weight, SAMPLE_LANE_QUEUE_SIZE)
+
+# Function to handle incoming messages: parse, drop duplicates and route to a lane
 def on_message(client, userdata, msg):
     try:
         # Log when a message is received
         message = msg.payload.decode()
-        print(f"Received message: {message}")
+        logger.debug(f"Received message: {message}")
         parts = message.split("|")
 
-        if len(parts) != 3:
+        # "<device_ID>|<data_type>|<value>" with an optional trailing "|<seq>"
+        if len(parts) not in (3, 4):
             raise ValueError(f"Message format is incorrect: {message}")
 
-        device_ID, data_type, value = parts
+        device_ID, data_type, value = parts[:3]
+        seq = parts[3] if len(parts) == 4 else None
 
-        # Check the type of data received (weight or is_picked_up)
-        if data_type == "weight":
-            current_weight = float(value)
-            logger.info(f"Received raw weight (bottle weight included) `{round(current_weight, 1)} gm` from device `{device_ID}`")
-
-            # Add sensor data to the database
-            with get_db_session() as session:
-                repository = WaterLevelRepository(session)
-
-                # Fetch the current bottle weight
-                bottle_weight = repository.get_bottle_weight_by_sensor(device_ID)
-                if bottle_weight is None:
-                    raise ValueError(f"Could not find bottle weight for device ID {device_ID}")
-
-                # Calculate the weight difference and store it in the database
-                weight_difference = current_weight - bottle_weight
-                repository.add_sensor_data(
-                    sensor_id=device_ID,
-                    data=round(weight_difference, 2)
-                )
-
-            # Log success when data is written to the database
-            logger.success(f"Data `{round(weight_difference, 1)} gm` successfully written to the database for device {device_ID}")
-            
-        elif data_type == "is_picked_up":
-            try:
-                # Convert the value to a boolean where 1 means the bottle is picked up, and 0 means it's on the dock.
-                is_picked_up = bool(int(value))
-
-                # Log the received status
-                logger.info(f"Received 'is_picked_up' status `{is_picked_up}` from device `{device_ID}`")
-
-                # Update the database to reflect the 'is_picked_up' status
-                with get_db_session() as session:
-                    repository = WaterLevelRepository(session)
+        # Without a sequence number, only broker redeliveries (DUP flag) are matched by content
+        dedup_key = seq if seq is not None else (hashlib.sha1(msg.payload).hexdigest() if msg.dup else None)
+        if dedup_key is not None and dedup_window.seen(device_ID, dedup_key):
+            logger.debug(f"Dropped duplicate message `{message}` from device `{device_ID}`")
+            return
 
-                    # Update the bottle's status in the database
-                    repository.update_is_bottle_picked(sensor_id=device_ID, is_picked_up=is_picked_up)
+        lanes = {"state": state_lane, "sample": sample_lane}
+        now = time.monotonic()
 
-                # Log success when the status is updated
-                logger.success(f"Updated bottle pickup status to `{is_picked_up}` for device {device_ID}")
-
-            except ValueError as ve:
-                logger.error(f"ValueError while processing 'is_picked_up' status: {ve}")
-            except Exception as e:
-                # Log any exceptions that occur during message handling or database interaction
-                logger.error(f"Failed to process/write to DB message `{msg.payload.decode()}` from topic `{msg.topic}`")
-                logger.exception(f"Error occurred while processing 'is_picked_up' status: {e}")
+        # Over-budget messages held earlier go first once their device has earned a token
+        for kind, args in admission.release_due(now):
+            lanes[kind].submit(*args)
 
+        # Check the type of data received (weight or is_picked_up)
+        if data_type == "weight":
+            kind, args = "sample", (device_ID, value, seq, datetime.utcnow())
+        elif data_type == "is_picked_up":
+            kind, args = "state", (device_ID, value)
         else:
             raise ValueError(f"Unknown data type received: {data_type}")
 
+        if admission.admit(device_ID, kind, args, now):
+            lanes[kind].submit(*args)
+
     except ValueError as ve:
         logger.error(f"ValueError: {ve}")
     except Exception as e:
-        # Log any exceptions that occur during message handling or database interaction
-        logger.error(f"Failed to process/write to DB message `{msg.payload.decode()}` from topic `{msg.topic}`")
+        logger.error(f"Failed to process message `{msg.payload.decode()}` from topic `{msg.topic}`")
         logger.exception(f"Error occurred: {e}")
 
-# Connect to the MQTT broker and continuously receive messages
-def run_subscriber():
+# Counters, queue depth and latency percentiles of each ingest lane
+def get_lane_metrics() -> List[Dict[str, Any]]:
+    return [state_lane.metrics(), sample_lane.metrics()]
+
+# Admission counters, quarantined devices and top offenders
+def get_admission_metrics() -> Dict[str, Any]:
+    return admission.metrics()
+
+# Load-cell health of one device, or of every device seen by this process
+def get_device_health(device_ID: Optional[str] = None, unhealthy_only: bool = False) -> List[Dict[str, Any]]:
+    return anomaly_detector.health(device_ID, unhealthy_only)
+
+# Start the batch writer and connect to the MQTT broker on a daemon thread, reconnecting as needed
+def start_subscriber() -> threading.Thread:
+    global _connection, _calibration_persister, sensor_data_writer, state_lane, sample_lane
+
+    # Start the batch writer before any message can arrive. A writer stopped by an earlier
+    # stop_subscriber cannot be restarted, so it is replaced, keeping its spill buffer.
+    if sensor_data_writer.ident is not None and not sensor_data_writer.is_alive():
+        sensor_data_writer = SensorDataWriter(spill=sensor_data_writer.spill)
+    if not sensor_data_writer.is_alive():
+        sensor_data_writer.start()
+
+    # Lanes are threads too; stopped ones are replaced the same way
+    if state_lane.ident is not None and not state_lane.is_alive():
+        state_lane = IngestLane("state", handle_is_picked_up, STATE_LANE_QUEUE_SIZE)
+        sample_lane = IngestLane("sample", handle_weight, SAMPLE_LANE_QUEUE_SIZE)
+    for lane in (state_lane, sample_lane):
+        if not lane.is_alive():
+            lane.start()
+
+    # Bottle weights and learned tare for every device, so samples need no per-message lookup
     try:
-        broker = "localhost"
-        port = 1883
-        topic = "/weight_change"
-        
-        # Create MQTT client instance
-        client = mqtt.Client("123")
-
-        # Set callbacks for subscription and message handling
-        client.on_subscribe = on_subscribe
-        client.on_message = on_message
-
-        # Connect to the broker
-        client.connect(broker, port)
-
-        # Subscribe to the topic
-        client.subscribe(topic, qos=1)
+        calibrator.load()
+    except Exception as e:
+        logger.error(f"Could not load device calibration: {e}")
+    _calibration_persister = CalibrationPersister(calibrator)
+    _calibration_persister.start()
 
-        # Start the network loop to process incoming messages
-        client.loop_forever()
+    # Running daily totals continue from what is already stored today
+    try:
+        daily_totals.seed()
+    except Exception as e:
+        logger.error(f"Could not seed today's running totals: {e}")
+    intake_rates.start()
 
+    # Recent-window queries are served from memory for everything stored from here on
+    try:
+        recent_readings.seed()
     except Exception as e:
-        logger.error(f"Error in MQTT subscriber: {e}")
-        raise
+        logger.error(f"Could not seed recent readings: {e}")
+        recent_readings.start()
+
+    _connection = MQTTConnectionManager(
+        topics=[(MQTT_TOPIC, 1)],
+        on_message=on_message,
+        on_subscribe=on_subscribe,
+    )
+
+    # Runs until the connection manager is stopped; connection errors are retried, not raised
+    thread = threading.Thread(target=_connection.run_forever, name="mqtt-subscriber", daemon=True)
+    thread.start()
+    return thread
+
+# Stop receiving, then drain the readings already queued for the database
+def stop_subscriber(timeout: Optional[float] = None):
+    global _connection, _calibration_persister
+    if _connection is not None:
+        _connection.stop()
+        _connection = None
+    # Lanes feed the writer, so they are drained first
+    state_lane.stop(timeout)
+    sample_lane.stop(timeout)
+    sensor_data_writer.stop(timeout)
+    # Saves what was learned before another process takes over ingest
+    if _calibration_persister is not None:
+        _calibration_persister.stop(timeout)
+        _calibration_persister = None
+    calibrator.reset()
+    anomaly_detector.reset()
+    # Another process may ingest from now on, so this one can no longer vouch for recent windows
+    recent_readings.reset()
+    intake_rates.reset()
+
+# Receive messages until the process is interrupted
+def run_subscriber():
+    start_subscriber().join()
 
 if __name__ == "__main__":
     run_subscriber()
-
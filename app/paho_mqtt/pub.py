@@ -1,44 +1,23 @@
+import sys
 import time
-import random
-import paho.mqtt.client as mqtt
+from app.paho_mqtt.publisher import CommandPublisher, LED_MODES
 
-# Function to handle the publish event callback
-def on_publish(client, userdata, mid,reason_code, properties):
-    print(f"Message ID {mid} published successfully.")
-
-# Connect to the MQTT broker and continuously publish messages
-def run_publisher():
-    broker = "localhost"
-    port = 1883
-    topic = "/esp32-n2vf7inz/led_mode"
-    
-    # Create MQTT client instance
-    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
-
-    # Set callback for publishing messages
-    client.on_publish = on_publish
-    
-    # Connect to the broker
-    client.connect(broker, port)
-    
-    # Start the network loop in a non-blocking way
-    client.loop_start()
+# Send an LED mode command to a device through the shared command publisher
+# Usage: python -m app.paho_mqtt.pub <device_ID> <mode>
+def run_publisher(sensor_id: str, mode: int):
+    publisher = CommandPublisher()
+    publisher.start()
 
     try:
-        msg_count = 1
-        # Continuously publish messages every 1 second
-        while True:
-            message = f"{3}"
-            result = client.publish(topic, message, qos=1)
-            result.wait_for_publish()  # Ensure the message is published
-            print(f"Published: {message}")
-            msg_count += 1
-            time.sleep(1)
-    except KeyboardInterrupt:
-        print("Stopping publisher...")
+        publisher.send_led_mode(sensor_id, mode)
+        print(f"Queued LED mode {mode} ({LED_MODES[mode]}) for device {sensor_id}")
+        # Give the network loop a moment to connect and deliver the message
+        time.sleep(1)
     finally:
-        client.loop_stop()
-        client.disconnect()
+        publisher.stop()
 
 if __name__ == "__main__":
-    run_publisher()
+    if len(sys.argv) != 3:
+        print("Usage: python -m app.paho_mqtt.pub <device_ID> <mode>")
+        sys.exit(1)
+    run_publisher(sys.argv[1], int(sys.argv[2]))
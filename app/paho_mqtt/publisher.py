@@ -0,0 +1,169 @@
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from loguru import logger
+import paho.mqtt.client as mqtt
+
+from app.paho_mqtt.config import (
+    MQTT_BROKER,
+    MQTT_PORT,
+    MQTT_KEEPALIVE_SECONDS,
+    MQTT_LED_MODE_TOPIC,
+    MQTT_PUBLISHER_CLIENT_ID,
+    MQTT_PUBLISHER_MAX_INFLIGHT,
+    MQTT_RECONNECT_MIN_DELAY_SECONDS,
+    MQTT_RECONNECT_MAX_DELAY_SECONDS,
+    COMMAND_COALESCE_SECONDS,
+)
+
+# LED animation modes understood by the firmware (see `animation_mode` in firmware/src/main.ino)
+LED_MODES = {
+    0: "off",
+    1: "spinner",
+    2: "error",
+    3: "breathing green",
+    4: "breathing blue",
+    5: "breathing red",
+}
+
+
+def led_mode_topic(sensor_id: str) -> str:
+    """
+    Returns the topic a device listens on for LED mode commands, e.g. `/esp32-n2vf7inz/led_mode`.
+    """
+    return f"/{sensor_id}{MQTT_LED_MODE_TOPIC}"
+
+
+class CommandPublisher:
+    """
+    Long-lived, shared MQTT publisher for downlink commands.
+
+    Callers only record the command for a device and return immediately. A sender thread
+    publishes pending commands over one broker connection as QoS 1 without waiting for each
+    PUBACK, so publishes are pipelined up to `MQTT_PUBLISHER_MAX_INFLIGHT`. Commands are
+    coalesced per device: a newer command replaces a pending one, and a command identical to
+    the one sent within the last `COMMAND_COALESCE_SECONDS` is not sent again.
+    """
+
+    def __init__(self, broker: str = MQTT_BROKER, port: int = MQTT_PORT,
+                 client_id: Optional[str] = None, coalesce_seconds: float = COMMAND_COALESCE_SECONDS):
+        self.broker = broker
+        self.port = port
+        self.coalesce_seconds = coalesce_seconds
+        self.published = 0
+        self.coalesced = 0
+
+        self._pending: Dict[str, int] = {}
+        self._last_sent: Dict[str, Tuple[int, float]] = {}
+        self._cond = threading.Condition()
+        self._stop_event = threading.Event()
+        self._sender: Optional[threading.Thread] = None
+
+        self.client = mqtt.Client(client_id=client_id or f"{MQTT_PUBLISHER_CLIENT_ID}-{os.getpid()}")
+        self.client.max_inflight_messages_set(MQTT_PUBLISHER_MAX_INFLIGHT)
+        self.client.reconnect_delay_set(min_delay=MQTT_RECONNECT_MIN_DELAY_SECONDS, max_delay=MQTT_RECONNECT_MAX_DELAY_SECONDS)
+        self.client.on_connect = lambda client, userdata, flags, rc: logger.success(f"Command publisher connected to {self.broker}:{self.port}")
+
+    def start(self) -> None:
+        """
+        Connects to the broker in the background and starts the sender thread.
+        """
+        self.client.connect_async(self.broker, self.port, keepalive=MQTT_KEEPALIVE_SECONDS)
+        self.client.loop_start()
+        self._sender = threading.Thread(target=self._run, name="command-publisher", daemon=True)
+        self._sender.start()
+
+    def stop(self) -> None:
+        """
+        Sends whatever is still pending, then disconnects.
+        """
+        self._stop_event.set()
+        with self._cond:
+            self._cond.notify()
+        if self._sender is not None:
+            self._sender.join(timeout=5)
+        self.client.loop_stop()
+        self.client.disconnect()
+
+    def send_led_mode(self, sensor_id: str, mode: int) -> None:
+        """
+        Queues an LED mode command for a device.
+
+        Args:
+            sensor_id (str): The device to command.
+            mode (int): One of the `LED_MODES`.
+
+        Raises:
+            ValueError: If `mode` is not a known LED mode.
+        """
+        self.send_led_modes({sensor_id: mode})
+
+    def send_led_modes(self, commands: Dict[str, int]) -> None:
+        """
+        Queues LED mode commands for many devices at once.
+
+        Args:
+            commands (Dict[str, int]): Mapping of sensor ID to LED mode.
+
+        Raises:
+            ValueError: If any mode is not a known LED mode.
+        """
+        for mode in set(commands.values()):
+            if mode not in LED_MODES:
+                raise ValueError(f"Unknown LED mode: {mode}")
+
+        with self._cond:
+            self.coalesced += sum(1 for sensor_id in commands if sensor_id in self._pending)
+            self._pending.update(commands)
+            self._cond.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending and not self._stop_event.is_set():
+                    self._cond.wait()
+                pending, self._pending = self._pending, {}
+
+            now = time.monotonic()
+            for sensor_id, mode in pending.items():
+                last = self._last_sent.get(sensor_id)
+                if last is not None and last[0] == mode and now - last[1] < self.coalesce_seconds:
+                    self.coalesced += 1
+                    continue
+
+                # Not waiting for the PUBACK keeps many publishes in flight on one connection
+                self.client.publish(led_mode_topic(sensor_id), str(mode), qos=1)
+                self._last_sent[sensor_id] = (mode, now)
+                self.published += 1
+
+            if self._stop_event.is_set():
+                return
+
+
+_publisher: Optional[CommandPublisher] = None
+_publisher_lock = threading.Lock()
+
+
+def get_command_publisher() -> CommandPublisher:
+    """
+    Returns the process-wide command publisher, starting it on first use.
+    """
+    global _publisher
+    with _publisher_lock:
+        if _publisher is None:
+            _publisher = CommandPublisher()
+            _publisher.start()
+        return _publisher
+
+
+def stop_command_publisher() -> None:
+    """
+    Flushes and disconnects the process-wide command publisher, if it was started.
+    """
+    global _publisher
+    with _publisher_lock:
+        if _publisher is not None:
+            _publisher.stop()
+            _publisher = None
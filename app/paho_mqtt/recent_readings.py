@@ -0,0 +1,160 @@
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from app.database.db import get_db_session
+from app.paho_mqtt.config import RECENT_BUFFER_CAPACITY, RECENT_SEED_HOURS
+from app.paho_mqtt.repositories.water_level_repository import WaterLevelRepository
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _to_epoch(timestamp: datetime) -> float:
+    return (timestamp - _EPOCH).total_seconds()
+
+
+class DeviceBuffer:
+    """
+    Fixed-size ring of one device's most recent stored readings.
+    """
+    __slots__ = ("timestamps", "values", "head", "count", "evicted_until")
+
+    def __init__(self, capacity: int):
+        self.timestamps = np.empty(capacity, dtype=np.float64)
+        self.values = np.empty(capacity, dtype=np.float64)
+        self.head = 0                # Slot the next reading is written to
+        self.count = 0
+        self.evicted_until = None    # Timestamp of the newest reading overwritten so far
+
+    def append(self, timestamp: float, value: float) -> None:
+        capacity = len(self.timestamps)
+        if self.count == capacity:
+            self.evicted_until = self.timestamps[self.head]
+        else:
+            self.count += 1
+        self.timestamps[self.head] = timestamp
+        self.values[self.head] = value
+        self.head = (self.head + 1) % capacity
+
+    def ordered(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns copies of the buffered timestamps and values, oldest first.
+        """
+        if self.count < len(self.timestamps):
+            return self.timestamps[:self.count].copy(), self.values[:self.count].copy()
+        return np.roll(self.timestamps, -self.head), np.roll(self.values, -self.head)
+
+
+class RecentReadings:
+    """
+    Per-device ring buffers of the readings handed to the writer, fed by the MQTT ingest.
+
+    A window [since, until) is served from memory only if the buffer is known to hold every
+    reading stored since `since`: ingest must have been running (or seeded) since then, and
+    the device's ring must not have overwritten anything newer. Otherwise callers fall back
+    to the database. Buffers only fill in the process that runs ingest; everywhere else
+    every lookup falls back.
+
+    Memory is bounded by `capacity` readings per device, see `RECENT_BUFFER_CAPACITY`.
+    """
+
+    def __init__(self, capacity: int = RECENT_BUFFER_CAPACITY):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._buffers: Dict[str, DeviceBuffer] = {}
+        # Every reading stored since this instant went through `add`; None while not ingesting
+        self._complete_since: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def start(self, now: Optional[datetime] = None) -> None:
+        """
+        Marks the start of ingest; readings from now on are complete.
+        """
+        with self._lock:
+            if self._complete_since is None:
+                self._complete_since = _to_epoch(now or datetime.utcnow())
+
+    def seed(self, hours: float = RECENT_SEED_HOURS) -> None:
+        """
+        Loads the last `hours` of stored readings, so windows starting after that are complete from the start.
+        """
+        now = datetime.utcnow()
+        since = now - timedelta(hours=hours)
+        with get_db_session() as session:
+            rows = WaterLevelRepository(session).get_readings_between(since, now)
+
+        with self._lock:
+            self._buffers.clear()
+            for sensor_id, timestamp, data in rows:
+                self.__append(sensor_id, _to_epoch(timestamp), float(data))
+            self._complete_since = _to_epoch(since)
+        logger.info(f"Seeded recent readings with {len(rows)} rows for {len(self._buffers)} devices")
+
+    def reset(self) -> None:
+        """
+        Drops every buffer; lookups fall back to the database until `start` or `seed` is called again.
+        """
+        with self._lock:
+            self._buffers.clear()
+            self._complete_since = None
+
+    def add(self, sensor_id: str, value: float, timestamp: datetime) -> None:
+        """
+        Records a reading that was handed to the writer.
+        """
+        with self._lock:
+            if self._complete_since is not None:
+                self.__append(sensor_id, _to_epoch(timestamp), value)
+
+    def __append(self, sensor_id: str, timestamp: float, value: float) -> None:
+        buffer = self._buffers.get(sensor_id)
+        if buffer is None:
+            buffer = self._buffers[sensor_id] = DeviceBuffer(self.capacity)
+        buffer.append(timestamp, value)
+
+    def get_window(self, sensor_id: str, since: datetime, until: datetime) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Returns a device's readings in [since, until), if the buffer holds all of them.
+
+        Args:
+            sensor_id (str): The device.
+            since (datetime): Lower bound (inclusive, naive UTC).
+            until (datetime): Upper bound (exclusive, naive UTC).
+
+        Returns:
+            Optional[Tuple[np.ndarray, np.ndarray]]: Epoch-second timestamps and values in time
+            order, or None if the window is not fully covered.
+        """
+        start, end = _to_epoch(since), _to_epoch(until)
+        with self._lock:
+            buffer = self._buffers.get(sensor_id)
+            covered = self._complete_since is not None and start >= self._complete_since and \
+                (buffer is None or buffer.evicted_until is None or start > buffer.evicted_until)
+            if not covered:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if buffer is None:
+                return np.empty(0), np.empty(0)
+            ts, values = buffer.ordered()
+
+        lo, hi = np.searchsorted(ts, [start, end], side="left")
+        return ts[lo:hi], values[lo:hi]
+
+    def get_latest(self, sensor_id: str) -> Optional[float]:
+        """
+        Returns the device's most recent buffered reading, or None if there is none in memory.
+        """
+        with self._lock:
+            buffer = self._buffers.get(sensor_id)
+            if buffer is None or buffer.count == 0:
+                return None
+            return float(buffer.values[buffer.head - 1])
+
+
+# Filled by the MQTT ingest, read by the API
+recent_readings = RecentReadings()
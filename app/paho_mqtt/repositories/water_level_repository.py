@@ -1,9 +1,23 @@
-from typing import Optional, List, Union
-from app.database.models import SensorData, Users
+import heapq
+from contextlib import nullcontext
+from operator import itemgetter
+from typing import Optional, List, Union, Dict, Any, Set, Tuple
+from app.database.models import DeviceCalibration, SensorData, SensorDataDedup, Users
+from app.database.sharding import ShardWriteError, group_by_shard, run_on_shards, scatter, shard_for, shard_session, sharding_enabled
 from datetime import datetime
+from sqlalchemy import insert, func, cast, tuple_, Float
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session
 
 class WaterLevelRepository:
+    """
+    User and calibration rows are always read and written through `db_session` (the primary).
+    Sensor tables are routed by `app.database.sharding`: while sharding is off they also use
+    `db_session`; otherwise writes go to each device's shard and fleet-wide reads are
+    scatter-gathered across all shards in parallel.
+    """
+
     def __init__(self, db_session: Session):
         """
         Initializes the WaterLevelRepository with a database session.
@@ -27,16 +41,173 @@ class WaterLevelRepository:
             data=data,
             timestamp=datetime.utcnow()
         )
-        self.db_session.add(new_data)
-        self.db_session.commit()
+        with shard_session(shard_for(sensor_id)) if sharding_enabled() else nullcontext(self.db_session) as session:
+            session.add(new_data)
+            session.commit()
+
+    def add_sensor_data_bulk(self, rows: List[Dict[str, Any]]) -> int:
+        """
+        Adds a batch of sensor readings in a single transaction, skipping redelivered messages.
+
+        Rows carrying a `seq` are first claimed in the `sensor_data_dedup` ledger; only the
+        pairs that were newly claimed are written to `sensor_data_1`. Rows without a `seq`
+        (older firmware) are always written.
+
+        With sharding on, the batch is split by shard and each part is written to its shard in
+        its own transaction, all shards in parallel.
+
+        Args:
+            rows (List[Dict[str, Any]]): Readings with the keys `sensor_id`, `data`, `timestamp`
+                and optionally `seq`.
+
+        Returns:
+            int: The number of readings actually written.
+
+        Raises:
+            ShardWriteError: If some shards failed; it carries their rows, the other shards committed.
+        """
+        if not sharding_enabled():
+            return self.__write_batch(self.db_session, rows)
+
+        groups = group_by_shard(rows, itemgetter("sensor_id"))
+        results = run_on_shards({name: self.__shard_writer(name, group) for name, group in groups.items()})
+        errors = {name: result for name, result in results.items() if isinstance(result, Exception)}
+        written = sum(result for result in results.values() if not isinstance(result, Exception))
+        if errors:
+            raise ShardWriteError([row for name in errors for row in groups[name]], written, errors)
+        return written
+
+    def __shard_writer(self, name: str, rows: List[Dict[str, Any]]):
+        def write() -> int:
+            with shard_session(name) as session:
+                return self.__write_batch(session, rows)
+        return write
+
+    def __write_batch(self, session: Session, rows: List[Dict[str, Any]]) -> int:
+        fresh = [row for row in rows if row.get("seq") is None]
+
+        # Collapse duplicates inside the batch itself before claiming them in the ledger
+        sequenced = {(row["sensor_id"], row["seq"]): row for row in rows if row.get("seq") is not None}
+        if sequenced:
+            claimed = self.__claim_sequences(session, sequenced)
+            fresh.extend(row for key, row in sequenced.items() if key in claimed)
+
+        if fresh:
+            session.execute(insert(SensorData), [
+                {"sensor_id": row["sensor_id"], "data": row["data"], "timestamp": row["timestamp"], "seq": row.get("seq"),
+                 "skipped_data": row.get("skipped_data")}
+                for row in fresh
+            ])
+        session.commit()
+        return len(fresh)
+
+    def __claim_sequences(self, session: Session, sequenced: Dict[Tuple[str, str], Dict[str, Any]]) -> Set[Tuple[str, str]]:
+        """
+        Inserts (sensor_id, seq) pairs into the dedup ledger and returns the ones that were not there yet.
+        """
+        ledger_rows = [
+            {"sensor_id": sensor_id, "seq": seq, "received_at": row["timestamp"]}
+            for (sensor_id, seq), row in sequenced.items()
+        ]
+
+        if session.get_bind().dialect.name == "postgresql":
+            # Atomic against concurrent writers
+            claim = pg_insert(SensorDataDedup)\
+                .values(ledger_rows)\
+                .on_conflict_do_nothing()\
+                .returning(SensorDataDedup.sensor_id, SensorDataDedup.seq)
+            return {tuple(key) for key in session.execute(claim)}
+
+        # Embedded mode has a single writer thread, so look up, then insert the rest
+        known = session.query(SensorDataDedup.sensor_id, SensorDataDedup.seq)\
+            .filter(tuple_(SensorDataDedup.sensor_id, SensorDataDedup.seq).in_(list(sequenced)))\
+            .all()
+        claimed = set(sequenced) - {tuple(key) for key in known}
+        if claimed:
+            session.execute(insert(SensorDataDedup), [row for row in ledger_rows if (row["sensor_id"], row["seq"]) in claimed])
+        return claimed
 
     def get_all_sensor_data(self) -> List[SensorData]:
         """
-        Retrieves all sensor data from the database.
+        Retrieves all sensor data from the database, across every shard.
         Returns:
             List[SensorData]: A list of all sensor data records in the database.
         """
-        return self.db_session.query(SensorData).all()
+        results = scatter(lambda session, _: session.query(SensorData).all(), self.db_session)
+        return [entry for entries in results.values() for entry in entries]
+
+    def get_readings_between(self, since: datetime, until: datetime) -> List[Tuple[str, datetime, str]]:
+        """
+        Fetches every device's readings in a time range, in one query per shard.
+
+        Args:
+            since (datetime): Lower bound (inclusive) on the reading timestamp.
+            until (datetime): Upper bound (exclusive) on the reading timestamp.
+
+        Returns:
+            List[Tuple[str, datetime, str]]: (sensor_id, timestamp, data) rows ordered by sensor and time.
+        """
+        def readings(session, _) -> List[Tuple[str, datetime, str]]:
+            return session.query(SensorData.sensor_id, SensorData.timestamp, SensorData.data)\
+                .filter(SensorData.timestamp >= since, SensorData.timestamp < until)\
+                .filter(SensorData.sensor_id.isnot(None))\
+                .order_by(SensorData.sensor_id, SensorData.timestamp)\
+                .all()
+
+        results = list(scatter(readings, self.db_session).values())
+        if len(results) == 1:
+            return results[0]
+        return list(heapq.merge(*results, key=itemgetter(0, 1)))
+
+    def get_totals_between(self, since: datetime, until: datetime, timezone: Optional[str] = None) -> Dict[str, float]:
+        """
+        Sums the recorded data of every sensor in a time range, readings skipped by the dead-band
+        included, in one aggregate query per shard.
+
+        Args:
+            since (datetime): Lower bound (inclusive) on the reading timestamp.
+            until (datetime): Upper bound (exclusive) on the reading timestamp.
+            timezone (Optional[str]): If given, only sensors of users in this timezone
+                (users without a timezone count as 'UTC').
+
+        Returns:
+            Dict[str, float]: A mapping of sensor ID to the sum of its readings.
+        """
+        query = self.db_session.query(SensorData.sensor_id, func.sum(cast(SensorData.data, Float) + func.coalesce(SensorData.skipped_data, 0)))\
+            .filter(SensorData.timestamp >= since, SensorData.timestamp < until)
+        if not sharding_enabled():
+            if timezone is not None:
+                query = query.join(Users, Users.sensor_id == SensorData.sensor_id)\
+                    .filter(func.coalesce(Users.timezone, 'UTC') == timezone)
+            rows = query.group_by(SensorData.sensor_id).all()
+            return {sensor_id: float(total or 0.0) for sensor_id, total in rows if sensor_id is not None}
+
+        # Users live on the primary, so the timezone filter becomes a list of devices per shard
+        sensors = None
+        if timezone is not None:
+            in_timezone = self.db_session.query(Users.sensor_id)\
+                .filter(func.coalesce(Users.timezone, 'UTC') == timezone, Users.sensor_id.isnot(None))
+            sensors = group_by_shard((sensor_id for sensor_id, in in_timezone), str)
+            if not sensors:
+                return {}
+
+        def totals(session, shard: str) -> List[Tuple[str, float]]:
+            shard_query = query.with_session(session)
+            if sensors is not None:
+                shard_query = shard_query.filter(SensorData.sensor_id.in_(sensors[shard]))
+            return shard_query.group_by(SensorData.sensor_id).all()
+
+        results = scatter(totals, self.db_session, None if sensors is None else list(sensors))
+        return {sensor_id: float(total or 0.0) for rows in results.values() for sensor_id, total in rows if sensor_id is not None}
+
+    def get_sensor_timezones(self) -> Dict[str, Optional[str]]:
+        """
+        Fetches the timezone of every user's sensor in one query.
+
+        Returns:
+            Dict[str, Optional[str]]: A mapping of sensor ID to IANA timezone name (None means UTC).
+        """
+        return {sensor_id: timezone for sensor_id, timezone in self.db_session.query(Users.sensor_id, Users.timezone).all()}
 
     def get_bottle_weight_by_sensor(self, sensor_id: str) -> int:
         """
@@ -75,3 +246,39 @@ class WaterLevelRepository:
             self.db_session.commit()
         else:
             raise ValueError(f"User not found with the given sensor ID: {sensor_id}")
+
+    def get_calibration_profiles(self, sensor_id: Optional[str] = None) -> List[Tuple[str, Optional[int], Optional[int], Optional[float], Optional[float], Optional[bool]]]:
+        """
+        Fetches every user's (or one device's) bottle weight and dock state with the device's saved calibration, in one query.
+
+        Returns:
+            List[Tuple]: Rows of (sensor_id, bottle_weight, calibrated bottle_weight, zero_offset, empty_weight,
+            is_bottle_on_dock); the calibration columns are None for a device that was never calibrated.
+        """
+        query = self.db_session.query(Users.sensor_id, Users.bottle_weight, DeviceCalibration.bottle_weight,
+                                      DeviceCalibration.zero_offset, DeviceCalibration.empty_weight, Users.is_bottle_on_dock)\
+            .outerjoin(DeviceCalibration, DeviceCalibration.sensor_id == Users.sensor_id)\
+            .filter(Users.sensor_id.isnot(None))
+        if sensor_id is not None:
+            query = query.filter(Users.sensor_id == sensor_id)
+        return query.all()
+
+    def save_calibrations(self, rows: List[Dict[str, Any]]) -> None:
+        """
+        Inserts or updates learned device calibrations and commits.
+
+        Args:
+            rows (List[Dict[str, Any]]): Rows with the keys `sensor_id`, `bottle_weight`, `zero_offset` and `empty_weight`.
+        """
+        if not rows:
+            return
+        now = datetime.utcnow()
+        rows = [dict(row, updated_at=now) for row in rows]
+        upsert = pg_insert if self.db_session.get_bind().dialect.name == "postgresql" else sqlite_insert
+        statement = upsert(DeviceCalibration).values(rows)
+        statement = statement.on_conflict_do_update(
+            index_elements=[DeviceCalibration.sensor_id],
+            set_={column: statement.excluded[column] for column in ("bottle_weight", "zero_offset", "empty_weight", "updated_at")},
+        )
+        self.db_session.execute(statement)
+        self.db_session.commit()
@@ -0,0 +1,133 @@
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+
+from loguru import logger
+
+from app.paho_mqtt.config import SPILL_PATH, SPILL_MAX_BYTES, SPILL_REPLAY_BATCH_SIZE
+
+
+class SpillBuffer:
+    """
+    Bounded, append-only on-disk buffer for readings that could not be written to the database.
+
+    Rows are appended as NDJSON. On replay the file is moved aside (new spills go to a fresh
+    file) and read back in large batches; the read offset is persisted after every successful
+    batch, so a failure part-way through resumes where it stopped instead of re-inserting rows.
+    """
+
+    def __init__(self, path: str = SPILL_PATH, max_bytes: int = SPILL_MAX_BYTES):
+        self.path = path
+        self.replay_path = f"{path}.replay"
+        self.offset_path = f"{path}.offset"
+        self.max_bytes = max_bytes
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._size = os.path.getsize(path) if os.path.exists(path) else 0
+
+    def pending(self) -> bool:
+        """
+        Returns True if there are spilled rows waiting to be replayed.
+        """
+        return self._size > 0 or os.path.exists(self.replay_path)
+
+    def append(self, rows: List[Dict[str, Any]]) -> int:
+        """
+        Appends rows to the spill file, dropping those that would exceed `max_bytes`.
+
+        Args:
+            rows (List[Dict[str, Any]]): Readings as queued by `SensorDataWriter`.
+
+        Returns:
+            int: The number of rows spilled.
+        """
+        lines = [json.dumps(row, default=_encode) + "\n" for row in rows]
+        with self._lock:
+            kept = []
+            for line in lines:
+                if self._size + len(line) > self.max_bytes:
+                    break
+                kept.append(line)
+                self._size += len(line)
+
+            if kept:
+                # Created on the first spill rather than at import
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.path, "a") as f:
+                    f.writelines(kept)
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            if len(kept) < len(lines):
+                self.dropped += len(lines) - len(kept)
+                logger.warning(f"Spill buffer full, dropped {len(lines) - len(kept)} readings ({self.dropped} in total)")
+        return len(kept)
+
+    def replay(self, write: Callable[[List[Dict[str, Any]]], Any], batch_size: int = SPILL_REPLAY_BATCH_SIZE) -> int:
+        """
+        Replays spilled rows through `write` in batches of `batch_size`.
+
+        Args:
+            write (Callable): Writes one batch; any exception stops the replay and keeps the rest.
+            batch_size (int): Number of rows per batch.
+
+        Returns:
+            int: The number of rows replayed.
+        """
+        replayed = 0
+        while self.pending():
+            replayed += self._replay_file(write, batch_size)
+        return replayed
+
+    def _replay_file(self, write: Callable[[List[Dict[str, Any]]], Any], batch_size: int) -> int:
+        with self._lock:
+            if not os.path.exists(self.replay_path):
+                os.replace(self.path, self.replay_path)
+                self._size = 0
+
+        offset = 0
+        if os.path.exists(self.offset_path):
+            with open(self.offset_path) as f:
+                offset = int(f.read() or 0)
+
+        replayed = 0
+        with open(self.replay_path) as f:
+            f.seek(offset)
+            while True:
+                lines = []
+                for _ in range(batch_size):
+                    line = f.readline()
+                    if not line:
+                        break
+                    lines.append(line)
+                if not lines:
+                    break
+
+                write([json.loads(line, object_hook=_decode) for line in lines])
+                replayed += len(lines)
+                self._save_offset(f.tell())
+
+        os.remove(self.replay_path)
+        if os.path.exists(self.offset_path):
+            os.remove(self.offset_path)
+        return replayed
+
+    def _save_offset(self, offset: int) -> None:
+        with open(self.offset_path, "w") as f:
+            f.write(str(offset))
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    raise TypeError(f"Cannot spill value of type {type(value).__name__}")
+
+
+def _decode(obj):
+    if "__datetime__" in obj:
+        return datetime.fromisoformat(obj["__datetime__"])
+    return obj
@@ -0,0 +1,193 @@
+import hmac
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+# Requests carrying this value in the `X-Profile-Token` header are profiled; unset disables profiling entirely
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN")
+PROFILING_OUTPUT_DIR = os.getenv("PROFILING_OUTPUT_DIR", "profiles")
+PROFILING_INTERVAL_SECONDS = 0.005          # Time between two stack samples
+PROFILING_MAX_INGEST_SECONDS = 300          # Longest ingest capture one request may ask for
+PROFILING_FORMATS = ("speedscope", "folded")
+
+# Threads sampled by an ingest capture: broker callbacks (`on_message`), both lanes and the batch writer
+INGEST_THREAD_NAMES = ("mqtt-subscriber", "ingest-state-lane", "ingest-sample-lane", "sensor-data-writer")
+
+# (function, file, first line) of one frame, outermost first within a stack
+Frame = Tuple[str, str, int]
+
+
+class SamplingProfiler(threading.Thread):
+    """
+    Statistical profiler that samples the Python stacks of chosen threads from a side thread.
+
+    Every `interval` seconds the current frame of each target thread is read through
+    `sys._current_frames()` and its stack counted. The target threads run unmodified, so the
+    cost is bounded by the sampling rate and nothing is paid while no profiler is running.
+    """
+
+    def __init__(self, thread_ids: Iterable[int], interval: float = PROFILING_INTERVAL_SECONDS):
+        super().__init__(name="sampling-profiler", daemon=True)
+        self.thread_ids = set(thread_ids)
+        self.interval = interval
+        self.started_at: Optional[float] = None
+        self.duration = 0.0
+        # thread ID -> stack -> samples
+        self._stacks: Dict[int, Counter] = {thread_id: Counter() for thread_id in self.thread_ids}
+        self._stop_event = threading.Event()
+
+    def run(self):
+        self.started_at = time.perf_counter()
+        while not self._stop_event.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id in self.thread_ids:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self._stacks[thread_id][_stack(frame)] += 1
+        self.duration = time.perf_counter() - self.started_at
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+
+    def write(self, name: str, file_format: str = "speedscope") -> str:
+        """
+        Writes the collected samples under `PROFILING_OUTPUT_DIR` and returns the file's path.
+
+        "speedscope" writes a file for https://www.speedscope.app with one profile per thread;
+        "folded" writes collapsed stacks ("a;b;c 12") for flamegraph.pl and compatible tools.
+        """
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        safe_name = re.sub(r"[^A-Za-z0-9_.-]+", "_", name).strip("_") or "profile"
+        extension = "speedscope.json" if file_format == "speedscope" else "folded.txt"
+        os.makedirs(PROFILING_OUTPUT_DIR, exist_ok=True)
+        path = os.path.join(PROFILING_OUTPUT_DIR, f"{datetime.utcnow():%Y%m%dT%H%M%S%f}-{safe_name}.{extension}")
+
+        with open(path, "w") as f:
+            if file_format == "speedscope":
+                json.dump(self._speedscope(name, thread_names), f)
+            else:
+                for thread_id, stacks in self._stacks.items():
+                    thread_name = thread_names.get(thread_id, str(thread_id))
+                    for stack, samples in stacks.items():
+                        f.write(";".join([thread_name] + [f"{function} ({file}:{line})" for function, file, line in stack]))
+                        f.write(f" {samples}\n")
+
+        samples = sum(sum(stacks.values()) for stacks in self._stacks.values())
+        logger.info(f"Wrote profile `{path}`: {samples} samples over {self.duration:.2f} s")
+        return path
+
+    def _speedscope(self, name: str, thread_names: Dict[int, str]) -> Dict[str, object]:
+        frame_index: Dict[Frame, int] = {}
+        profiles = []
+        for thread_id, stacks in self._stacks.items():
+            samples: List[List[int]] = []
+            weights: List[float] = []
+            for stack, count in stacks.items():
+                samples.append([frame_index.setdefault(frame, len(frame_index)) for frame in stack])
+                weights.append(count * self.interval)
+            profiles.append({
+                "type": "sampled",
+                "name": thread_names.get(thread_id, str(thread_id)),
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            })
+
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "app.profiling",
+            "shared": {"frames": [{"name": function, "file": file, "line": line} for function, file, line in frame_index]},
+            "profiles": profiles,
+        }
+
+
+def _stack(frame) -> Tuple[Frame, ...]:
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+
+def is_authorized(token: Optional[str]) -> bool:
+    """
+    Returns True if profiling is enabled and `token` matches `PROFILING_TOKEN`.
+    """
+    return bool(PROFILING_TOKEN) and token is not None and hmac.compare_digest(token, PROFILING_TOKEN)
+
+
+async def profile_requests(request, call_next):
+    """
+    HTTP middleware profiling the requests that carry a valid `X-Profile-Token` header.
+
+    The event loop thread that runs the handler is sampled until the response is ready, and
+    the output path is returned in the `X-Profile-Output` header. `X-Profile-Format` selects
+    "speedscope" (default) or "folded". Other requests handled concurrently on the same loop
+    show up in the same profile. Only installed while `PROFILING_TOKEN` is set.
+    """
+    if not is_authorized(request.headers.get("x-profile-token")):
+        return await call_next(request)
+
+    file_format = request.headers.get("x-profile-format", "speedscope")
+    if file_format not in PROFILING_FORMATS:
+        file_format = "speedscope"
+
+    profiler = SamplingProfiler([threading.get_ident()])
+    profiler.start()
+    try:
+        response = await call_next(request)
+    finally:
+        profiler.stop()
+    response.headers["X-Profile-Output"] = profiler.write(f"{request.method}-{request.url.path}", file_format)
+    return response
+
+
+_ingest_profiler: Optional[SamplingProfiler] = None
+_ingest_lock = threading.Lock()
+
+
+def profile_ingest(seconds: float, file_format: str = "speedscope") -> List[str]:
+    """
+    Samples the ingest threads of this process for `seconds` in the background and then writes
+    the profile.
+
+    Returns:
+        List[str]: The names of the threads being sampled.
+
+    Raises:
+        ValueError: If no ingest thread runs in this process (it is not the leader).
+        RuntimeError: If an ingest capture is already running.
+    """
+    global _ingest_profiler
+    threads = [thread for thread in threading.enumerate() if thread.name in INGEST_THREAD_NAMES]
+    if not threads:
+        raise ValueError("Ingest is not running in this process")
+
+    with _ingest_lock:
+        if _ingest_profiler is not None and _ingest_profiler.is_alive():
+            raise RuntimeError("An ingest profile is already being captured")
+        profiler = _ingest_profiler = SamplingProfiler(thread.ident for thread in threads)
+        profiler.start()
+
+    def finish():
+        time.sleep(seconds)
+        profiler.stop()
+        profiler.write("ingest", file_format)
+
+    threading.Thread(target=finish, name="ingest-profile-writer", daemon=True).start()
+    return [thread.name for thread in threads]
@@ -1,21 +1,24 @@
+from tempfile import SpooledTemporaryFile
 from typing import List, Optional, Dict
 from sqlalchemy import Float
-from sqlalchemy.orm import sessionmaker, Session
-from fastapi import HTTPException, Depends, APIRouter
+from sqlalchemy.orm import Session
+from fastapi import HTTPException, Depends, APIRouter, Query, Request, Header
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 
-from app.database.db import engine
+from app.database.db import get_db, get_read_db
 from app.server.User.service.user_service import UserService
-
-# Set up a sessionmaker
-SessionLocal = sessionmaker(bind=engine)
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+from app.server.User.service.downsampling import DOWNSAMPLING_MODES
+from app.server.User.service.fleet_service import FleetService
+from app.server.User.service.forecast_service import ForecastService
+from app.server.User.service.provisioning_service import PROVISIONING_FORMATS, ProvisioningService
+from app.server.User.config import LOCF_MAX_POINTS, PROVISIONING_SPOOL_BYTES
+from app.server.Analytics.config import ANALYTICS_REPORT_WEEKS
+from app.server.Analytics.service.analytics_service import AnalyticsService
+from app.server.Recommendation.service.recommendation_service import RecommendationService
+from app.paho_mqtt.publisher import LED_MODES
+from app.paho_mqtt.mqtt import get_lane_metrics, get_admission_metrics, get_device_health, admission
+from app.profiling import PROFILING_FORMATS, PROFILING_MAX_INGEST_SECONDS, is_authorized, profile_ingest
 
 # Create an APIRouter to manage all routes
 router = APIRouter()
@@ -35,11 +38,123 @@ class UserInfo(BaseModel):
     gender: Optional[str] = None
     currect_water_level_in_bottle: Optional[int] = None  
     is_bottle_on_dock: Optional[bool] = None  
+    timezone: Optional[str] = None
 
 class WaterIntake(BaseModel):
     timestamp: str
     data: float
 
+class UserAnalyticsReport(BaseModel):
+    computed_at: str
+    last_day: str  # Last completed local day included
+    days_tracked: int
+    current_streak: int
+    longest_streak: int
+    goal_met_days_7d: int
+    goal_met_days_30d: int
+    attainment_7d: Optional[float] = None  # Mean share of the daily goal reached; None without a goal
+    attainment_30d: Optional[float] = None
+    avg_intake_7d: float
+    avg_intake_prev_7d: float
+    trend_30d: float  # Change of the daily total per day
+
+class WeeklyIntake(BaseModel):
+    week_start: str
+    total_intake: float
+    days_tracked: int
+    goal_met_days: int
+
+class IntakeForecast(BaseModel):
+    daily_goal: int
+    goal_source: str  # "user", or "recommended" when the user has not set a goal
+    total_today: float
+    expected_by_now: float  # Intake the pace curve expects by now
+    rate_per_hour: float  # Projection rate: recent rate blended with today's average
+    recent_rate_per_hour: Optional[float] = None  # Exponentially weighted rate; only known to the ingesting process
+    projected_total: float  # Total expected by sleep time at the projection rate
+    goal_reached: bool
+    on_track: bool  # The goal is (or will be) reached before sleep time
+    eta: Optional[str] = None  # Local 'HH:MM' the goal is projected to be reached, if before sleep time
+    sleep_time: str  # Local 'HH:MM' end of the current waking window
+    source: str  # "live" (ingest state in memory) or "database"
+
+class PacePoint(BaseModel):
+    time: str  # Local clock time, 'HH:MM'
+    target: int  # Cumulative intake (ml) that should be reached by then
+
+class GoalRecommendation(BaseModel):
+    daily_goal: int
+    basis: str  # What the goal was derived from: "weight", "height", "gender" or "default"
+    pace: List[PacePoint]  # From wakeup to sleep time
+
+class FleetLedMode(BaseModel):
+    mode: int
+    user_ids: Optional[List[int]] = None  # None commands every user's dock
+
+class FleetCommandResult(BaseModel):
+    devices: int
+    missing_user_ids: List[int]
+
+class ProvisioningError(BaseModel):
+    line: Optional[int] = None  # Line of the file the row ends on
+    sensor_id: Optional[str] = None
+    error: str
+
+class ProvisioningReport(BaseModel):
+    inserted: int
+    updated: int
+    failed: int
+    errors: List[ProvisioningError]
+
+class AdmissionMetrics(BaseModel):
+    policy: str
+    rate_per_second: float
+    burst: float
+    devices: int
+    admitted: int
+    rejected: int
+    held: int
+    held_pending: int
+    released: int
+    quarantine_drops: int
+    quarantined: Dict[str, float]  # Device ID -> seconds of quarantine left
+    top_offenders: Dict[str, int]  # Device ID -> over-budget messages
+
+class DeviceHealth(BaseModel):
+    device_id: str
+    status: str  # "ok" or "faulty"
+    issues: List[str]  # Any of "stuck_weight", "stuck_picked_up", "noisy", "spiking"
+    samples: int
+    out_of_range: int  # Dropped samples outside the plausible raw range
+    spikes: int  # Dropped isolated spikes
+    noise_gm: float  # Scaled MAD of the recent samples
+    median_gm: Optional[float] = None  # Rolling median of the recent raw samples
+    seconds_since_seen: float
+
+class LaneMetrics(BaseModel):
+    lane: str
+    processed: int
+    dropped: int
+    failed: int
+    queued: int
+    latency_ms_p50: Optional[float] = None  # Receive-to-applied latency over recent messages
+    latency_ms_p95: Optional[float] = None
+    latency_ms_p99: Optional[float] = None
+    latency_ms_max: Optional[float] = None
+
+# Query parameters shared by the history endpoints
+POINTS_QUERY = Query(None, ge=3, le=5000, description="Downsample the series to at most this many points")
+MODE_QUERY = Query("lttb", regex=f"^({'|'.join(DOWNSAMPLING_MODES)})$", description="Downsampling mode used with `points`")
+STEP_QUERY = Query(None, ge=1, description="Rebuild a regular series with this spacing in seconds (last observation carried forward)")
+
+
+def check_step(step: Optional[int], window_seconds: int) -> None:
+    """
+    Rejects a `step` that would rebuild more than `LOCF_MAX_POINTS` grid points over the window.
+    """
+    if step is not None and window_seconds / step > LOCF_MAX_POINTS:
+        raise HTTPException(status_code=422, detail=f"step must be at least {-(-window_seconds // LOCF_MAX_POINTS)} seconds for this window")
+
 # Group all API endpoints under /api/v1 prefix
 @router.get("/api/v1/user/{user_id}", response_model=UserInfo)
 async def get_user_info(user_id: int, db: Session = Depends(get_db)):
@@ -57,12 +172,15 @@ async def get_user_info(user_id: int, db: Session = Depends(get_db)):
 
 ### Water Intake Related APIs ###
 @router.get("/api/v1/user/{user_id}/today-water-intake", response_model=List[WaterIntake])
-async def get_today_water_intake(user_id: int, db: Session = Depends(get_db)):
+async def get_today_water_intake(user_id: int, points: Optional[int] = POINTS_QUERY, mode: str = MODE_QUERY, step: Optional[int] = STEP_QUERY, db: Session = Depends(get_db), read_db: Session = Depends(get_read_db)):
     """
     Fetches today's water intake data for the given user ID.
+    Pass `points` to receive a server-side decimated series of constant size, and `step`
+    to fill the gaps left by the ingest dead-band filter.
     """
-    user_service = UserService(db, user_id=user_id)
-    today_water_intake = user_service.get_today_water_intake()
+    check_step(step, 24 * 3600)
+    user_service = UserService(db, user_id=user_id, read_session=read_db)
+    today_water_intake = user_service.get_today_water_intake(points=points, mode=mode, step=step)
 
     if not today_water_intake:
         raise HTTPException(status_code=404, detail="No water intake data for today")
@@ -72,12 +190,15 @@ async def get_today_water_intake(user_id: int, db: Session = Depends(get_db)):
 
 
 @router.get("/api/v1/user/{user_id}/week-water-intake", response_model=List[WaterIntake])
-async def get_week_water_intake(user_id: int, db: Session = Depends(get_db)):
+async def get_week_water_intake(user_id: int, points: Optional[int] = POINTS_QUERY, mode: str = MODE_QUERY, step: Optional[int] = STEP_QUERY, db: Session = Depends(get_db), read_db: Session = Depends(get_read_db)):
     """
     Fetches this week's water intake data for the given user ID.
+    Pass `points` to receive a server-side decimated series of constant size, and `step`
+    to fill the gaps left by the ingest dead-band filter.
     """
-    user_service = UserService(db, user_id=user_id)
-    week_water_intake = user_service.get_week_water_intake()
+    check_step(step, 7 * 24 * 3600)
+    user_service = UserService(db, user_id=user_id, read_session=read_db)
+    week_water_intake = user_service.get_week_water_intake(points=points, mode=mode, step=step)
 
     if not week_water_intake:
         raise HTTPException(status_code=404, detail="No water intake data for this week")
@@ -87,17 +208,68 @@ async def get_week_water_intake(user_id: int, db: Session = Depends(get_db)):
 
 
 @router.get("/api/v1/user/{user_id}/total-water-intake", response_model=Dict[str, float])
-async def get_total_water_intake_today(user_id: int, db: Session = Depends(get_db)):
+async def get_total_water_intake_today(user_id: int, db: Session = Depends(get_db), read_db: Session = Depends(get_read_db)):
     """
     Fetches the total water intake for today for the given user ID.
     """
-    user_service = UserService(db, user_id=user_id)
+    user_service = UserService(db, user_id=user_id, read_session=read_db)
     total_water_intake_today = user_service.get_todays_total_water_intake()
 
     # Return the total water intake for today in JSON
     return {"total_water_intake": total_water_intake_today}
 
 
+@router.get("/api/v1/user/{user_id}/analytics", response_model=UserAnalyticsReport)
+async def get_user_analytics(user_id: int, read_db: Session = Depends(get_read_db)):
+    """
+    Fetches the user's streaks, goal attainment and intake trend, as computed by the nightly analytics job.
+    """
+    analytics = AnalyticsService(read_db, user_id=user_id).get_summary()
+
+    if analytics is None:
+        raise HTTPException(status_code=404, detail="No analytics for this user yet")
+
+    return analytics
+
+
+@router.get("/api/v1/user/{user_id}/weekly-report", response_model=List[WeeklyIntake])
+async def get_weekly_report(user_id: int, weeks: int = Query(4, ge=1, le=ANALYTICS_REPORT_WEEKS), read_db: Session = Depends(get_read_db)):
+    """
+    Fetches the user's weekly intake totals (weeks start on Monday), most recent week first.
+    """
+    report = AnalyticsService(read_db, user_id=user_id).get_weekly_report(weeks)
+
+    if not report:
+        raise HTTPException(status_code=404, detail="No weekly report for this user yet")
+
+    return report
+
+
+@router.get("/api/v1/user/{user_id}/intake-forecast", response_model=IntakeForecast)
+async def get_intake_forecast(user_id: int, db: Session = Depends(get_db), read_db: Session = Depends(get_read_db)):
+    """
+    Forecasts whether the user reaches their daily goal before their sleep time, and when.
+    """
+    try:
+        return ForecastService(db, user_id=user_id, read_session=read_db).get_forecast()
+    except ValueError:
+        raise HTTPException(status_code=404, detail="User not found")
+
+
+@router.get("/api/v1/user/{user_id}/recommended-goal", response_model=GoalRecommendation)
+async def get_recommended_goal(user_id: int, db: Session = Depends(get_db)):
+    """
+    Fetches the daily goal recommended from the user's age, weight, height and gender, and the
+    intra-day pace curve over their waking hours.
+    """
+    recommendation = RecommendationService(db, user_id=user_id).get_recommendation()
+
+    if recommendation is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    return recommendation
+
+
 ### User Info Update APIs ###
 
 @router.put("/api/v1/user/{user_id}/set-daily-goal", response_model=Dict[str, str])
@@ -189,6 +361,28 @@ async def set_sensor_id(user_id: int, new_sensor_id: str, db: Session = Depends(
     # Return success message in JSON
     return {"message": result}
 
+@router.put("/api/v1/user/{user_id}/set-timezone", response_model=Dict[str, str])
+async def set_timezone(user_id: int, new_timezone: str, db: Session = Depends(get_db)):
+    """
+    Updates the user's timezone (IANA name, e.g. 'Europe/Berlin'), which defines where their days start.
+    """
+    user_service = UserService(db, user_id=user_id)
+    result = user_service.set_timezone(new_timezone)
+
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result)
+
+    # Return success message in JSON
+    return {"message": result}
+
+@router.get("/api/v1/user/{user_id}/timezone", response_model=Dict[str, Optional[str]])
+async def get_timezone(user_id: int, db: Session = Depends(get_db)):
+    """
+    Fetches the user's timezone.
+    """
+    user_service = UserService(db, user_id=user_id)
+    return {"timezone": user_service.get_timezone()}
+
 @router.get("/api/v1/user/{user_id}/bottle-weight", response_model=Dict[str, Optional[int]])
 async def get_bottle_weight(user_id: int, db: Session = Depends(get_db)):
     """
@@ -242,11 +436,11 @@ async def get_daily_goal(user_id: int, db: Session = Depends(get_db)):
     return {"daily_goal": daily_goal}
 
 @router.get("/api/v1/user/{user_id}/current-water-level", response_model=Dict[str, Optional[int]])
-async def get_current_water_level(user_id: int, db: Session = Depends(get_db)):
+async def get_current_water_level(user_id: int, db: Session = Depends(get_db), read_db: Session = Depends(get_read_db)):
     """
     Fetches the current water level in the user's bottle.
     """
-    user_service = UserService(db, user_id=user_id)
+    user_service = UserService(db, user_id=user_id, read_session=read_db)
     current_level = user_service.get_current_bottle_water_level()
 
     if current_level is None:
@@ -294,3 +488,117 @@ async def set_is_bottle_on_dock(user_id: int, is_on_dock: bool, db: Session = De
         raise HTTPException(status_code=400, detail="Failed to update bottle dock status")
 
     return {"message": "Bottle dock status updated successfully"}
+
+
+### Device Command APIs ###
+
+@router.put("/api/v1/user/{user_id}/led-mode", response_model=Dict[str, str])
+async def set_led_mode(user_id: int, mode: int = Query(..., ge=min(LED_MODES), le=max(LED_MODES)), db: Session = Depends(get_db)):
+    """
+    Sets the LED animation mode of the user's bottle dock.
+    The command is published asynchronously over MQTT.
+    """
+    user_service = UserService(db, user_id=user_id)
+
+    try:
+        result = user_service.set_led_mode(mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {"message": result}
+
+
+@router.put("/api/v1/users/led-mode", response_model=FleetCommandResult)
+async def set_fleet_led_mode(command: FleetLedMode, db: Session = Depends(get_db)):
+    """
+    Sets the LED animation mode of many bottle docks at once (all docks if `user_ids` is omitted).
+    """
+    fleet_service = FleetService(db)
+
+    try:
+        result = fleet_service.set_led_mode(command.mode, user_ids=command.user_ids)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return result
+
+
+@router.post("/api/v1/users/bulk", response_model=ProvisioningReport)
+async def provision_users(request: Request, format: str = Query("csv", regex=f"^({'|'.join(PROVISIONING_FORMATS)})$"),
+                          db: Session = Depends(get_db)):
+    """
+    Registers or updates many users/docks from a CSV (with a header row) or NDJSON request body,
+    keyed by `sensor_id`. Invalid rows are reported without aborting the rest of the load.
+    """
+    # Large uploads go to disk rather than memory while the body is received
+    with SpooledTemporaryFile(max_size=PROVISIONING_SPOOL_BYTES) as body:
+        async for chunk in request.stream():
+            body.write(chunk)
+        body.seek(0)
+        return await run_in_threadpool(ProvisioningService(db).provision, body, format)
+
+
+@router.get("/api/v1/ingest/lanes", response_model=List[LaneMetrics])
+async def get_ingest_lanes():
+    """
+    Reports the ingest priority lanes of this process: counters, queue depth and latency percentiles.
+    Only the process running ingest (the leader) reports non-zero values.
+    """
+    return get_lane_metrics()
+
+
+@router.get("/api/v1/ingest/admission", response_model=AdmissionMetrics)
+async def get_ingest_admission():
+    """
+    Reports per-device admission control of this process: counters, quarantined devices and top offenders.
+    """
+    return get_admission_metrics()
+
+
+@router.delete("/api/v1/ingest/quarantine/{device_id}", response_model=Dict[str, str])
+async def lift_quarantine(device_id: str):
+    """
+    Ends a device's ingest quarantine early, e.g. after its firmware was fixed.
+    """
+    if not admission.lift_quarantine(device_id):
+        raise HTTPException(status_code=404, detail="Device is not quarantined")
+    return {"message": f"Device {device_id} released from quarantine"}
+
+
+@router.get("/api/v1/devices/health", response_model=List[DeviceHealth])
+async def get_devices_health(unhealthy_only: bool = False):
+    """
+    Reports the load-cell health of every device seen by this process's ingest (the leader).
+    """
+    return get_device_health(unhealthy_only=unhealthy_only)
+
+
+@router.get("/api/v1/devices/{device_id}/health", response_model=DeviceHealth)
+async def get_device_health_by_id(device_id: str):
+    """
+    Reports the load-cell health of one device.
+    """
+    health = get_device_health(device_id)
+    if not health:
+        raise HTTPException(status_code=404, detail="Device has not sent data to this process")
+    return health[0]
+
+
+@router.post("/api/v1/admin/profile/ingest", response_model=Dict[str, List[str]])
+async def start_ingest_profile(seconds: float = Query(10, gt=0, le=PROFILING_MAX_INGEST_SECONDS),
+                               format: str = Query("speedscope", regex=f"^({'|'.join(PROFILING_FORMATS)})$"),
+                               x_profile_token: Optional[str] = Header(None)):
+    """
+    Samples this process's ingest threads for `seconds` and writes a speedscope or folded-stacks
+    profile under `PROFILING_OUTPUT_DIR`. Requires the `X-Profile-Token` header; only the
+    process running ingest (the leader) can be profiled.
+    """
+    if not is_authorized(x_profile_token):
+        raise HTTPException(status_code=404, detail="Not Found")
+
+    try:
+        threads = profile_ingest(seconds, format)
+    except (ValueError, RuntimeError) as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    return {"threads": threads}
@@ -0,0 +1,4 @@
+ANALYTICS_LOOKBACK_DAYS = 90        # Completed days of history the nightly job analyses (at least 7 * ANALYTICS_REPORT_WEEKS + 6)
+ANALYTICS_REPORT_WEEKS = 12         # Weekly report rows kept per user, the current week included
+ANALYTICS_TREND_DAYS = 30           # Days the intake trend is fitted over
+ANALYTICS_RUN_HOUR_UTC = 2          # Hour of the nightly run; it also runs at startup when the results are a day old
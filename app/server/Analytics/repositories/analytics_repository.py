@@ -0,0 +1,100 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func, text
+
+from app.database.models import UserAnalytics, UserWeeklyIntake, Users
+from app.database.sharding import scatter
+
+
+class AnalyticsRepository:
+
+    def __init__(self, db_session):
+        self.db_session = db_session
+
+    def get_goal_profiles(self) -> List[tuple]:
+        """
+        Fetches the fields the analytics job needs for every user with a device.
+
+        Returns:
+            List[tuple]: Rows of (id, sensor_id, daily_goal, timezone).
+        """
+        return self.db_session.query(Users.id, Users.sensor_id, Users.daily_goal, Users.timezone)\
+            .filter(Users.sensor_id.isnot(None))\
+            .all()
+
+    def get_hourly_totals(self, since: datetime, until: datetime) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Sums every device's readings per UTC hour in [since, until), in one query over both the
+        raw samples and the hourly rollups of compacted days (per shard, in parallel, when sharded).
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: Columns of sensor IDs, hours (datetime64[h])
+            and summed readings, unordered.
+        """
+        results = scatter(lambda session, _: _hourly_totals(session, since, until), self.db_session)
+        rows = [row for shard_rows in results.values() for row in shard_rows]
+
+        if not rows:
+            return np.array([], dtype=object), np.array([], dtype="datetime64[h]"), np.array([], dtype=float)
+        sensor_ids, hours, totals = zip(*rows)
+        return (
+            np.array(sensor_ids, dtype=object),
+            np.array(hours, dtype="datetime64[h]"),
+            np.array([total or 0.0 for total in totals], dtype=float),
+        )
+
+    def replace_results(self, summaries: List[Dict[str, Any]], weeks: List[Dict[str, Any]]) -> None:
+        """
+        Replaces every user's analytics and weekly report rows in the current transaction;
+        readers keep seeing the previous results until it commits.
+        """
+        self.db_session.query(UserAnalytics).delete(synchronize_session=False)
+        self.db_session.query(UserWeeklyIntake).delete(synchronize_session=False)
+        if summaries:
+            self.db_session.bulk_insert_mappings(UserAnalytics, summaries)
+        if weeks:
+            self.db_session.bulk_insert_mappings(UserWeeklyIntake, weeks)
+
+    def get_last_computed_at(self) -> Optional[datetime]:
+        """
+        Returns when the analytics were last computed, or None if they never were.
+        """
+        return self.db_session.query(func.max(UserAnalytics.computed_at)).scalar()
+
+    def get_user_analytics(self, user_ID: int) -> Optional[UserAnalytics]:
+        """
+        Fetches a user's precomputed analytics by primary key.
+        """
+        return self.db_session.query(UserAnalytics).filter_by(user_id=user_ID).one_or_none()
+
+    def get_weekly_report(self, user_ID: int, weeks: int) -> List[UserWeeklyIntake]:
+        """
+        Fetches a user's latest `weeks` weekly report rows, most recent first.
+        """
+        return self.db_session.query(UserWeeklyIntake)\
+            .filter_by(user_id=user_ID)\
+            .order_by(UserWeeklyIntake.week_start.desc())\
+            .limit(weeks)\
+            .all()
+
+
+def _hourly_totals(session, since: datetime, until: datetime) -> List[tuple]:
+    if session.get_bind().dialect.name == "postgresql":
+        bucket, value = "date_trunc('hour', timestamp)", "data::float"
+    else:
+        # An ISO hour string ("2024-05-01T13") parses straight into datetime64[h]
+        bucket, value = "strftime('%Y-%m-%dT%H', timestamp)", "CAST(data AS REAL)"
+        since, until = since.strftime("%Y-%m-%d %H:%M:%S"), until.strftime("%Y-%m-%d %H:%M:%S")
+
+    return session.execute(text(f"""
+        SELECT sensor_id, {bucket} AS hour, sum({value} + COALESCE(skipped_data, 0)) AS total
+        FROM sensor_data_1
+        WHERE timestamp >= :since AND timestamp < :until AND sensor_id IS NOT NULL
+        GROUP BY sensor_id, {bucket}
+        UNION ALL
+        SELECT sensor_id, {bucket.replace('timestamp', 'bucket')}, avg_data * samples + COALESCE(skipped_data, 0)
+        FROM sensor_data_hourly
+        WHERE bucket >= :since AND bucket < :until
+    """), {"since": since, "until": until}).all()
@@ -0,0 +1,217 @@
+import threading
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from app.database.db import get_db_session
+from app.server.Analytics.config import (
+    ANALYTICS_LOOKBACK_DAYS,
+    ANALYTICS_REPORT_WEEKS,
+    ANALYTICS_TREND_DAYS,
+    ANALYTICS_RUN_HOUR_UTC,
+)
+from app.server.Analytics.repositories.analytics_repository import AnalyticsRepository
+from app.server.User.service.day_window import get_zone, utc_to_local
+
+
+def local_day_index(hours: np.ndarray, tz_name: Optional[str], first_day: np.datetime64) -> np.ndarray:
+    """
+    Maps UTC hours (datetime64[h]) to the index of their local day in the given timezone,
+    counted from `first_day`.
+
+    The UTC offset is looked up once per distinct hour, so DST changes are honoured.
+    """
+    unique_hours, inverse = np.unique(hours, return_inverse=True)
+    zone = get_zone(tz_name)
+    offsets = np.array([
+        zone.utcoffset(hour.astype(datetime)) // timedelta(minutes=1) for hour in unique_hours
+    ], dtype="timedelta64[m]")
+    local_days = (unique_hours.astype("datetime64[m]") + offsets).astype("datetime64[D]")
+    return (local_days - first_day).astype(int)[inverse]
+
+
+def compute_analytics(profiles: List[tuple], sensor_ids: np.ndarray, hours: np.ndarray, totals: np.ndarray,
+                      now: datetime, lookback: int = ANALYTICS_LOOKBACK_DAYS, report_weeks: int = ANALYTICS_REPORT_WEEKS,
+                      trend_days: int = ANALYTICS_TREND_DAYS) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Computes every user's streaks, goal attainment, trend and weekly report from hourly totals.
+
+    The hourly totals are folded into one users x days matrix of local daily totals, which is
+    shifted so that its last column is each user's last completed local day. Every metric is
+    then a vectorized operation over that matrix.
+
+    Args:
+        profiles (List[tuple]): Rows of (id, sensor_id, daily_goal, timezone).
+        sensor_ids, hours, totals (np.ndarray): Hourly totals as returned by
+            `AnalyticsRepository.get_hourly_totals`.
+        now (datetime): The current time (naive UTC).
+
+    Returns:
+        Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]: Rows for `user_analytics` and `user_weekly_intake`.
+    """
+    if not profiles:
+        return [], []
+
+    user_ids = np.array([row[0] for row in profiles])
+    goals = np.array([row[2] or np.nan for row in profiles], dtype=float)
+    timezones = [row[3] for row in profiles]
+    last_days = np.array([utc_to_local(now, tz).date() - timedelta(days=1) for tz in timezones], dtype="datetime64[D]")
+
+    # Day axis wide enough for every timezone's last completed day
+    first_day = np.datetime64(now.date() - timedelta(days=lookback + 1), "D")
+    width = lookback + 3
+    daily = np.zeros((len(profiles), width))
+
+    rows_by_sensor = {row[1]: index for index, row in enumerate(profiles)}
+    row_index = np.array([rows_by_sensor.get(sensor_id, -1) for sensor_id in sensor_ids], dtype=int)
+    known = row_index >= 0
+    for tz in set(timezones):
+        # Users sharing a timezone share the hour -> local day mapping
+        in_zone = known & np.isin(row_index, [index for index, name in enumerate(timezones) if name == tz])
+        if in_zone.any():
+            days = local_day_index(hours[in_zone], tz, first_day)
+            inside = (days >= 0) & (days < width)
+            np.add.at(daily, (row_index[in_zone][inside], days[inside]), totals[in_zone][inside])
+
+    # Align: column `lookback - 1` becomes each user's last completed day
+    ends = (last_days - first_day).astype(int)
+    columns = ends[:, None] - np.arange(lookback)[::-1][None, :]
+    daily = np.take_along_axis(daily, np.clip(columns, 0, width - 1), axis=1)
+    daily[columns < 0] = 0.0
+
+    has_goal = ~np.isnan(goals)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        met = daily >= goals[:, None]
+        attainment = np.minimum(daily / goals[:, None], 1.0)
+    tracked = daily > 0
+
+    # Current streak: trailing run of met days; longest streak: longest run anywhere
+    trailing = met[:, ::-1]
+    current_streak = np.where(trailing.all(axis=1), lookback, trailing.argmin(axis=1))
+    run_ends = np.cumsum(met, axis=1)
+    runs = run_ends - np.maximum.accumulate(np.where(met, 0, run_ends), axis=1)
+    longest_streak = runs.max(axis=1)
+
+    x = np.arange(trend_days) - (trend_days - 1) / 2
+    recent = daily[:, -trend_days:]
+    trend = (recent - recent.mean(axis=1, keepdims=True)) @ x / (x @ x)
+
+    computed_at = now
+    summaries = []
+    for row in range(len(profiles)):
+        summaries.append({
+            "user_id": int(user_ids[row]),
+            "computed_at": computed_at,
+            "last_day": last_days[row].astype(date),
+            "days_tracked": int(tracked[row].sum()),
+            "current_streak": int(current_streak[row]),
+            "longest_streak": int(longest_streak[row]),
+            "goal_met_days_7d": int(met[row, -7:].sum()),
+            "goal_met_days_30d": int(met[row, -30:].sum()),
+            "attainment_7d": float(attainment[row, -7:].mean()) if has_goal[row] else None,
+            "attainment_30d": float(attainment[row, -30:].mean()) if has_goal[row] else None,
+            "avg_intake_7d": float(daily[row, -7:].mean()),
+            "avg_intake_prev_7d": float(daily[row, -14:-7].mean()),
+            "trend_30d": float(trend[row]),
+        })
+
+    # Weekly report: local weeks start on Monday; week 0 is the one containing the last completed day
+    weekdays = (last_days.view("int64") + 3) % 7  # Monday is 0; 1970-01-01 was a Thursday
+    days_back = np.arange(lookback)[::-1]
+    week_back = (days_back[None, :] + 6 - weekdays[:, None]) // 7
+    in_report = week_back < report_weeks
+    users = np.broadcast_to(np.arange(len(profiles))[:, None], week_back.shape)
+    index = (users[in_report], week_back[in_report])
+
+    week_totals = np.zeros((len(profiles), report_weeks))
+    week_tracked = np.zeros((len(profiles), report_weeks), dtype=int)
+    week_met = np.zeros((len(profiles), report_weeks), dtype=int)
+    np.add.at(week_totals, index, daily[in_report])
+    np.add.at(week_tracked, index, tracked[in_report])
+    np.add.at(week_met, index, met[in_report])
+
+    week_starts = last_days[:, None] - weekdays[:, None] - 7 * np.arange(report_weeks)[None, :]
+    weeks = [
+        {
+            "user_id": int(user_ids[row]),
+            "week_start": week_starts[row, week].astype(date),
+            "total_intake": round(float(week_totals[row, week]), 2),
+            "days_tracked": int(week_tracked[row, week]),
+            "goal_met_days": int(week_met[row, week]),
+        }
+        for row in range(len(profiles))
+        for week in range(report_weeks)
+    ]
+    return summaries, weeks
+
+
+def run_analytics(now: Optional[datetime] = None) -> int:
+    """
+    Recomputes and stores every user's analytics and weekly report.
+
+    Daily totals are read for all users at once (`AnalyticsRepository.get_hourly_totals`)
+    and the results replace the previous ones in one transaction.
+
+    Returns:
+        int: The number of users analysed.
+    """
+    now = now or datetime.utcnow()
+    # An extra day covers timezones behind UTC
+    since = datetime.combine(now.date() - timedelta(days=ANALYTICS_LOOKBACK_DAYS + 1), datetime.min.time())
+    until = now
+
+    with get_db_session() as session:
+        repository = AnalyticsRepository(session)
+        profiles = repository.get_goal_profiles()
+        sensor_ids, hours, totals = repository.get_hourly_totals(since, until)
+        summaries, weeks = compute_analytics(profiles, sensor_ids, hours, totals, now)
+        repository.replace_results(summaries, weeks)
+
+    logger.success(f"Computed analytics for {len(summaries)} users from {len(totals)} hourly totals")
+    return len(summaries)
+
+
+class AnalyticsWorker(threading.Thread):
+    """
+    Runs `run_analytics` every night at `ANALYTICS_RUN_HOUR_UTC`, and once at startup when
+    the stored results are more than a day old.
+    """
+
+    def __init__(self, run_hour: int = ANALYTICS_RUN_HOUR_UTC):
+        super().__init__(name="analytics", daemon=True)
+        self.run_hour = run_hour
+        self._stop_event = threading.Event()
+
+    def run(self):
+        try:
+            with get_db_session() as session:
+                last_run = AnalyticsRepository(session).get_last_computed_at()
+            due = last_run is None or datetime.utcnow() - last_run > timedelta(days=1)
+        except Exception as e:
+            logger.exception(f"Could not check when analytics last ran: {e}")
+            due = False
+
+        while not self._stop_event.is_set():
+            if due:
+                try:
+                    run_analytics()
+                except Exception as e:
+                    logger.exception(f"Analytics run failed: {e}")
+            self._stop_event.wait(self._seconds_until_next_run())
+            due = True
+
+    def _seconds_until_next_run(self) -> float:
+        now = datetime.utcnow()
+        next_run = now.replace(hour=self.run_hour, minute=0, second=0, microsecond=0)
+        if next_run <= now:
+            next_run += timedelta(days=1)
+        return (next_run - now).total_seconds()
+
+    def stop(self):
+        self._stop_event.set()
+
+
+if __name__ == "__main__":
+    run_analytics()
@@ -0,0 +1,50 @@
+from typing import Any, Dict, List, Optional
+
+from app.server.Analytics.repositories.analytics_repository import AnalyticsRepository
+
+
+class AnalyticsService:
+    """
+    Serves the results of the nightly analytics job; every read is one primary-key lookup.
+    """
+
+    def __init__(self, DB_session, user_id):
+        self.__repository = AnalyticsRepository(DB_session)
+        self.user_ID = user_id
+
+    def get_summary(self) -> Optional[Dict[str, Any]]:
+        """
+        Returns the user's streaks, goal attainment and intake trend as of their last completed
+        day, or None if the job has not analysed the user yet.
+        """
+        analytics = self.__repository.get_user_analytics(self.user_ID)
+        if analytics is None:
+            return None
+        return {
+            "computed_at": analytics.computed_at.isoformat(),
+            "last_day": analytics.last_day.isoformat(),
+            "days_tracked": analytics.days_tracked,
+            "current_streak": analytics.current_streak,
+            "longest_streak": analytics.longest_streak,
+            "goal_met_days_7d": analytics.goal_met_days_7d,
+            "goal_met_days_30d": analytics.goal_met_days_30d,
+            "attainment_7d": analytics.attainment_7d,
+            "attainment_30d": analytics.attainment_30d,
+            "avg_intake_7d": analytics.avg_intake_7d,
+            "avg_intake_prev_7d": analytics.avg_intake_prev_7d,
+            "trend_30d": analytics.trend_30d,
+        }
+
+    def get_weekly_report(self, weeks: int) -> List[Dict[str, Any]]:
+        """
+        Returns the user's latest `weeks` weekly totals, most recent (possibly partial) week first.
+        """
+        return [
+            {
+                "week_start": week.week_start.isoformat(),
+                "total_intake": week.total_intake,
+                "days_tracked": week.days_tracked,
+                "goal_met_days": week.goal_met_days,
+            }
+            for week in self.__repository.get_weekly_report(self.user_ID, weeks)
+        ]
@@ -0,0 +1,15 @@
+RECOMMENDATION_ML_PER_KG = (40.0, 35.0, 30.0)    # Drinking water per kg of body weight: under 30, 30 to 55, over 55 years
+RECOMMENDATION_AGE_BANDS = (30, 55)              # Upper bounds of the first two age bands above
+RECOMMENDATION_REFERENCE_BMI = 22.0              # Estimates the weight (kg) from the height (cm) when no weight is set
+RECOMMENDATION_GENDER_GOALS = {"male": 2000, "female": 1600}  # Used when neither weight nor height is set
+RECOMMENDATION_DEFAULT_GOAL = 1800               # Used when nothing about the user is known
+RECOMMENDATION_MIN_GOAL = 1200
+RECOMMENDATION_MAX_GOAL = 4000
+RECOMMENDATION_ROUNDING = 50                     # Recommended goals are multiples of this (ml)
+
+# Intra-day pace curve over the waking window
+RECOMMENDATION_DEFAULT_WAKEUP_MINUTES = 7 * 60   # Local wakeup and sleep times assumed when not set
+RECOMMENDATION_DEFAULT_SLEEP_MINUTES = 23 * 60
+RECOMMENDATION_PACE_WAKE_SHARE = 0.1             # Share of the goal expected right after waking up
+RECOMMENDATION_PACE_TAPER_HOURS = 1.0            # The goal should be reached this long before sleep
+RECOMMENDATION_PACE_EXPONENT = 0.85              # Below 1 front-loads the rest of the goal
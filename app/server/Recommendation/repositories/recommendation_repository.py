@@ -0,0 +1,25 @@
+from typing import List, Optional
+
+from app.database.models import Users
+
+
+class RecommendationRepository:
+
+    def __init__(self, db_session):
+        self.db_session = db_session
+
+    def get_goal_inputs(self, user_IDs: Optional[List[int]] = None) -> List[tuple]:
+        """
+        Fetches the profile fields goal recommendations are computed from, in one query.
+
+        Args:
+            user_IDs (Optional[List[int]]): The users to fetch, or None for every user.
+
+        Returns:
+            List[tuple]: Rows of (id, age, weight, height, gender, wakeup_time, sleep_time).
+        """
+        query = self.db_session.query(Users.id, Users.age, Users.weight, Users.height, Users.gender,
+                                      Users.wakeup_time, Users.sleep_time)
+        if user_IDs is not None:
+            query = query.filter(Users.id.in_(user_IDs))
+        return query.all()
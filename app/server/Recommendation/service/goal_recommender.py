@@ -0,0 +1,286 @@
+import threading
+from datetime import time as dt_time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from app.server.Recommendation.config import (
+    RECOMMENDATION_ML_PER_KG,
+    RECOMMENDATION_AGE_BANDS,
+    RECOMMENDATION_REFERENCE_BMI,
+    RECOMMENDATION_GENDER_GOALS,
+    RECOMMENDATION_DEFAULT_GOAL,
+    RECOMMENDATION_MIN_GOAL,
+    RECOMMENDATION_MAX_GOAL,
+    RECOMMENDATION_ROUNDING,
+    RECOMMENDATION_DEFAULT_WAKEUP_MINUTES,
+    RECOMMENDATION_DEFAULT_SLEEP_MINUTES,
+    RECOMMENDATION_PACE_WAKE_SHARE,
+    RECOMMENDATION_PACE_TAPER_HOURS,
+    RECOMMENDATION_PACE_EXPONENT,
+)
+
+# (age, weight, height, gender, wakeup_time, sleep_time): a recommendation only changes with these
+GoalInputs = Tuple[Optional[int], Optional[float], Optional[float], Optional[str], Optional[dt_time], Optional[dt_time]]
+
+# Fetches rows of (id, *GoalInputs) for the given users, or for every user when passed None
+InputsLoader = Callable[[Optional[List[int]]], List[tuple]]
+
+GOAL_BASES = ("weight", "height", "gender", "default")
+
+
+def pace_fraction(elapsed_hours, window_hours):
+    """
+    Share of the daily goal that should have been drunk `elapsed_hours` into a waking window of
+    `window_hours`. Works on scalars and NumPy arrays alike.
+
+    The curve starts at `RECOMMENDATION_PACE_WAKE_SHARE` on waking up, rises front-loaded
+    (`RECOMMENDATION_PACE_EXPONENT`) and reaches the whole goal
+    `RECOMMENDATION_PACE_TAPER_HOURS` before sleep.
+    """
+    drinking_hours = np.maximum(np.asarray(window_hours, dtype=float) - RECOMMENDATION_PACE_TAPER_HOURS, 1.0)
+    progress = np.clip(np.asarray(elapsed_hours, dtype=float) / drinking_hours, 0.0, 1.0)
+    share = RECOMMENDATION_PACE_WAKE_SHARE + (1 - RECOMMENDATION_PACE_WAKE_SHARE) * progress ** RECOMMENDATION_PACE_EXPONENT
+    return np.where(np.asarray(elapsed_hours) < 0, 0.0, share)
+
+
+def recommend_goals(ages: np.ndarray, weights: np.ndarray, heights: np.ndarray, genders: List[Optional[str]]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Computes the recommended daily goals (ml) of many users at once.
+
+    The goal is the body weight times an age-banded `RECOMMENDATION_ML_PER_KG`. Without a
+    weight, it is estimated from the height at `RECOMMENDATION_REFERENCE_BMI`; without either,
+    a per-gender goal or `RECOMMENDATION_DEFAULT_GOAL` is used.
+
+    Args:
+        ages, weights, heights (np.ndarray): Float columns, NaN where unknown. Heights are in cm.
+        genders (List[Optional[str]]): Free-form gender values.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Goals rounded to `RECOMMENDATION_ROUNDING`, and the index
+        into `GOAL_BASES` of what each goal was derived from.
+    """
+    young, middle_aged = RECOMMENDATION_AGE_BANDS
+    ml_per_kg = np.select([ages < young, ages <= middle_aged, ages > middle_aged],
+                          RECOMMENDATION_ML_PER_KG, default=RECOMMENDATION_ML_PER_KG[1])
+
+    has_weight = np.isfinite(weights) & (weights > 0)
+    has_height = np.isfinite(heights) & (heights > 0)
+    body_weight = np.where(has_weight, weights, RECOMMENDATION_REFERENCE_BMI * (heights / 100) ** 2)
+
+    gender_goals = np.array([RECOMMENDATION_GENDER_GOALS.get(_gender(gender), np.nan) for gender in genders], dtype=float)
+    has_gender = ~np.isnan(gender_goals)
+
+    with np.errstate(invalid="ignore"):
+        goals = np.where(has_weight | has_height, body_weight * ml_per_kg,
+                         np.where(has_gender, gender_goals, RECOMMENDATION_DEFAULT_GOAL))
+    goals = np.clip(np.round(goals / RECOMMENDATION_ROUNDING) * RECOMMENDATION_ROUNDING,
+                    RECOMMENDATION_MIN_GOAL, RECOMMENDATION_MAX_GOAL)
+    bases = np.select([has_weight, has_height, has_gender], [0, 1, 2], default=3)
+    return goals.astype(int), bases
+
+
+def pace_curves(goals: np.ndarray, wakeup_minutes: np.ndarray, sleep_minutes: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Computes every user's cumulative intake target at each hour of their waking window.
+
+    Windows where the sleep time is not after the wakeup time run past midnight.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: Users x points matrices of local clock times
+        (minutes after midnight) and cumulative targets (ml), and a mask of the valid points. A
+        window's points are its wakeup time, every full hour after it, and its sleep time.
+    """
+    window_minutes = (sleep_minutes - wakeup_minutes) % (24 * 60)
+    window_minutes = np.where(window_minutes == 0, 24 * 60, window_minutes)
+    elapsed = np.arange(25)[None, :] * 60.0
+    points = np.ceil(window_minutes / 60).astype(int) + 1
+    valid = np.arange(25)[None, :] < points[:, None]
+    elapsed = np.minimum(elapsed, window_minutes[:, None])
+
+    targets = goals[:, None] * pace_fraction(elapsed / 60, window_minutes[:, None] / 60)
+    clock = (wakeup_minutes[:, None] + elapsed) % (24 * 60)
+    return clock, np.round(targets, -1), valid
+
+
+def compute_recommendations(rows: List[tuple]) -> Dict[int, "GoalRecommendation"]:
+    """
+    Computes the recommendations of every user in `rows` (id, *GoalInputs) in one vectorized pass.
+    """
+    if not rows:
+        return {}
+
+    ages = np.array([_number(row[1]) for row in rows])
+    weights = np.array([_number(row[2]) for row in rows])
+    heights = np.array([_number(row[3]) for row in rows])
+    goals, bases = recommend_goals(ages, weights, heights, [row[4] for row in rows])
+
+    wakeup = np.array([_minutes(row[5], RECOMMENDATION_DEFAULT_WAKEUP_MINUTES) for row in rows], dtype=float)
+    sleep = np.array([_minutes(row[6], RECOMMENDATION_DEFAULT_SLEEP_MINUTES) for row in rows], dtype=float)
+    clock, targets, valid = pace_curves(goals.astype(float), wakeup, sleep)
+
+    recommendations = {}
+    for index, row in enumerate(rows):
+        pace = [
+            (f"{int(minutes) // 60:02d}:{int(minutes) % 60:02d}", int(target))
+            for minutes, target in zip(clock[index, valid[index]], targets[index, valid[index]])
+        ]
+        recommendations[row[0]] = GoalRecommendation(tuple(row[1:]), int(goals[index]), GOAL_BASES[bases[index]], pace)
+    return recommendations
+
+
+def inputs_from_payload(payload: Dict[str, Any]) -> GoalInputs:
+    """
+    Reads the goal inputs from a `users_changed` notification payload.
+    """
+    return (
+        payload.get("age"), payload.get("weight"), payload.get("height"), payload.get("gender"),
+        _time(payload.get("wakeup_time")), _time(payload.get("sleep_time")),
+    )
+
+
+def _time(value: Optional[str]) -> Optional[dt_time]:
+    return dt_time.fromisoformat(value) if value else None
+
+
+def _number(value) -> float:
+    return np.nan if value is None else float(value)
+
+
+def _minutes(value: Optional[dt_time], default: int) -> int:
+    return default if value is None else value.hour * 60 + value.minute
+
+
+def _gender(value: Optional[str]) -> Optional[str]:
+    value = (value or "").strip().lower()
+    if value.startswith("m"):
+        return "male"
+    if value.startswith("f") or value.startswith("w"):
+        return "female"
+    return None
+
+
+class GoalRecommendation:
+    """
+    One user's recommended daily goal and pace curve, with the inputs it was computed from.
+    """
+    __slots__ = ("inputs", "daily_goal", "basis", "pace")
+
+    def __init__(self, inputs: GoalInputs, daily_goal: int, basis: str, pace: List[Tuple[str, int]]):
+        self.inputs = inputs
+        self.daily_goal = daily_goal
+        self.basis = basis
+        # (local "HH:MM", cumulative target in ml), from wakeup to sleep
+        self.pace = pace
+
+
+class GoalRecommender:
+    """
+    Caches every user's goal recommendation until one of its inputs changes.
+
+    The first read computes all users in one query and one vectorized pass. Afterwards a user
+    is only recomputed when `invalidate` or `update_inputs` reports changed inputs; the next
+    read then recomputes every invalidated user together, again in one query. Changes to other
+    profile fields (the manual daily goal, the timezone, ...) never invalidate anything.
+    """
+
+    def __init__(self):
+        self._recommendations: Dict[int, GoalRecommendation] = {}
+        # Invalidated user -> the generation it was invalidated at
+        self._stale: Dict[int, int] = {}
+        self._loaded = False
+        self._generation = 0
+        self._cleared_at = 0
+        self.computed = 0
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int, load_inputs: InputsLoader) -> Optional[GoalRecommendation]:
+        """
+        Returns a user's recommendation, or None if the user does not exist.
+
+        Args:
+            user_id (int): The user.
+            load_inputs (InputsLoader): Fetches users' inputs; only called on a cache miss.
+        """
+        return self.get_many([user_id], load_inputs).get(user_id)
+
+    def get_many(self, user_ids: Iterable[int], load_inputs: InputsLoader) -> Dict[int, GoalRecommendation]:
+        """
+        Returns the recommendations of several users, computing the missing ones in one batch.
+        Unknown users are left out.
+        """
+        user_ids = list(user_ids)
+        with self._lock:
+            cached = {user_id: self._recommendations[user_id] for user_id in user_ids if user_id in self._recommendations}
+            if len(cached) == len(user_ids):
+                return cached
+            generation = self._generation
+            # Everything on the first read, afterwards the requested misses and every invalidated user
+            missing = None if not self._loaded else sorted(set(user_ids) - set(cached) | set(self._stale))
+
+        recommendations = compute_recommendations(load_inputs(missing))
+
+        with self._lock:
+            self.computed += len(recommendations)
+            if self._cleared_at <= generation:
+                for user_id, recommendation in recommendations.items():
+                    # Invalidated again while this batch was computed
+                    if self._stale.get(user_id, -1) > generation:
+                        continue
+                    self._recommendations[user_id] = recommendation
+                    self._stale.pop(user_id, None)
+                for user_id in missing or ():
+                    if user_id not in recommendations and self._stale.get(user_id, -1) <= generation:
+                        self._stale.pop(user_id, None)
+                if missing is None:
+                    self._loaded = True
+        if missing is None:
+            logger.info(f"Computed goal recommendations for {len(recommendations)} users")
+
+        cached.update((user_id, recommendations[user_id]) for user_id in user_ids if user_id in recommendations)
+        return cached
+
+    def get_goals(self, user_ids: Iterable[int], load_inputs: InputsLoader) -> Dict[int, int]:
+        """
+        Returns the recommended daily goals of several users; see `get_many`.
+        """
+        return {user_id: recommendation.daily_goal for user_id, recommendation in self.get_many(user_ids, load_inputs).items()}
+
+    def invalidate(self, user_id: int) -> None:
+        """
+        Drops a user's recommendation after one of its inputs changed; it is recomputed on the next read.
+        """
+        with self._lock:
+            self._generation += 1
+            self._recommendations.pop(user_id, None)
+            self._stale[user_id] = self._generation
+
+    def update_inputs(self, user_id: int, inputs: GoalInputs) -> bool:
+        """
+        Invalidates a user's recommendation if `inputs` differ from the ones it was computed from.
+
+        Returns:
+            bool: True if the recommendation was invalidated.
+        """
+        with self._lock:
+            recommendation = self._recommendations.get(user_id)
+            if recommendation is not None and recommendation.inputs == inputs:
+                return False
+        self.invalidate(user_id)
+        return True
+
+    def clear(self) -> None:
+        """
+        Forgets every recommendation; the next read recomputes all users.
+        """
+        with self._lock:
+            self._generation += 1
+            self._cleared_at = self._generation
+            self._recommendations.clear()
+            self._stale.clear()
+            self._loaded = False
+
+
+# Shared by the API and the reminder scheduler in this process
+goal_recommender = GoalRecommender()
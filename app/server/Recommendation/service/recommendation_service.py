@@ -0,0 +1,28 @@
+from typing import Any, Dict, Optional
+
+from app.server.Recommendation.repositories.recommendation_repository import RecommendationRepository
+from app.server.Recommendation.service.goal_recommender import goal_recommender
+
+
+class RecommendationService:
+    """
+    Serves cached goal recommendations; a query is only made when the user's inputs changed.
+    """
+
+    def __init__(self, DB_session, user_id):
+        self.__repository = RecommendationRepository(DB_session)
+        self.user_ID = user_id
+
+    def get_recommendation(self) -> Optional[Dict[str, Any]]:
+        """
+        Returns the user's recommended daily goal and intra-day pace curve, or None if the user
+        does not exist.
+        """
+        recommendation = goal_recommender.get(self.user_ID, self.__repository.get_goal_inputs)
+        if recommendation is None:
+            return None
+        return {
+            "daily_goal": recommendation.daily_goal,
+            "basis": recommendation.basis,
+            "pace": [{"time": clock, "target": target} for clock, target in recommendation.pace],
+        }
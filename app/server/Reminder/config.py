@@ -0,0 +1,4 @@
+REMINDER_CHECK_INTERVAL_SECONDS = 30 * 60  # How often each user's pace is checked during their waking hours
+REMINDER_PACE_TOLERANCE = 0.15             # Behind pace once below (1 - tolerance) of the expected intake
+REMINDER_LED_MODE = 4                      # LED mode used to nudge the user (breathing blue)
+REMINDER_CLEAR_LED_MODE = 0                # LED mode restored once the user is back on pace
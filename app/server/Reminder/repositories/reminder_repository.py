@@ -0,0 +1,24 @@
+from typing import List, Optional
+
+from app.database.models import Users
+
+
+class ReminderRepository:
+
+    def __init__(self, db_session):
+        self.db_session = db_session
+
+    def get_reminder_profiles(self, user_ID: Optional[int] = None) -> List[tuple]:
+        """
+        Fetches the fields the reminder scheduler needs, for one user or for every user.
+
+        Args:
+            user_ID (Optional[int]): The user to fetch, or None for all users.
+
+        Returns:
+            List[tuple]: Rows of (id, sensor_id, daily_goal, wakeup_time, sleep_time, timezone).
+        """
+        query = self.db_session.query(Users.id, Users.sensor_id, Users.daily_goal, Users.wakeup_time, Users.sleep_time, Users.timezone)
+        if user_ID is not None:
+            query = query.filter(Users.id == user_ID)
+        return query.all()
@@ -0,0 +1,256 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from datetime import datetime, time as dt_time, timedelta
+from typing import Deque, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from app.database.db import get_db_session
+from app.paho_mqtt.daily_totals import daily_totals
+from app.paho_mqtt.publisher import get_command_publisher
+from app.server.Reminder.config import (
+    REMINDER_CHECK_INTERVAL_SECONDS,
+    REMINDER_PACE_TOLERANCE,
+    REMINDER_LED_MODE,
+    REMINDER_CLEAR_LED_MODE,
+)
+from app.server.Reminder.repositories.reminder_repository import ReminderRepository
+from app.server.Recommendation.repositories.recommendation_repository import RecommendationRepository
+from app.server.Recommendation.service.goal_recommender import goal_recommender, pace_fraction
+from app.server.User.service.day_window import get_zone, local_to_utc, utc_to_local
+
+
+class ReminderProfile:
+    """
+    The scheduler's in-memory view of one user.
+    """
+    __slots__ = ("user_id", "sensor_id", "daily_goal", "wakeup_time", "sleep_time", "timezone", "generation", "behind")
+
+    def __init__(self, user_id: int, sensor_id: str, daily_goal: int, wakeup_time: dt_time, sleep_time: dt_time,
+                 timezone: Optional[str] = None):
+        self.user_id = user_id
+        self.sensor_id = sensor_id
+        self.daily_goal = daily_goal
+        self.wakeup_time = wakeup_time
+        self.sleep_time = sleep_time
+        self.timezone = timezone
+        self.generation = 0
+        self.behind = False
+
+
+def wake_window(profile: ReminderProfile, now: datetime) -> Tuple[datetime, datetime]:
+    """
+    Returns the [wakeup, sleep) window containing `now`, or the next one if the user is asleep.
+
+    Wakeup and sleep times are local to the user's timezone; `now` and the returned bounds
+    are naive UTC. Windows where the sleep time is earlier than the wakeup time run past midnight.
+    """
+    zone = get_zone(profile.timezone)
+    local_today = utc_to_local(now, profile.timezone).date()
+    for offset in (-1, 0, 1):
+        day = local_today + timedelta(days=offset)
+        start = datetime.combine(day, profile.wakeup_time, tzinfo=zone)
+        end = datetime.combine(day, profile.sleep_time, tzinfo=zone)
+        if end <= start:
+            end = datetime.combine(day + timedelta(days=1), profile.sleep_time, tzinfo=zone)
+        start, end = local_to_utc(start), local_to_utc(end)
+        if now < end:
+            return start, end
+    raise AssertionError("unreachable: tomorrow's window always ends after now")
+
+
+def expected_intake(profile: ReminderProfile, now: datetime) -> float:
+    """
+    Returns how much the user should have had by `now` to be on pace for their daily goal,
+    following the recommended intra-day pace curve over their waking hours.
+    """
+    start, end = wake_window(profile, now)
+    if now < start:
+        return 0.0
+    return profile.daily_goal * float(pace_fraction((now - start).total_seconds() / 3600, (end - start).total_seconds() / 3600))
+
+
+class ReminderScheduler(threading.Thread):
+    """
+    Fires LED reminders when a user falls behind pace on their daily goal.
+
+    Upcoming per-user checks live in one min-heap keyed by due time, so each check costs
+    O(log n) and the thread sleeps until the earliest one is due; no per-user polling loop
+    touches the database. Pace is evaluated against the running totals maintained at ingest
+    (`daily_totals`), and the LED command is only sent when a user's behind/on-pace state flips.
+
+    Profile changes are applied with `refresh(user_id)`. Superseded heap entries are skipped
+    lazily via a per-profile generation counter.
+    """
+
+    def __init__(self, check_interval: float = REMINDER_CHECK_INTERVAL_SECONDS, tolerance: float = REMINDER_PACE_TOLERANCE):
+        super().__init__(name="reminder-scheduler", daemon=True)
+        self.check_interval = timedelta(seconds=check_interval)
+        self.tolerance = tolerance
+        self.nudges_sent = 0
+
+        self._profiles: Dict[int, ReminderProfile] = {}
+        self._heap: List[Tuple[float, int, int, int]] = []
+        self._counter = itertools.count()
+        self._generations = itertools.count(1)
+        self._reloads: Deque[int] = deque()
+        self._cond = threading.Condition()
+        self._stop_event = threading.Event()
+
+    def load(self) -> None:
+        """
+        Loads every user's profile in one query and schedules their next check. Users without a
+        daily goal of their own follow their recommended goal.
+        """
+        with get_db_session() as session:
+            rows = ReminderRepository(session).get_reminder_profiles()
+        recommended = _recommended_goals([row[0] for row in rows if not row[2]])
+
+        now = datetime.utcnow()
+        with self._cond:
+            for row in rows:
+                self._upsert(row, now, recommended.get(row[0]))
+            self._cond.notify()
+        logger.info(f"Reminder scheduler loaded {len(self._profiles)} users")
+
+    def refresh(self, user_id: int) -> None:
+        """
+        Reloads a user's profile (goal, wakeup or sleep time changed) on the scheduler thread.
+        """
+        with self._cond:
+            self._reloads.append(user_id)
+            self._cond.notify()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        with self._cond:
+            self._cond.notify()
+
+    def run(self):
+        try:
+            self.load()
+        except Exception as e:
+            logger.exception(f"Reminder scheduler could not load users: {e}")
+
+        while not self._stop_event.is_set():
+            with self._cond:
+                while not self._stop_event.is_set() and not self._reloads:
+                    if self._heap and self._heap[0][0] <= time.time():
+                        break
+                    self._cond.wait(self._heap[0][0] - time.time() if self._heap else None)
+                if self._stop_event.is_set():
+                    return
+                reloads = list(self._reloads)
+                self._reloads.clear()
+                entry = heapq.heappop(self._heap) if not reloads else None
+
+            if reloads:
+                self._reload(reloads)
+                continue
+
+            _, _, user_id, generation = entry
+            profile = self._profiles.get(user_id)
+            if profile is None or profile.generation != generation:
+                continue
+
+            now = datetime.utcnow()
+            try:
+                self._evaluate(profile, now)
+            except Exception as e:
+                logger.exception(f"Reminder check failed for user {user_id}: {e}")
+            with self._cond:
+                self._schedule(profile, now)
+
+    def _reload(self, user_ids: List[int]) -> None:
+        now = datetime.utcnow()
+        for user_id in set(user_ids):
+            with get_db_session() as session:
+                rows = ReminderRepository(session).get_reminder_profiles(user_id)
+            recommended = _recommended_goals([row[0] for row in rows if not row[2]])
+            with self._cond:
+                if rows:
+                    self._upsert(rows[0], now, recommended.get(user_id))
+                else:
+                    self._profiles.pop(user_id, None)
+
+    def _upsert(self, row, now: datetime, recommended_goal: Optional[int] = None) -> None:
+        user_id, sensor_id, daily_goal, wakeup_time, sleep_time, timezone = row
+        daily_goal = daily_goal or recommended_goal
+        previous = self._profiles.pop(user_id, None)
+        if not (sensor_id and daily_goal and wakeup_time and sleep_time):
+            return
+
+        profile = ReminderProfile(user_id, sensor_id, daily_goal, wakeup_time, sleep_time, timezone)
+        # A fresh generation invalidates every heap entry scheduled for the previous profile
+        profile.generation = next(self._generations)
+        if previous is not None:
+            profile.behind = previous.behind
+        self._profiles[user_id] = profile
+        self._schedule(profile, now)
+
+    def _schedule(self, profile: ReminderProfile, now: datetime) -> None:
+        start, end = wake_window(profile, now)
+        # Always check once at bedtime so a pending reminder is cleared
+        due = min(max(now, start) + self.check_interval, end)
+        heapq.heappush(self._heap, ((due - datetime(1970, 1, 1)).total_seconds(), next(self._counter), profile.user_id, profile.generation))
+
+    def _evaluate(self, profile: ReminderProfile, now: datetime) -> None:
+        start, _ = wake_window(profile, now)
+        awake = now >= start
+        behind = awake and daily_totals.get(profile.sensor_id) < expected_intake(profile, now) * (1 - self.tolerance)
+
+        if behind == profile.behind:
+            return
+
+        profile.behind = behind
+        get_command_publisher().send_led_mode(profile.sensor_id, REMINDER_LED_MODE if behind else REMINDER_CLEAR_LED_MODE)
+        if behind:
+            self.nudges_sent += 1
+            logger.info(f"User {profile.user_id} is behind pace, nudged device {profile.sensor_id}")
+
+
+def _recommended_goals(user_ids: List[int]) -> Dict[int, int]:
+    # Cached per user; only users whose recommendation inputs changed cost a query
+    if not user_ids:
+        return {}
+
+    def load_inputs(ids: Optional[List[int]]) -> List[tuple]:
+        with get_db_session() as session:
+            return RecommendationRepository(session).get_goal_inputs(ids)
+
+    return goal_recommender.get_goals(user_ids, load_inputs)
+
+
+_scheduler: Optional[ReminderScheduler] = None
+
+
+def start_reminder_scheduler() -> ReminderScheduler:
+    """
+    Starts the process-wide reminder scheduler.
+    """
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = ReminderScheduler()
+        _scheduler.start()
+    return _scheduler
+
+
+def stop_reminder_scheduler(timeout: Optional[float] = None) -> None:
+    """
+    Stops the process-wide reminder scheduler, if it was started.
+    """
+    global _scheduler
+    if _scheduler is not None:
+        _scheduler.stop()
+        _scheduler.join(timeout)
+        _scheduler = None
+
+
+def get_reminder_scheduler() -> Optional[ReminderScheduler]:
+    """
+    Returns the running reminder scheduler, or None if this process does not run one.
+    """
+    return _scheduler
@@ -0,0 +1,9 @@
+PROVISIONING_CHUNK_SIZE = 1000                   # Rows validated, loaded and committed together by bulk provisioning
+PROVISIONING_SPOOL_BYTES = 8 * 1024 * 1024       # Uploads larger than this are spooled to a temporary file instead of memory
+
+# History endpoints
+LOCF_MAX_POINTS = 20000                          # Longest regular grid a `step` may rebuild; finer steps are rejected with 422
+
+# Intake forecast ("on pace to hit the goal by HH:MM")
+FORECAST_RATE_WEIGHT = 0.5                       # Share of the recent (EWMA) rate in the projection, the rest is today's average rate
+FORECAST_MIN_AVERAGE_HOURS = 1.0                 # Today's average rate is only used once the user has been awake this long
@@ -0,0 +1,29 @@
+import argparse
+import json
+import sys
+
+from app.database.db import get_db_session
+from app.server.User.service.provisioning_service import PROVISIONING_FORMATS, ProvisioningService
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Registers or updates users/docks from a CSV or NDJSON file.")
+    parser.add_argument("file", help="Path of the file, or - for standard input")
+    parser.add_argument("--format", choices=PROVISIONING_FORMATS, help="File format (default: from the file extension, else csv)")
+    args = parser.parse_args()
+
+    file_format = args.format or ("ndjson" if args.file.endswith((".ndjson", ".jsonl")) else "csv")
+    with get_db_session() as session:
+        if args.file == "-":
+            report = ProvisioningService(session).provision(sys.stdin.buffer, file_format)
+        else:
+            with open(args.file, "rb") as stream:
+                report = ProvisioningService(session).provision(stream, file_format)
+
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    return 1 if report["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+import csv
+import io
+from typing import Dict, List, Tuple
+
+from sqlalchemy import func, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app.database.models import Users
+
+# Columns bulk provisioning may set; the ingest-maintained level and dock state are left alone
+PROVISIONED_COLUMNS = (
+    "sensor_id", "name", "daily_goal", "wakeup_time", "sleep_time", "bottle_weight",
+    "age", "weight", "height", "gender", "timezone",
+)
+
+
+class ProvisioningRepository:
+    """
+    Upserts users keyed by `sensor_id` (unique index `uq_users_sensor_id`).
+
+    On Postgres a chunk is streamed with `COPY` into a temporary staging table and merged
+    with one `INSERT ... SELECT ... ON CONFLICT`; elsewhere (embedded SQLite) it falls back to
+    a multi-row upsert. In both cases a column left empty keeps the existing user's value.
+    """
+
+    def __init__(self, db_session):
+        self.db_session = db_session
+
+    def upsert_users(self, rows: List[Dict[str, object]]) -> Tuple[int, int]:
+        """
+        Inserts new users and updates existing ones in the current transaction.
+
+        The caller commits; on Postgres the staging rows are discarded at that commit.
+
+        Args:
+            rows (List[Dict[str, object]]): Validated rows with every key of `PROVISIONED_COLUMNS`;
+                `sensor_id` values must be unique within the list.
+
+        Returns:
+            Tuple[int, int]: The number of users inserted and updated.
+        """
+        if not rows:
+            return 0, 0
+        if self.db_session.get_bind().dialect.name == "postgresql":
+            return self.__copy_upsert(rows)
+        return self.__insert_upsert(rows)
+
+    def __copy_upsert(self, rows: List[Dict[str, object]]) -> Tuple[int, int]:
+        columns = ", ".join(PROVISIONED_COLUMNS)
+        # Created once per pooled connection; without constraints or defaults, and emptied by every commit
+        self.db_session.execute(text(
+            f"CREATE TEMP TABLE IF NOT EXISTS users_staging ON COMMIT DELETE ROWS AS "
+            f"SELECT {columns} FROM users WITH NO DATA"
+        ))
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            # COPY's CSV format reads an unquoted empty field as NULL
+            writer.writerow(["" if row[column] is None else row[column] for column in PROVISIONED_COLUMNS])
+        buffer.seek(0)
+
+        # COPY is not exposed by SQLAlchemy; use the psycopg2 cursor of the session's connection
+        cursor = self.db_session.connection().connection.cursor()
+        try:
+            cursor.copy_expert(f"COPY users_staging ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+        finally:
+            cursor.close()
+
+        updates = ", ".join(
+            f"{column} = COALESCE(EXCLUDED.{column}, users.{column})"
+            for column in PROVISIONED_COLUMNS if column != "sensor_id"
+        )
+        # xmax is 0 for a freshly inserted row version and set on one written by the update branch
+        inserted_flags = self.db_session.execute(text(f"""
+            INSERT INTO users ({columns})
+            SELECT {columns} FROM users_staging
+            ON CONFLICT (sensor_id) DO UPDATE SET {updates}
+            RETURNING (xmax = 0)
+        """)).scalars().all()
+
+        inserted = sum(1 for flag in inserted_flags if flag)
+        return inserted, len(inserted_flags) - inserted
+
+    def __insert_upsert(self, rows: List[Dict[str, object]]) -> Tuple[int, int]:
+        sensor_ids = [row["sensor_id"] for row in rows]
+        existing = self.db_session.query(Users.sensor_id).filter(Users.sensor_id.in_(sensor_ids)).count()
+
+        statement = sqlite_insert(Users).values(rows)
+        statement = statement.on_conflict_do_update(
+            index_elements=[Users.sensor_id],
+            set_={
+                column: func.coalesce(statement.excluded[column], getattr(Users, column))
+                for column in PROVISIONED_COLUMNS if column != "sensor_id"
+            },
+        )
+        self.db_session.execute(statement)
+        return len(rows) - existing, existing
@@ -1,12 +1,20 @@
-from sqlalchemy import func
+from sqlalchemy import Float, cast, func
 from datetime import datetime, timedelta
 from app.database.models import SensorData, Users
+from app.database.sharding import sensor_session
 from typing import List, Tuple, Dict, Union, Optional
 
 class UserRepository:
-
-    def __init__(self, db_session):
+    """
+    Profile reads and writes always use `db_session` (the primary), so a change is visible to
+    the next read. History and aggregate reads of `SensorData` use `read_session`, which may be
+    bound to a read replica, and fall back to `db_session` when none is given. With sharding on
+    they go to the device's shard instead (see `app.database.sharding`).
+    """
+
+    def __init__(self, db_session, read_session=None):
         self.db_session = db_session
+        self.read_session = read_session if read_session is not None else db_session
 
     def get_user_info(self, user_ID: int) -> Dict[str, Union[int, str, float, None]]:
         """
@@ -33,6 +41,7 @@ class UserRepository:
                 - "weight" (float, optional): The user's weight.
                 - "height" (float, optional): The user's height.
                 - "gender" (str, optional): The user's gender.
+                - "timezone" (str, optional): The user's IANA timezone name.
                 - "error" (str): If the user is not found, an error message is returned.
         """
         user = self.db_session.query(Users).filter_by(id=user_ID).first()  
@@ -51,6 +60,7 @@ class UserRepository:
                 "gender": user.gender,
                 "currect_water_level_in_bottle": user.currect_water_level_in_bottle,
                 "is_bottle_on_dock": user.is_bottle_on_dock,
+                "timezone": user.timezone,
             }
         else:
             return {"error": "User not found"}
@@ -111,73 +121,181 @@ class UserRepository:
         Raises:
             ValueError: If no user is found with the provided user ID.
         """
-        user = self.db_session.query(Users).filter_by(id=user_ID).one_or_none()
+        row = self.db_session.query(Users.sensor_id).filter_by(id=user_ID).one_or_none()
 
-        if user:
-            return user.sensor_id
+        if row:
+            return row.sensor_id
         else:
             raise ValueError(f"User with ID {user_ID} not found")
 
 
-    def get_today_water_intake(self, iot_device_ID: str) -> List[Tuple[str, float]]:
+    def get_timezone(self, user_ID: int) -> Optional[str]:
+        """
+        Fetches the IANA timezone name of the given user.
+
+        Args:
+            user_ID (int): The ID of the user whose timezone is being fetched.
+
+        Returns:
+            Optional[str]: The timezone name, or None if the user has not set one (UTC).
+
+        Raises:
+            ValueError: If no user is found with the provided user ID.
+        """
+        row = self.db_session.query(Users.timezone).filter_by(id=user_ID).one_or_none()
+
+        if row:
+            return row.timezone
+        else:
+            raise ValueError(f"User with ID {user_ID} not found")
+
+    def get_sensor_id_and_timezone(self, user_ID: int) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Fetches the IoT device ID (sensor_id) and IANA timezone name of the given user in one query.
+
+        Raises:
+            ValueError: If no user is found with the provided user ID.
+        """
+        row = self.db_session.query(Users.sensor_id, Users.timezone).filter_by(id=user_ID).one_or_none()
+
+        if row:
+            return row.sensor_id, row.timezone
+        else:
+            raise ValueError(f"User with ID {user_ID} not found")
+
+
+    def get_forecast_profile(self, user_ID: int) -> tuple:
+        """
+        Fetches the fields the intake forecast needs in one query.
+
+        Returns:
+            tuple: (sensor_id, daily_goal, wakeup_time, sleep_time, timezone).
+
+        Raises:
+            ValueError: If no user is found with the provided user ID.
+        """
+        row = self.db_session.query(Users.sensor_id, Users.daily_goal, Users.wakeup_time, Users.sleep_time, Users.timezone)\
+            .filter_by(id=user_ID).one_or_none()
+
+        if row:
+            return tuple(row)
+        else:
+            raise ValueError(f"User with ID {user_ID} not found")
+
+
+    def get_sensor_ids(self, user_IDs: Optional[List[int]] = None) -> Dict[int, str]:
+        """
+        Fetches the IoT device IDs (sensor_id) of many users in a single query.
+
+        Args:
+            user_IDs (Optional[List[int]]): The users to look up, or None for every user.
+
+        Returns:
+            Dict[int, str]: A mapping of user ID to sensor ID. Unknown user IDs are left out.
+        """
+        query = self.db_session.query(Users.id, Users.sensor_id)
+        if user_IDs is not None:
+            query = query.filter(Users.id.in_(user_IDs))
+
+        return {user_id: sensor_id for user_id, sensor_id in query.all()}
+
+
+    def get_today_water_intake(self, iot_device_ID: str, day_start: datetime, day_end: datetime) -> List[Tuple[str, float]]:
         """
         Retrieves today's water intake records for the given device ID.
         
-        This function queries the database for all records of water intake for the current
-        date associated with the specified IoT device ID. It returns a list of tuples where
-        each tuple contains the timestamp in the format 'YYYY-MM-DD HH:MM:SS' and the water 
-        intake data converted to a float.
+        This function queries the database for all records of water intake within the user's
+        current local day, given as UTC bounds, associated with the specified IoT device ID.
+        It returns a list of tuples where each tuple contains the timestamp in the format
+        'YYYY-MM-DD HH:MM:SS' and the water intake data converted to a float.
 
         Args:
             iot_device_ID (int): The ID of the IoT device whose water intake data is being fetched.
+            day_start (datetime): Start (inclusive, naive UTC) of the user's local day.
+            day_end (datetime): End (exclusive, naive UTC) of the user's local day.
 
         Returns:
             List[Tuple[str, float]]: A list of tuples where each tuple contains:
                                     - timestamp (str): The time of the water intake in 'YYYY-MM-DD HH:MM:SS' format.
                                     - data (float): The water intake data as a float.
         """
-        today = datetime.utcnow().date()
-
-        results = self.db_session.query(SensorData)\
-            .filter_by(sensor_id=iot_device_ID)\
-            .filter(func.date(SensorData.timestamp) == today)\
-            .all() 
+        with sensor_session(iot_device_ID, self.read_session) as session:
+            results = session.query(SensorData)\
+                .filter_by(sensor_id=iot_device_ID)\
+                .filter(SensorData.timestamp >= day_start, SensorData.timestamp < day_end)\
+                .all()
 
         result_list = [(entry.timestamp.strftime('%Y-%m-%d %H:%M:%S'), float(entry.data)) for entry in results]
         
         return result_list
 
 
-    def get_week_water_intake(self, iot_device_ID: str) -> List[Tuple[str, float]]:
+    def get_week_water_intake(self, iot_device_ID: str, week_start: datetime, day_end: datetime) -> List[Tuple[str, float]]:
         """
         Retrieves all water intake records for the past week for the given device ID.
         
         This function queries the database for all records of water intake between the past 
-        week (starting from one week ago until today) associated with the specified IoT 
-        device ID. It returns a list of tuples where each tuple contains the timestamp in 
-        the format 'YYYY-MM-DD HH:MM:SS' and the water intake data converted to a float.
+        week (starting from one week ago until the end of the user's local day) associated with
+        the specified IoT device ID. It returns a list of tuples where each tuple contains the
+        timestamp in the format 'YYYY-MM-DD HH:MM:SS' and the water intake data converted to a float.
 
         Args:
             iot_device_ID (int): The ID of the IoT device whose water intake data is being fetched.
+            week_start (datetime): Start (inclusive, naive UTC) of the local day one week ago.
+            day_end (datetime): End (exclusive, naive UTC) of the user's local day.
 
         Returns:
             List[Tuple[str, float]]: A list of tuples where each tuple contains:
                                     - timestamp (str): The time of the water intake in 'YYYY-MM-DD HH:MM:SS' format.
                                     - data (float): The water intake data as a float.
         """
-        today = datetime.utcnow().date()
-        one_week_ago = today - timedelta(days=7)
-
-        results = self.db_session.query(SensorData)\
-            .filter_by(sensor_id=iot_device_ID)\
-            .filter(SensorData.timestamp >= one_week_ago)\
-            .all()  
+        with sensor_session(iot_device_ID, self.read_session) as session:
+            results = session.query(SensorData)\
+                .filter_by(sensor_id=iot_device_ID)\
+                .filter(SensorData.timestamp >= week_start, SensorData.timestamp < day_end)\
+                .all()
 
         result_list = [(entry.timestamp.strftime('%Y-%m-%d %H:%M:%S'), float(entry.data)) for entry in results]
 
         return result_list
 
 
+    def get_total_between(self, iot_device_ID: str, since: datetime, until: datetime) -> float:
+        """
+        Sums a device's recorded data in [since, until) in one aggregate query, 0.0 if there is none.
+        Readings skipped by the ingest dead-band are included.
+        """
+        with sensor_session(iot_device_ID, self.read_session) as session:
+            total = session.query(func.sum(cast(SensorData.data, Float) + func.coalesce(SensorData.skipped_data, 0)))\
+                .filter(SensorData.sensor_id == iot_device_ID)\
+                .filter(SensorData.timestamp >= since, SensorData.timestamp < until)\
+                .scalar()
+        return float(total or 0.0)
+
+
+    def get_sensor_series(self, iot_device_ID: str, since: datetime, until: datetime) -> List[Tuple[datetime, str]]:
+        """
+        Fetches the raw (timestamp, data) columns recorded by a device in the given time range.
+
+        Only the two columns needed for charting are selected, ordered by timestamp, so callers
+        can hand the rows straight to the downsampling stage without building ORM objects.
+
+        Args:
+            iot_device_ID (str): The ID of the IoT device whose readings are being fetched.
+            since (datetime): Lower bound (inclusive) on the reading timestamp.
+            until (datetime): Upper bound (exclusive) on the reading timestamp.
+
+        Returns:
+            List[Tuple[datetime, str]]: A list of (timestamp, data) rows in ascending time order.
+        """
+        with sensor_session(iot_device_ID, self.read_session) as session:
+            return session.query(SensorData.timestamp, SensorData.data)\
+                .filter(SensorData.sensor_id == iot_device_ID)\
+                .filter(SensorData.timestamp >= since, SensorData.timestamp < until)\
+                .order_by(SensorData.timestamp)\
+                .all()
+
+
     def get_sensor_data_by_id(self, iot_device_ID: str) -> List[Tuple[str,float]]:
         """
         Fetches all sensor readings filtered by the given device ID (sensor_id).
@@ -194,9 +312,10 @@ class UserRepository:
                                     - timestamp (str): The time of the water intake in 'YYYY-MM-DD HH:MM:SS' format.
                                     - data (float): The water intake data as a float.
         """
-        results = self.db_session.query(SensorData)\
-            .filter_by(sensor_id=iot_device_ID)\
-            .all()
+        with sensor_session(iot_device_ID, self.read_session) as session:
+            results = session.query(SensorData)\
+                .filter_by(sensor_id=iot_device_ID)\
+                .all()
 
         result_list = [(entry.timestamp.strftime('%Y-%m-%d %H:%M:%S'), float(entry.data)) for entry in results]
 
@@ -213,7 +332,8 @@ class UserRepository:
             SensorData: The most recent sensor data entry, or None if no data is found.
         """
         try:
-            return self.db_session.query(SensorData).filter_by(sensor_id=sensor_id).order_by(SensorData.timestamp.desc()).first()
+            with sensor_session(sensor_id, self.read_session) as session:
+                return session.query(SensorData).filter_by(sensor_id=sensor_id).order_by(SensorData.timestamp.desc()).first()
         except Exception as e:
             print(f"Error fetching latest sensor data for {sensor_id}: {e}")
             return None
@@ -0,0 +1,46 @@
+from typing import Any, Dict, Optional
+
+from app.paho_mqtt.daily_totals import daily_totals
+from app.paho_mqtt.calibration import calibrator
+from app.server.Recommendation.service.goal_recommender import goal_recommender, inputs_from_payload
+from app.server.Reminder.service.reminder_scheduler import get_reminder_scheduler
+from app.server.User.service.day_window import day_windows
+
+
+def on_users_changed(payload: Optional[Dict[str, Any]]) -> None:
+    """
+    Applies a `users_changed` notification to this process's caches.
+
+    The change may have been made by any process, including this one, whose own caches were
+    already updated; every step here is idempotent.
+
+    Args:
+        payload (Optional[Dict[str, Any]]): The trigger's payload (`op`, `id`, `sensor_id`,
+            `old_sensor_id`, `timezone`, `bottle_weight` and the goal recommendation inputs), or None if notifications may have been missed.
+    """
+    scheduler = get_reminder_scheduler()
+
+    if payload is None:
+        day_windows.clear()
+        goal_recommender.clear()
+        if calibrator.loaded:
+            calibrator.load()
+        if scheduler is not None:
+            scheduler.load()
+        return
+
+    day_windows.invalidate(payload["id"])
+    if payload.get("old_sensor_id") != payload["sensor_id"]:
+        calibrator.forget(payload.get("old_sensor_id"))
+    if payload["op"] == "DELETE":
+        calibrator.forget(payload["sensor_id"])
+        goal_recommender.invalidate(payload["id"])
+    else:
+        # Only a change of age, weight, height, gender, wakeup or sleep time drops the recommendation
+        goal_recommender.update_inputs(payload["id"], inputs_from_payload(payload))
+        # A cleared sensor_id arrives as null; the old device was forgotten above
+        if payload["sensor_id"] is not None:
+            daily_totals.set_timezone(payload["sensor_id"], payload.get("timezone"))
+            calibrator.set_bottle_weight(payload["sensor_id"], payload.get("bottle_weight"))
+    if scheduler is not None:
+        scheduler.refresh(payload["id"])
@@ -0,0 +1,127 @@
+import threading
+from datetime import datetime, time, timedelta, timezone
+from functools import lru_cache
+from typing import Callable, Dict, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+DEFAULT_TIMEZONE = "UTC"
+
+
+@lru_cache(maxsize=None)
+def get_zone(tz_name: Optional[str]) -> ZoneInfo:
+    """
+    Returns the zone for an IANA timezone name, UTC when no timezone is set.
+
+    Raises:
+        ValueError: If the timezone name is unknown.
+    """
+    try:
+        return ZoneInfo(tz_name or DEFAULT_TIMEZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Unknown timezone: {tz_name}")
+
+
+def local_to_utc(local: datetime) -> datetime:
+    """
+    Converts an aware local datetime to the naive UTC datetime stored in the database.
+    """
+    return local.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def utc_to_local(now: datetime, tz_name: Optional[str]) -> datetime:
+    """
+    Converts a naive UTC datetime to an aware datetime in the given timezone.
+    """
+    return now.replace(tzinfo=timezone.utc).astimezone(get_zone(tz_name))
+
+
+def local_day_bounds(tz_name: Optional[str], now: Optional[datetime] = None) -> Tuple[datetime, datetime]:
+    """
+    Returns the [start, end) of the local day containing `now`, as naive UTC datetimes.
+
+    Local midnights are converted individually, so days around DST changes are 23 or 25
+    hours long.
+
+    Args:
+        tz_name (Optional[str]): IANA timezone name, UTC if None.
+        now (Optional[datetime]): Naive UTC instant, defaults to the current time.
+
+    Returns:
+        Tuple[datetime, datetime]: Naive UTC bounds of the local day.
+    """
+    zone = get_zone(tz_name)
+    local_date = utc_to_local(now or datetime.utcnow(), tz_name).date()
+    start = datetime.combine(local_date, time.min, tzinfo=zone)
+    end = datetime.combine(local_date + timedelta(days=1), time.min, tzinfo=zone)
+    return local_to_utc(start), local_to_utc(end)
+
+
+class DayWindowResolver:
+    """
+    Caches each user's current local day as UTC [start, end) bounds until the next local midnight.
+
+    Repository queries then filter `timestamp >= start AND timestamp < end`, which stays an
+    index range scan, instead of converting every row's timestamp to a local date.
+    """
+
+    def __init__(self):
+        # user_id -> (timezone, today's start, today's end, start of the local day a week ago)
+        self._windows: Dict[int, Tuple[Optional[str], datetime, datetime, datetime]] = {}
+        self._lock = threading.Lock()
+
+    def _resolve(self, user_id: int, load_timezone: Callable[[], Optional[str]], now: Optional[datetime]) -> Tuple[Optional[str], datetime, datetime, datetime]:
+        now = now or datetime.utcnow()
+        with self._lock:
+            cached = self._windows.get(user_id)
+        if cached is not None and cached[1] <= now < cached[2]:
+            return cached
+
+        tz_name = cached[0] if cached is not None else load_timezone()
+        start, end = local_day_bounds(tz_name, now)
+        # Noon a week ago is safely inside that local day, whatever DST did in between
+        week_start, _ = local_day_bounds(tz_name, start - timedelta(days=7) + timedelta(hours=12))
+        window = (tz_name, start, end, week_start)
+        with self._lock:
+            self._windows[user_id] = window
+        return window
+
+    def get_today(self, user_id: int, load_timezone: Callable[[], Optional[str]], now: Optional[datetime] = None) -> Tuple[datetime, datetime]:
+        """
+        Returns the user's current local day as naive UTC bounds.
+
+        Args:
+            user_id (int): The user.
+            load_timezone (Callable[[], Optional[str]]): Fetches the user's timezone; only called on a cache miss.
+            now (Optional[datetime]): Naive UTC instant, defaults to the current time.
+
+        Returns:
+            Tuple[datetime, datetime]: The [start, end) bounds of the user's local day.
+        """
+        _, start, end, _ = self._resolve(user_id, load_timezone, now)
+        return start, end
+
+    def get_week(self, user_id: int, load_timezone: Callable[[], Optional[str]], now: Optional[datetime] = None) -> Tuple[datetime, datetime]:
+        """
+        Returns the naive UTC bounds from the start of the user's local day one week ago to the
+        end of their current local day.
+        """
+        _, _, end, week_start = self._resolve(user_id, load_timezone, now)
+        return week_start, end
+
+    def invalidate(self, user_id: int) -> None:
+        """
+        Forgets a user's cached window, e.g. after their timezone changed.
+        """
+        with self._lock:
+            self._windows.pop(user_id, None)
+
+    def clear(self) -> None:
+        """
+        Forgets every cached window.
+        """
+        with self._lock:
+            self._windows.clear()
+
+
+# Shared by every request handled in this process
+day_windows = DayWindowResolver()
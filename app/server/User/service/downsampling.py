@@ -0,0 +1,210 @@
+import numpy as np
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+
+# Supported decimation modes for the history endpoints
+DOWNSAMPLING_MODES = ("lttb", "minmax", "avg")
+
+_EPOCH = np.datetime64(0, "us")
+
+
+def to_arrays(rows: Sequence[Tuple[datetime, object]]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Converts fetched (timestamp, data) rows into NumPy column arrays.
+
+    Args:
+        rows (Sequence[Tuple[datetime, object]]): Rows as returned by the repository, ordered by timestamp.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Timestamps as epoch seconds (float64) and values (float64).
+    """
+    if not rows:
+        return np.empty(0), np.empty(0)
+
+    timestamps, values = zip(*rows)
+    ts = (np.array(timestamps, dtype="datetime64[us]") - _EPOCH).astype(np.int64) / 1e6
+    return ts, np.asarray(values, dtype=np.float64)
+
+
+def to_records(ts: np.ndarray, values: np.ndarray) -> List[Tuple[str, float]]:
+    """
+    Converts column arrays back into the (timestamp, data) tuples the API returns.
+
+    Args:
+        ts (np.ndarray): Timestamps as epoch seconds.
+        values (np.ndarray): Values aligned with `ts`.
+
+    Returns:
+        List[Tuple[str, float]]: Tuples of 'YYYY-MM-DD HH:MM:SS' timestamps and rounded float values.
+    """
+    stamps = (_EPOCH + (ts * 1e6).astype("timedelta64[us]")).astype("datetime64[s]").astype(str)
+    return [(stamp.replace("T", " "), round(float(value), 2)) for stamp, value in zip(stamps, values)]
+
+
+def lttb(ts: np.ndarray, values: np.ndarray, points: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Largest-triangle-three-buckets downsampling.
+
+    Keeps the first and last sample and, for every bucket in between, the sample forming the
+    largest triangle with the previously selected sample and the average of the next bucket.
+    The per-bucket area computation is vectorized, so the Python loop runs `points` times
+    regardless of the number of raw samples.
+
+    Args:
+        ts (np.ndarray): Timestamps as epoch seconds, ascending.
+        values (np.ndarray): Values aligned with `ts`.
+        points (int): Number of points to return (at least 3).
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The selected timestamps and values.
+    """
+    n = len(ts)
+    if points >= n or points < 3:
+        return ts, values
+
+    # Bucket boundaries for the n - 2 interior samples
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    selected = np.empty(points, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    previous = 0
+    for i in range(points - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = edges[i + 1], (edges[i + 2] if i + 2 < len(edges) else n)
+        avg_t = ts[next_start:next_end].mean()
+        avg_v = values[next_start:next_end].mean()
+
+        pt, pv = ts[previous], values[previous]
+        areas = np.abs((pt - avg_t) * (values[start:end] - pv) - (pt - ts[start:end]) * (avg_v - pv))
+        previous = start + int(np.argmax(areas))
+        selected[i + 1] = previous
+
+    return ts[selected], values[selected]
+
+
+def _time_buckets(ts: np.ndarray, buckets: int) -> np.ndarray:
+    """
+    Returns the start index of every non-empty, equal-width time bucket.
+    """
+    edges = np.linspace(ts[0], ts[-1], buckets + 1)[:-1]
+    return np.unique(np.searchsorted(ts, edges, side="left"))
+
+
+def minmax_buckets(ts: np.ndarray, values: np.ndarray, points: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Keeps the minimum and maximum sample of each equal-width time bucket.
+
+    Every bucket contributes up to two samples, emitted in time order, so peaks and dips
+    survive the decimation.
+
+    Args:
+        ts (np.ndarray): Timestamps as epoch seconds, ascending.
+        values (np.ndarray): Values aligned with `ts`.
+        points (int): Upper bound on the number of points returned.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The selected timestamps and values.
+    """
+    n = len(ts)
+    if points >= n or points < 2:
+        return ts, values
+
+    starts = _time_buckets(ts, points // 2)
+    bucket_ids = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, n)))
+
+    # Sort by (bucket, value) once; the first and last entry of each bucket are its min and max
+    order = np.lexsort((values, bucket_ids))
+    ends = np.append(starts[1:], n) - 1
+    mins, maxs = order[starts], order[ends]
+
+    selected = np.unique(np.concatenate((mins, maxs)))
+    return ts[selected], values[selected]
+
+
+def avg_buckets(ts: np.ndarray, values: np.ndarray, points: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Averages timestamps and values over equal-width time buckets.
+
+    Args:
+        ts (np.ndarray): Timestamps as epoch seconds, ascending.
+        values (np.ndarray): Values aligned with `ts`.
+        points (int): Upper bound on the number of points returned.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: One (mean timestamp, mean value) pair per non-empty bucket.
+    """
+    n = len(ts)
+    if points >= n or points < 1:
+        return ts, values
+
+    starts = _time_buckets(ts, points)
+    counts = np.diff(np.append(starts, n))
+    return np.add.reduceat(ts, starts) / counts, np.add.reduceat(values, starts) / counts
+
+
+def resample_locf(ts: np.ndarray, values: np.ndarray, step: float, end: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Reconstructs a regular series from dead-band filtered samples.
+
+    Ingest only stores a reading when it moves past the dead-band or the heartbeat is due, so
+    the value at any instant is the last stored observation before it. This rebuilds a grid
+    with one point every `step` seconds from the first sample to `end`, carrying each
+    observation forward.
+
+    Args:
+        ts (np.ndarray): Timestamps as epoch seconds, ascending.
+        values (np.ndarray): Values aligned with `ts`.
+        step (float): Grid spacing in seconds.
+        end (float): Last grid instant as epoch seconds.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The grid timestamps and the carried-forward values.
+    """
+    if len(ts) == 0 or step <= 0:
+        return ts, values
+
+    grid = np.arange(ts[0], max(end, ts[-1]) + step / 2, step)
+    last_observation = np.searchsorted(ts, grid, side="right") - 1
+    return grid, values[last_observation]
+
+
+def downsample(rows: Sequence[Tuple[datetime, object]], points: Optional[int], mode: str = "lttb",
+               step: Optional[float] = None, end: Optional[datetime] = None) -> List[Tuple[str, float]]:
+    """
+    Decimates fetched history rows to at most `points` samples.
+
+    Args:
+        rows (Sequence[Tuple[datetime, object]]): (timestamp, data) rows ordered by timestamp.
+        points (Optional[int]): Maximum number of points in the result, or None to skip decimation.
+        mode (str): One of 'lttb', 'minmax' or 'avg'.
+        step (Optional[float]): If given, first rebuild a regular grid with this spacing in seconds
+            using last-observation-carried-forward.
+        end (Optional[datetime]): End of the LOCF grid, defaults to now (UTC).
+
+    Returns:
+        List[Tuple[str, float]]: The decimated series in the API's (timestamp, data) format.
+
+    Raises:
+        ValueError: If `mode` is not a supported downsampling mode.
+    """
+    if mode not in DOWNSAMPLING_MODES:
+        raise ValueError(f"Unknown downsampling mode: {mode}")
+
+    ts, values = to_arrays(rows)
+    if len(ts) == 0:
+        return []
+
+    if step is not None:
+        end_ts = ((end or datetime.utcnow()) - datetime(1970, 1, 1)).total_seconds()
+        ts, values = resample_locf(ts, values, step, end_ts)
+
+    if points is not None:
+        if mode == "lttb":
+            ts, values = lttb(ts, values, points)
+        elif mode == "minmax":
+            ts, values = minmax_buckets(ts, values, points)
+        else:
+            ts, values = avg_buckets(ts, values, points)
+
+    return to_records(ts, values)
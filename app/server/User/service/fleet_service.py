@@ -0,0 +1,36 @@
+from typing import Dict, List, Optional
+
+from app.server.User.repositories.user_repository import UserRepository
+from app.paho_mqtt.publisher import get_command_publisher
+
+
+class FleetService:
+    """
+    Operations that span many users/devices at once.
+    """
+
+    def __init__(self, DB_session):
+        self.__repository = UserRepository(db_session=DB_session)
+
+    def set_led_mode(self, mode: int, user_ids: Optional[List[int]] = None) -> Dict[str, object]:
+        """
+        Sends the same LED mode command to many bottle docks.
+
+        Sensor IDs are resolved in one query and all commands are queued on the shared
+        publisher in one call.
+
+        Args:
+            mode (int): The LED animation mode (see `LED_MODES`).
+            user_ids (Optional[List[int]]): The users whose docks are commanded, or None for all users.
+
+        Returns:
+            Dict[str, object]: The number of devices commanded and the user IDs that were not found.
+
+        Raises:
+            ValueError: If `mode` is not a known LED mode.
+        """
+        sensor_ids = self.__repository.get_sensor_ids(user_ids)
+        get_command_publisher().send_led_modes({sensor_id: mode for sensor_id in sensor_ids.values()})
+
+        missing = sorted(set(user_ids) - set(sensor_ids)) if user_ids is not None else []
+        return {"devices": len(sensor_ids), "missing_user_ids": missing}
@@ -0,0 +1,103 @@
+from datetime import datetime, time as dt_time, timedelta
+from typing import Any, Dict, Optional
+
+from app.paho_mqtt.daily_totals import daily_totals
+from app.paho_mqtt.intake_rates import intake_rates
+from app.server.Recommendation.config import RECOMMENDATION_DEFAULT_WAKEUP_MINUTES, RECOMMENDATION_DEFAULT_SLEEP_MINUTES
+from app.server.Recommendation.repositories.recommendation_repository import RecommendationRepository
+from app.server.Recommendation.service.goal_recommender import goal_recommender
+from app.server.Reminder.service.reminder_scheduler import ReminderProfile, expected_intake, wake_window
+from app.server.User.config import FORECAST_RATE_WEIGHT, FORECAST_MIN_AVERAGE_HOURS
+from app.server.User.repositories.user_repository import UserRepository
+from app.server.User.service.day_window import day_windows, utc_to_local
+
+
+class ForecastService:
+    """
+    Projects whether a user reaches their daily goal before their sleep time.
+
+    In the process that ingests, today's total (`daily_totals`) and the recent intake rate
+    (`intake_rates`) are maintained per reading, so a forecast costs the one profile query.
+    Elsewhere today's total is summed by the database and only today's average rate is used.
+    """
+
+    def __init__(self, DB_session, user_id, read_session=None):
+        self.__repository = UserRepository(db_session=DB_session, read_session=read_session)
+        self.__recommendations = RecommendationRepository(DB_session)
+        self.user_ID = user_id
+
+    def get_forecast(self, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        Returns today's total, the projected total at sleep time and when the goal will be reached.
+
+        The projection rate blends the recent exponentially weighted rate with today's average
+        since waking up (`FORECAST_RATE_WEIGHT`). Users without a daily goal of their own are
+        forecast against their recommended goal.
+
+        Raises:
+            ValueError: If the user does not exist.
+        """
+        now = now or datetime.utcnow()
+        sensor_id, daily_goal, wakeup_time, sleep_time, timezone = self.__repository.get_forecast_profile(self.user_ID)
+
+        goal_source = "user"
+        if not daily_goal:
+            recommendation = goal_recommender.get(self.user_ID, self.__recommendations.get_goal_inputs)
+            daily_goal, goal_source = recommendation.daily_goal, "recommended"
+
+        profile = ReminderProfile(self.user_ID, sensor_id, daily_goal,
+                                  wakeup_time or _clock(RECOMMENDATION_DEFAULT_WAKEUP_MINUTES),
+                                  sleep_time or _clock(RECOMMENDATION_DEFAULT_SLEEP_MINUTES), timezone)
+        start, end = wake_window(profile, now)
+
+        if intake_rates.active:
+            source = "live"
+            total = daily_totals.get(sensor_id, now)
+            recent_rate = intake_rates.get(sensor_id, now)
+        else:
+            source = "database"
+            day_start, day_end = day_windows.get_today(self.user_ID, lambda: timezone, now)
+            total = self.__repository.get_total_between(sensor_id, day_start, day_end)
+            recent_rate = None
+
+        awake_hours = max((now - start).total_seconds(), 0.0) / 3600
+        average_rate = total / awake_hours if awake_hours >= FORECAST_MIN_AVERAGE_HOURS else None
+        if recent_rate is not None and average_rate is not None:
+            rate = FORECAST_RATE_WEIGHT * recent_rate + (1 - FORECAST_RATE_WEIGHT) * average_rate
+        else:
+            rate = recent_rate if recent_rate is not None else average_rate or 0.0
+
+        projection_start = max(now, start)
+        hours_left = (end - projection_start).total_seconds() / 3600
+        remaining = max(daily_goal - total, 0.0)
+        reached_at = None
+        if remaining == 0:
+            on_track = True
+        elif rate > 0:
+            reached_at = projection_start + timedelta(hours=remaining / rate)
+            on_track = reached_at <= end
+        else:
+            on_track = False
+
+        return {
+            "daily_goal": daily_goal,
+            "goal_source": goal_source,
+            "total_today": round(total, 2),
+            "expected_by_now": round(expected_intake(profile, now), 2),
+            "rate_per_hour": round(rate, 2),
+            "recent_rate_per_hour": round(recent_rate, 2) if recent_rate is not None else None,
+            "projected_total": round(total + rate * hours_left, 2),
+            "goal_reached": remaining == 0,
+            "on_track": on_track,
+            "eta": _local_clock(reached_at, timezone) if on_track and reached_at is not None else None,
+            "sleep_time": _local_clock(end, timezone),
+            "source": source,
+        }
+
+
+def _clock(minutes: int) -> dt_time:
+    return dt_time(minutes // 60, minutes % 60)
+
+
+def _local_clock(instant: datetime, timezone: Optional[str]) -> str:
+    return utc_to_local(instant, timezone).strftime("%H:%M")
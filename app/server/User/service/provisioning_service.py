@@ -0,0 +1,182 @@
+import csv
+import io
+import json
+from datetime import time
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from loguru import logger
+from pydantic import BaseModel, ValidationError, constr, validator
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.server.User.config import PROVISIONING_CHUNK_SIZE
+from app.server.User.repositories.provisioning_repository import PROVISIONED_COLUMNS, ProvisioningRepository
+from app.server.User.service.cache_invalidation import on_users_changed
+from app.server.User.service.day_window import get_zone
+
+PROVISIONING_FORMATS = ("csv", "ndjson")
+
+
+class ProvisionedUser(BaseModel):
+    """
+    One row of a provisioning file. Empty fields are treated as missing, and missing optional
+    fields keep an existing user's value.
+    """
+    sensor_id: constr(strip_whitespace=True, min_length=1, max_length=50)
+    name: constr(strip_whitespace=True, min_length=1, max_length=50)
+    daily_goal: Optional[int] = None
+    wakeup_time: Optional[time] = None
+    sleep_time: Optional[time] = None
+    bottle_weight: Optional[int] = None
+    age: Optional[int] = None
+    weight: Optional[float] = None
+    height: Optional[float] = None
+    gender: Optional[constr(max_length=10)] = None
+    timezone: Optional[constr(max_length=64)] = None
+
+    class Config:
+        extra = "forbid"
+
+    @validator("*", pre=True)
+    def empty_as_missing(cls, value):
+        if isinstance(value, str) and not value.strip():
+            return None
+        return value
+
+    @validator("timezone")
+    def known_timezone(cls, value):
+        if value is not None:
+            get_zone(value)
+        return value
+
+
+class ProvisioningService:
+    """
+    Registers or updates many users/docks from a CSV or NDJSON file.
+
+    Rows are validated and upserted in chunks of `PROVISIONING_CHUNK_SIZE`, each committed on
+    its own, so an invalid row or a failing chunk is reported without aborting the rest of the load.
+    """
+
+    def __init__(self, DB_session):
+        self.__session = DB_session
+        self.__repository = ProvisioningRepository(DB_session)
+
+    def provision(self, stream: BinaryIO, file_format: str = "csv") -> Dict[str, Any]:
+        """
+        Loads a provisioning file.
+
+        A CSV file needs a header row naming its columns; an NDJSON file has one JSON object per
+        line. `sensor_id` and `name` are required, the other columns of `ProvisionedUser` are optional.
+
+        Args:
+            stream (BinaryIO): The UTF-8 encoded file, read once from start to end.
+            file_format (str): "csv" or "ndjson".
+
+        Returns:
+            Dict[str, Any]: The number of users inserted, updated and rows that failed, and an
+            error (`line`, `sensor_id`, `error`) for every failed row.
+
+        Raises:
+            ValueError: If `file_format` is not supported.
+        """
+        if file_format not in PROVISIONING_FORMATS:
+            raise ValueError(f"Unsupported format '{file_format}', expected one of {', '.join(PROVISIONING_FORMATS)}")
+
+        text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+        records = _read_csv(text) if file_format == "csv" else _read_ndjson(text)
+
+        report = {"inserted": 0, "updated": 0, "failed": 0, "errors": []}
+        seen = set()
+        chunk: List[Tuple[int, Dict[str, Any]]] = []
+        try:
+            for line, record in records:
+                row = self.__validate(line, record, seen, report)
+                if row is not None:
+                    chunk.append((line, row))
+                if len(chunk) >= PROVISIONING_CHUNK_SIZE:
+                    self.__load(chunk, report)
+                    chunk = []
+        except UnicodeDecodeError as e:
+            # The rest of the file cannot be read; what was loaded so far stays
+            report["errors"].append({"line": None, "sensor_id": None, "error": f"File is not valid UTF-8: {e}"})
+        finally:
+            # Leave the caller's stream open
+            text.detach()
+        self.__load(chunk, report)
+
+        if report["inserted"] or report["updated"]:
+            # Other processes are notified by the users trigger; this one resets its caches directly
+            on_users_changed(None)
+        logger.info(f"Provisioned users: {report['inserted']} inserted, {report['updated']} updated, {report['failed']} failed")
+        return report
+
+    def __validate(self, line: int, record: Any, seen: set, report: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        sensor_id = record.get("sensor_id") if isinstance(record, dict) else None
+        try:
+            if not isinstance(record, dict):
+                raise ValueError(record if isinstance(record, str) else "Expected a JSON object")
+            user = ProvisionedUser(**record)
+        except (ValidationError, ValueError) as e:
+            self.__fail(report, line, sensor_id, _describe(e))
+            return None
+
+        if user.sensor_id in seen:
+            self.__fail(report, line, user.sensor_id, "Duplicate sensor_id in this file")
+            return None
+        seen.add(user.sensor_id)
+        return {column: getattr(user, column) for column in PROVISIONED_COLUMNS}
+
+    def __load(self, chunk: List[Tuple[int, Dict[str, Any]]], report: Dict[str, Any]) -> None:
+        if not chunk:
+            return
+        try:
+            self.__upsert([row for _, row in chunk], report)
+            return
+        except SQLAlchemyError as e:
+            self.__session.rollback()
+            logger.warning(f"Provisioning chunk of {len(chunk)} rows failed, retrying row by row: {e}")
+
+        # Isolate the offending rows so the rest of the chunk still loads
+        for line, row in chunk:
+            try:
+                self.__upsert([row], report)
+            except SQLAlchemyError as e:
+                self.__session.rollback()
+                self.__fail(report, line, row["sensor_id"], str(getattr(e, "orig", e)).strip())
+
+    def __upsert(self, rows: List[Dict[str, Any]], report: Dict[str, Any]) -> None:
+        inserted, updated = self.__repository.upsert_users(rows)
+        self.__session.commit()
+        report["inserted"] += inserted
+        report["updated"] += updated
+
+    @staticmethod
+    def __fail(report: Dict[str, Any], line: int, sensor_id: Optional[str], error: str) -> None:
+        report["failed"] += 1
+        report["errors"].append({"line": line, "sensor_id": sensor_id, "error": error})
+
+
+def _read_csv(text: io.TextIOBase) -> Iterator[Tuple[int, Any]]:
+    reader = csv.DictReader(text)
+    for record in reader:
+        if None in record:
+            # More fields than the header names
+            yield reader.line_num, "Row has more fields than the header"
+            continue
+        yield reader.line_num, record
+
+
+def _read_ndjson(text: io.TextIOBase) -> Iterator[Tuple[int, Any]]:
+    for line, raw in enumerate(text, start=1):
+        if not raw.strip():
+            continue
+        try:
+            yield line, json.loads(raw)
+        except json.JSONDecodeError as e:
+            yield line, f"Invalid JSON: {e.msg}"
+
+
+def _describe(error: Exception) -> str:
+    if isinstance(error, ValidationError):
+        return "; ".join(f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}" for item in error.errors())
+    return str(error)
@@ -1,13 +1,38 @@
 from sqlalchemy import false
+from datetime import datetime, timedelta
 from app.server.User.repositories.user_repository import UserRepository
+from app.server.User.service.downsampling import downsample, to_records
+from app.server.User.service.day_window import day_windows, get_zone
+from app.paho_mqtt.publisher import get_command_publisher
+from app.paho_mqtt.daily_totals import daily_totals
+from app.paho_mqtt.intake_rates import intake_rates
+from app.paho_mqtt.recent_readings import recent_readings
+from app.paho_mqtt.calibration import calibrator
+from app.server.Reminder.service.reminder_scheduler import get_reminder_scheduler
+from app.server.Recommendation.service.goal_recommender import goal_recommender
 from app.database.models import Users
 from typing import List, Tuple, Dict, Union, Optional
 
+# Marks a device ID that has not been looked up yet (None means the user has no device)
+_UNRESOLVED = object()
+
 class UserService:
-    def __init__(self,DB_session,user_id):
-        self.__repository = UserRepository(db_session=DB_session)
+    def __init__(self,DB_session,user_id,read_session=None):
+        self.__repository = UserRepository(db_session=DB_session, read_session=read_session)
         self.user_ID = user_id
-        self.iot_device_ID = self.__repository.get_iot_device_id(user_id) 
+        self.__iot_device_ID = _UNRESOLVED
+
+    @property
+    def iot_device_ID(self) -> Optional[str]:
+        """
+        The user's sensor_id, looked up on first use so profile-only requests cost a single query.
+
+        Raises:
+            ValueError: If the user does not exist.
+        """
+        if self.__iot_device_ID is _UNRESOLVED:
+            self.__iot_device_ID = self.__repository.get_iot_device_id(self.user_ID)
+        return self.__iot_device_ID
 
     def get_user_info(self):
         """
@@ -19,26 +44,71 @@ class UserService:
         except Exception as e:
             raise ValueError(f"Error fetching user info: {e}")
 
-    def get_today_water_intake(self):
+    def get_today_water_intake(self, points: Optional[int] = None, mode: str = "lttb", step: Optional[float] = None):
         """
         Get today's water intake from the repository
+
+        Args:
+            points (Optional[int]): If given, decimate the series to at most this many points.
+            mode (str): Downsampling mode used when `points` is given ('lttb', 'minmax' or 'avg').
+            step (Optional[float]): If given, reconstruct a regular series with this spacing in seconds (LOCF).
         """
         try:
-            result = self.__repository.get_today_water_intake(self.iot_device_ID)
-            return result
+            day_start, day_end = self.__today_bounds()
+            if points is not None or step is not None:
+                return self.__get_downsampled_series(day_start, day_end, points, mode, step)
+            return self.__get_readings(day_start, day_end)
         except Exception as e:
             raise ValueError(f"Error fetching today's water intake: {e}")
 
-    def get_week_water_intake(self):
+    def get_week_water_intake(self, points: Optional[int] = None, mode: str = "lttb", step: Optional[float] = None):
         """
         Get this week's water intake from the repository
+
+        Args:
+            points (Optional[int]): If given, decimate the series to at most this many points.
+            mode (str): Downsampling mode used when `points` is given ('lttb', 'minmax' or 'avg').
+            step (Optional[float]): If given, reconstruct a regular series with this spacing in seconds (LOCF).
         """
         try:
-            result = self.__repository.get_week_water_intake(self.iot_device_ID)
+            week_start, day_end = day_windows.get_week(self.user_ID, self.__load_timezone)
+            if points is not None or step is not None:
+                return self.__get_downsampled_series(week_start, day_end, points, mode, step)
+            result = self.__repository.get_week_water_intake(self.iot_device_ID, week_start, day_end)
             return result
         except Exception as e:
             raise ValueError(f"Error fetching weekly water intake: {e}")
 
+    def __get_downsampled_series(self, since: datetime, until: datetime, points: Optional[int], mode: str, step: Optional[float]) -> List[Tuple[str, float]]:
+        """
+        Fetches the device's readings in [since, until), optionally fills the dead-band gaps (LOCF)
+        and decimates them server-side.
+        """
+        rows = self.__repository.get_sensor_series(self.iot_device_ID, since, until)
+        return downsample(rows, points, mode, step=step, end=min(until, datetime.utcnow()))
+
+    def __get_readings(self, since: datetime, until: datetime) -> List[Tuple[str, float]]:
+        """
+        Returns the device's readings in [since, until), from the in-memory ring buffer when it
+        covers the whole window and from the database otherwise.
+        """
+        window = recent_readings.get_window(self.iot_device_ID, since, until)
+        if window is not None:
+            return to_records(*window)
+        return self.__repository.get_today_water_intake(self.iot_device_ID, since, until)
+
+    def __load_timezone(self) -> Optional[str]:
+        # The day window is loaded on a cache miss; resolve the device in the same query
+        sensor_id, timezone = self.__repository.get_sensor_id_and_timezone(self.user_ID)
+        self.__iot_device_ID = sensor_id
+        return timezone
+
+    def __today_bounds(self) -> Tuple[datetime, datetime]:
+        """
+        Returns the user's current local day as naive UTC [start, end) bounds (cached until local midnight).
+        """
+        return day_windows.get_today(self.user_ID, self.__load_timezone)
+
     def get_sensor_data(self):
         """
         Get all sensor data associated with the IoT device
@@ -52,14 +122,15 @@ class UserService:
     def get_todays_total_water_intake(self):
         """
         Get today's total water intake
-        """
-        total_water_consumed_today = 0.0
 
+        Counts every accepted reading, including the ones the ingest dead-band did not store: from
+        the running total in the process that ingests, and from one aggregate query elsewhere.
+        """
         try:
-            result = self.__repository.get_today_water_intake(self.iot_device_ID)
-            for entry in result:
-                total_water_consumed_today += entry[1]
-            return round(total_water_consumed_today,2)
+            day_start, day_end = self.__today_bounds()
+            if intake_rates.active:
+                return round(daily_totals.get(self.iot_device_ID), 2)
+            return round(self.__repository.get_total_between(self.iot_device_ID, day_start, day_end), 2)
         except Exception as e:
             raise ValueError(f"Error fetching today's water intake: {e}")
 
@@ -74,9 +145,9 @@ class UserService:
             str: Success message or error message.
         """
         result = self.__repository.update_user_info(user_ID=self.user_ID, key='daily_goal', value=new_daily_goal)
-        
         if "success" in result:
-            return result["success"] 
+            self.__refresh_reminders()
+            return result["success"]
         else:
             return result["error"]  
 
@@ -121,8 +192,9 @@ class UserService:
             str: Success message or error message.
         """
         result = self.__repository.update_user_info(user_ID=self.user_ID, key='wakeup_time', value=new_wakeup_time)
-        
         if "success" in result:
+            goal_recommender.invalidate(self.user_ID)
+            self.__refresh_reminders()
             return result["success"]
         else:
             return result["error"]
@@ -153,8 +225,48 @@ class UserService:
             str: Success message or error message.
         """
         result = self.__repository.update_user_info(user_ID=self.user_ID, key='sleep_time', value=new_sleep_time)
+        if "success" in result:
+            goal_recommender.invalidate(self.user_ID)
+            self.__refresh_reminders()
+            return result["success"]
+        else:
+            return result["error"]
+
+    def get_timezone(self) -> Optional[str]:
+        """
+        Retrieves the user's IANA timezone name.
+
+        Returns:
+            Optional[str]: The user's timezone, or None if not set (days then follow UTC).
+        """
+        result = self.__repository.get_user_info(user_ID=self.user_ID)
+        
+        if "error" in result:
+            print(result["error"])
+            return None
         
+        return result.get("timezone")
+
+    def set_timezone(self, new_timezone: str):
+        """
+        Updates the user's timezone, which defines where their days start and end.
+
+        Args:
+            new_timezone (str): An IANA timezone name, e.g. 'Europe/Berlin'.
+
+        Returns:
+            str: Success message or error message.
+        """
+        try:
+            get_zone(new_timezone)
+        except ValueError as e:
+            return f"error: {e}"
+
+        result = self.__repository.update_user_info(user_ID=self.user_ID, key='timezone', value=new_timezone)
         if "success" in result:
+            day_windows.invalidate(self.user_ID)
+            daily_totals.set_timezone(self.iot_device_ID, new_timezone)
+            self.__refresh_reminders()
             return result["success"]
         else:
             return result["error"]
@@ -188,6 +300,8 @@ class UserService:
         result = self.__repository.update_user_info(user_ID=self.user_ID, key='weight', value=new_weight)
         
         if "success" in result:
+            goal_recommender.invalidate(self.user_ID)
+            self.__refresh_reminders()
             return result["success"]
         else:
             return result["error"]
@@ -208,6 +322,8 @@ class UserService:
         """
         result = self.__repository.update_user_info(user_ID=self.user_ID, key='bottle_weight', value=new_bottle_weight)
         if "success" in result:
+            # Resets the learned empty-bottle baseline to the new value
+            calibrator.set_bottle_weight(self.iot_device_ID, new_bottle_weight)
             return result["success"]
         else:
             return result["error"]
@@ -228,8 +344,13 @@ class UserService:
         """
         Updates the user's sensor ID.
         """
+        old_sensor_id = self.iot_device_ID
         result = self.__repository.update_user_info(user_ID=self.user_ID, key='sensor_id', value=new_sensor_id)
         if "success" in result:
+            self.__iot_device_ID = new_sensor_id
+            calibrator.forget(old_sensor_id)
+            calibrator.forget(new_sensor_id)
+            self.__refresh_reminders()
             return result["success"]
         else:
             return result["error"]
@@ -285,6 +406,11 @@ class UserService:
             float: The most recent water level in the bottle, or None if there is an error or no data is found.
         """
         try:
+            # Served from memory when this process ingests the device's readings
+            latest = recent_readings.get_latest(self.iot_device_ID)
+            if latest is not None:
+                return latest
+
             # Get the most recent water level reading from the sensor data
             sensor_data = self.__repository.get_latest_sensor_data(self.iot_device_ID)
 
@@ -316,3 +442,30 @@ class UserService:
             return False
         
         return result.get("is_bottle_on_dock")
+
+    def set_led_mode(self, mode: int) -> str:
+        """
+        Sends an LED mode command to the user's bottle dock.
+
+        The command is queued on the shared MQTT publisher and sent asynchronously.
+
+        Args:
+            mode (int): The LED animation mode (see `LED_MODES`).
+
+        Returns:
+            str: A message confirming the command was queued.
+
+        Raises:
+            ValueError: If `mode` is not a known LED mode.
+        """
+        get_command_publisher().send_led_mode(self.iot_device_ID, mode)
+        return f"LED mode {mode} queued for device {self.iot_device_ID}"
+
+    def __refresh_reminders(self):
+        """
+        Lets the reminder scheduler (if running in this process) pick up a changed goal, schedule or device.
+        Schedulers in other processes are refreshed through `users_changed` notifications.
+        """
+        scheduler = get_reminder_scheduler()
+        if scheduler is not None:
+            scheduler.refresh(self.user_ID)
@@ -58,11 +58,30 @@ float add_reading(float new_reading);
  * */
 int animation_mode = 1;
 
+/**
+ * Every published message carries a "<boot_id>-<counter>" sequence number so the server
+ * can drop QoS 1 redeliveries. boot_id is random per boot, so the counter restarting at
+ * zero after a reset never collides with sequence numbers from the previous boot.
+ * */
+uint32_t boot_id;
+uint32_t message_seq = 0;
+portMUX_TYPE seqMux = portMUX_INITIALIZER_UNLOCKED;
+
+String next_seq()
+{
+  portENTER_CRITICAL(&seqMux);
+  uint32_t seq = ++message_seq;
+  portEXIT_CRITICAL(&seqMux);
+  return String(boot_id, HEX) + String("-") + String(seq);
+}
+
 void setup()
 {
   /** Start serial communication **/
   Serial.begin(115200);
 
+  boot_id = esp_random();
+
   /************************88** Setup RBG WS128B light *****************************/
   FastLED.addLeds<WS2812B, LED_PIN, GRB>(leds, NUM_LEDS);
   FastLED.setBrightness(BRIGHTNESS);
@@ -241,7 +260,7 @@ void weightTask(void *pvParameters)
           // TODO: make api call to server so it knows that bottle has been pikced
           Serial.println("bottle has been picked");
 
-          String payload = DEVICE_ID + String("|") + String("is_picked_up") + String("|") + String("1");
+          String payload = DEVICE_ID + String("|") + String("is_picked_up") + String("|") + String("1") + String("|") + next_seq();
 
           // Publish the data to the MQTT topic
           mqttClient.publish(TOPIC_WEIGHT_CHANGE, 1, false, payload.c_str());
@@ -262,7 +281,7 @@ void weightTask(void *pvParameters)
           // TODO: make api call to server so it knows that bottle has been placed back
           Serial.println("bottle has been placed back");
 
-          String payload = DEVICE_ID + String("|") + String("is_picked_up") + String("|") + String("0");
+          String payload = DEVICE_ID + String("|") + String("is_picked_up") + String("|") + String("0") + String("|") + next_seq();
 
           // Publish the data to the MQTT topic
           mqttClient.publish(TOPIC_WEIGHT_CHANGE, 1, false, payload.c_str());
@@ -416,9 +435,9 @@ void mqttTask(void *pvParameters)
 
       /*
         inclue device id along with current bottle weight
-        "esp32-n2vf7inz|weight|30.34"
+        "esp32-n2vf7inz|weight|30.34|5f3a91c2-17"
       */
-      String payload = DEVICE_ID + String("|") + String("weight") + String("|") + String(weightData);
+      String payload = DEVICE_ID + String("|") + String("weight") + String("|") + String(weightData) + String("|") + next_seq();
 
       // Publish the data to the MQTT topic
       mqttClient.publish(TOPIC_WEIGHT_CHANGE, 1, false, payload.c_str());